@@ -0,0 +1,36 @@
+"""
+Lets the benchmarks, scripts and tests import the app's modules.
+
+The app's package lives in `rio-admin`. Its directory name contains a dash, so
+it can't be imported by name. Scripts elsewhere in the project put this
+directory on `sys.path` and use `import_app_module` instead.
+"""
+
+from __future__ import annotations
+
+import importlib
+import sys
+import types
+from pathlib import Path
+
+# The app's package
+APP_DIRECTORY = Path(__file__).resolve().parent / "rio-admin"
+
+# Name the app's package is imported as
+APP_PACKAGE = "rio_admin"
+
+
+def import_app_module(name: str) -> types.ModuleType:
+    """
+    Import a module of the app, e.g. `import_app_module("persistence")`.
+
+    The package's `__init__` is deliberately not run, since it creates the Rio
+    app, which isn't needed here. Only the requested module and its
+    dependencies are loaded.
+    """
+    if APP_PACKAGE not in sys.modules:
+        package = types.ModuleType(APP_PACKAGE)
+        package.__path__ = [str(APP_DIRECTORY)]
+        sys.modules[APP_PACKAGE] = package
+
+    return importlib.import_module(f"{APP_PACKAGE}.{name}")
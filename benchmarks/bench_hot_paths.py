@@ -0,0 +1,284 @@
+"""
+Benchmarks the app's hot paths: database lookups and writes, password hashing
+and GeoIP lookups.
+
+A temporary database is seeded with users and sessions, and a synthetic GeoIP
+database is generated, so the benchmark runs entirely offline. Each operation
+is run at several concurrency levels. The results are written as JSON and
+compared against a stored baseline, and the script exits with status 1 if any
+operation has become slower than the baseline allows.
+
+Usage:
+
+    python benchmarks/bench_hot_paths.py [--output results.json]
+    python benchmarks/bench_hot_paths.py --save-baseline
+
+Baselines only make sense on the machine they were recorded on. After
+changing hardware, record a new one using `--save-baseline`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import typing as t
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import mmdb_fixture
+from common import (
+    SEED_PASSWORD,
+    LatencySummary,
+    import_app_module,
+    run_concurrently,
+    seed_database,
+)
+
+# Where the baseline is stored by default
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the app's hot paths, offline.",
+    )
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument(
+        "--operations",
+        type=int,
+        default=2000,
+        help="Number of calls per operation and concurrency level",
+    )
+    parser.add_argument(
+        "--hash-operations",
+        type=int,
+        default=64,
+        help="Number of password hashes per concurrency level",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(level) for level in value.split(",")],
+        default=[1, 8, 32],
+        help="Comma separated concurrency levels",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=0,
+        help="Size of the persistence caches. Defaults to 0, so every lookup hits the database.",
+    )
+    parser.add_argument("--write-behind", action="store_true")
+    parser.add_argument("--geoip-networks", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Where to write the results")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="How much slower than the baseline an operation may be, e.g. 0.25 for 25%%",
+    )
+    return parser.parse_args()
+
+
+async def run_benchmarks(
+    args: argparse.Namespace,
+    directory: Path,
+) -> dict[str, dict[str, dict[str, t.Any]]]:
+    persistence = import_app_module("persistence")
+    data_models = import_app_module("data_models")
+    geoip = import_app_module("utils.geoip2_with_flag")
+    hashing_service = import_app_module("utils.hashing_service")
+
+    rng = random.Random(args.seed)
+    results: dict[str, dict[str, dict[str, t.Any]]] = {}
+
+    pers = persistence.Persistence(
+        directory / "benchmark.db",
+        cache_size=args.cache_size,
+        write_behind=args.write_behind,
+    )
+
+    geoip_path = directory / "GeoLite2-City.mmdb"
+    networks = mmdb_fixture.write_city_fixture(str(geoip_path), args.geoip_networks)
+    geoip_service = geoip.GeoIPService(str(geoip_path))
+
+    try:
+        print(f"Seeding {args.users} users and {args.sessions} sessions...")
+        seeded = await seed_database(pers, args.users, args.sessions)
+        valid_until = datetime.now(tz=timezone.utc) + timedelta(days=1)
+
+        async def get_user_by_username(_: int) -> None:
+            await pers.get_user_by_username(rng.choice(seeded.usernames))
+
+        async def get_session_by_auth_token(_: int) -> None:
+            await pers.get_session_by_auth_token(rng.choice(seeded.session_ids))
+
+        async def create_session(_: int) -> None:
+            await pers.create_session(rng.choice(seeded.user_ids))
+
+        async def update_session_duration(_: int) -> None:
+            session = data_models.UserSession(
+                id=rng.choice(seeded.session_ids),
+                user_id=rng.choice(seeded.user_ids),
+                created_at=valid_until - timedelta(days=1),
+                valid_until=valid_until,
+            )
+            await pers.update_session_duration(
+                session,
+                new_valid_until=valid_until + timedelta(seconds=rng.random()),
+            )
+
+        async def get_password_hash(_: int) -> None:
+            await data_models.AppUser.get_password_hash_async(
+                SEED_PASSWORD,
+                rng.randbytes(64),
+            )
+
+        def random_address() -> str:
+            network = rng.choice(networks)
+            return str(network.network_address + rng.randrange(256))
+
+        async def geoip_lookup(_: int) -> None:
+            await asyncio.to_thread(geoip_service.lookup, random_address())
+
+        operations: list[tuple[str, t.Callable[[int], t.Awaitable[None]], int]] = [
+            ("get_user_by_username", get_user_by_username, args.operations),
+            ("get_session_by_auth_token", get_session_by_auth_token, args.operations),
+            ("create_session", create_session, args.operations),
+            ("update_session_duration", update_session_duration, args.operations),
+            ("get_password_hash", get_password_hash, args.hash_operations),
+            ("geoip_lookup", geoip_lookup, args.operations),
+        ]
+
+        for name, operation, total in operations:
+            results[name] = {}
+
+            for concurrency in args.concurrency:
+                summary = await run_concurrently(operation, total, concurrency)
+                results[name][str(concurrency)] = summary.as_dict()
+
+                print(
+                    f"{name:<28} c={concurrency:<4} "
+                    f"{summary.ops_per_second:>10.1f} ops/s  "
+                    f"p50 {summary.p50_ms:>9.3f} ms  "
+                    f"p99 {summary.p99_ms:>9.3f} ms"
+                    + (f"  ({summary.errors} errors)" if summary.errors else "")
+                )
+
+    finally:
+        await pers.close()
+        geoip_service.close()
+        hashing_service.get_hashing_service().close()
+
+    return results
+
+
+def compare(
+    results: dict[str, dict[str, dict[str, t.Any]]],
+    baseline: dict[str, dict[str, dict[str, t.Any]]],
+    tolerance: float,
+) -> list[str]:
+    """
+    Return a description of each operation which is slower than the baseline
+    allows. Operations which aren't in the baseline are skipped.
+    """
+    regressions = []
+
+    for name, levels in results.items():
+        for concurrency, current in levels.items():
+            try:
+                previous = baseline[name][concurrency]
+            except KeyError:
+                continue
+
+            current_summary = LatencySummary(**current)
+            previous_summary = LatencySummary(**previous)
+
+            if current_summary.p50_ms > previous_summary.p50_ms * (1 + tolerance):
+                regressions.append(
+                    f"{name} (c={concurrency}): p50 {current_summary.p50_ms:.3f} ms, "
+                    f"baseline {previous_summary.p50_ms:.3f} ms"
+                )
+
+            if current_summary.ops_per_second < previous_summary.ops_per_second / (1 + tolerance):
+                regressions.append(
+                    f"{name} (c={concurrency}): {current_summary.ops_per_second:.1f} ops/s, "
+                    f"baseline {previous_summary.ops_per_second:.1f} ops/s"
+                )
+
+    return regressions
+
+
+def main() -> int:
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = asyncio.run(run_benchmarks(args, Path(directory)))
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+        },
+        "parameters": {
+            "users": args.users,
+            "sessions": args.sessions,
+            "operations": args.operations,
+            "hash_operations": args.hash_operations,
+            "concurrency": args.concurrency,
+            "cache_size": args.cache_size,
+            "write_behind": args.write_behind,
+            "geoip_networks": args.geoip_networks,
+        },
+        "results": results,
+    }
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Wrote results to {args.output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Saved the results as baseline to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, skipping comparison")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+
+    if baseline.get("parameters") != report["parameters"]:
+        print("Warning: The baseline was recorded with different parameters")
+
+    regressions = compare(results, baseline["results"], args.tolerance)
+
+    if not regressions:
+        print("No regressions compared to the baseline")
+        return 0
+
+    print("Regressions compared to the baseline:")
+
+    for regression in regressions:
+        print(f"  {regression}")
+
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import secrets
+import sys
+import time
+import typing as t
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+# Make `app_modules` in the project's root directory importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_modules import APP_DIRECTORY, APP_PACKAGE, import_app_module  # noqa: E402
+
+# All seeded users share this password. Hashing a separate password for each
+# of them would make seeding take minutes.
+SEED_PASSWORD = "benchmark"
+
+
+@dataclass
+class SeededData:
+    """
+    What `seed_database` has put into the database.
+    """
+
+    user_ids: list[uuid.UUID]
+    usernames: list[str]
+    session_ids: list[str]
+
+
+async def seed_database(pers: t.Any, users: int, sessions: int) -> SeededData:
+    """
+    Fill the database with `users` users and `sessions` sessions, spread
+    evenly over the users. Rows are inserted in bulk, bypassing the
+    `Persistence` methods, so even large databases are seeded quickly. Only
+    works with the SQLite backend.
+    """
+    persistence = import_app_module("persistence")
+    data_models = import_app_module("data_models")
+    password_hashing = import_app_module("password_hashing")
+
+    salt = os.urandom(64)
+    password_scheme = password_hashing.get_current_scheme().encode()
+    password_hash = data_models.AppUser.get_password_hash(SEED_PASSWORD, salt)
+    now = time.time()
+
+    user_ids = [uuid.uuid4() for _ in range(users)]
+    usernames = [f"user{index:08d}" for index in range(users)]
+    session_ids = [secrets.token_urlsafe() for _ in range(sessions)]
+
+    user_rows = [
+        (str(user_id), username, now - index, password_hash, salt, password_scheme)
+        for index, (user_id, username) in enumerate(zip(user_ids, usernames))
+    ]
+    session_rows = [
+        (session_id, str(user_ids[index % users]), now, now + 24 * 60 * 60)
+        for index, session_id in enumerate(session_ids)
+    ]
+
+    def insert(conn) -> None:
+        conn.executemany(
+            f"INSERT INTO users ({persistence.USER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+            user_rows,
+        )
+        conn.executemany(
+            f"INSERT INTO user_sessions ({persistence.SESSION_COLUMNS}) VALUES (?, ?, ?, ?)",
+            session_rows,
+        )
+
+    await pers.backend.pool.write(insert)
+    return SeededData(user_ids, usernames, session_ids)
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """
+    Return the given percentile of an already sorted list, using the nearest
+    rank method.
+    """
+    if not sorted_values:
+        return 0.0
+
+    rank = max(int(round(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+@dataclass
+class LatencySummary:
+    """
+    Latency statistics of a benchmark run. Latencies are in milliseconds.
+    """
+
+    operations: int
+    errors: int
+    ops_per_second: float
+    mean_ms: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+
+    @classmethod
+    def from_latencies(
+        cls,
+        latencies: list[float],
+        errors: int,
+        elapsed: float,
+    ) -> LatencySummary:
+        latencies = sorted(latencies)
+
+        return cls(
+            operations=len(latencies),
+            errors=errors,
+            ops_per_second=round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            mean_ms=round(sum(latencies) / len(latencies) * 1000, 4) if latencies else 0.0,
+            p50_ms=round(percentile(latencies, 50) * 1000, 4),
+            p90_ms=round(percentile(latencies, 90) * 1000, 4),
+            p99_ms=round(percentile(latencies, 99) * 1000, 4),
+            max_ms=round(latencies[-1] * 1000, 4) if latencies else 0.0,
+        )
+
+    def as_dict(self) -> dict[str, t.Any]:
+        return asdict(self)
+
+
+async def run_concurrently(
+    operation: t.Callable[[int], t.Awaitable[t.Any]],
+    total: int,
+    concurrency: int,
+) -> LatencySummary:
+    """
+    Call `operation` `total` times, with up to `concurrency` calls running at
+    the same time. Each call is passed its sequence number.
+    """
+    latencies: list[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal errors, next_index
+
+        while next_index < total:
+            index = next_index
+            next_index += 1
+
+            start = time.perf_counter()
+
+            try:
+                await operation(index)
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return LatencySummary.from_latencies(latencies, errors, time.perf_counter() - start)
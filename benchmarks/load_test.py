@@ -0,0 +1,417 @@
+"""
+Simulates many concurrent clients using the app, to find out how many users a
+single process can sustain.
+
+The real Rio app (the `app` object in `rio-admin/__init__.py`) is started in
+process, using Rio's testing server. Each simulated client opens a session
+just like a browser would, only over an in-memory transport instead of a
+websocket, and then runs through a typical visit:
+
+1. Connect. This runs `on_session_start`, including the auth token check for
+   returning clients.
+2. Log in through the `LoginPage`, or sign up as a new user through the
+   `UserSignUpForm`. Returning clients with a valid token skip this.
+3. Open the admin dashboard.
+4. Disconnect.
+
+Everything runs offline, against a temporary database and a synthetic GeoIP
+database. The script reports throughput and p50/p99 latency of each step, and
+how far the event loop lagged behind while under load.
+
+Usage:
+
+    python benchmarks/load_test.py [--clients 50] [--duration 30]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+import typing as t
+from pathlib import Path
+
+import rio
+import starlette.datastructures
+from rio import data_models as rio_data_models
+from rio.app_server import TestingServer
+from rio.transports import MessageRecorderTransport
+
+import mmdb_fixture
+from common import (
+    APP_DIRECTORY,
+    APP_PACKAGE,
+    SEED_PASSWORD,
+    LatencySummary,
+    percentile,
+    seed_database,
+)
+
+# The steps of a visit, in the order they are reported
+STEPS = ("connect", "login", "sign_up", "dashboard")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Simulate concurrent clients using the app, offline.",
+    )
+    parser.add_argument(
+        "--clients",
+        type=int,
+        default=50,
+        help="Number of simulated clients visiting the app at the same time",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=30,
+        help="How long to keep the load up, in seconds",
+    )
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=1000,
+        help="Number of existing accounts to log in with",
+    )
+    parser.add_argument(
+        "--sign-up-ratio",
+        type=float,
+        default=0.1,
+        help="Share of new visitors who sign up rather than log in",
+    )
+    parser.add_argument(
+        "--returning-ratio",
+        type=float,
+        default=0.5,
+        help="Share of visits made with the auth token of a previous visit",
+    )
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=0.5,
+        help="Average pause between a client's steps, in seconds",
+    )
+    parser.add_argument(
+        "--lag-interval",
+        type=float,
+        default=0.05,
+        help="How often to sample the event loop lag, in seconds",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Where to write the results as JSON")
+    return parser.parse_args()
+
+
+class ClientTransport(MessageRecorderTransport):
+    """
+    Stands in for a browser's websocket connection. Requests from the server
+    are acknowledged right away, and nothing is recorded, so memory use
+    doesn't grow during long runs.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        # Set once the server has sent the first build of the page
+        self.refreshed = asyncio.Event()
+
+    async def send(self, msg: str) -> None:
+        message = json.loads(msg)
+
+        if "id" in message:
+            self.queue_response({"jsonrpc": "2.0", "id": message["id"], "result": None})
+
+        if message.get("method") == "updateComponentStates":
+            self.refreshed.set()
+
+
+def import_app() -> types.ModuleType:
+    """
+    Import the app's package, running its `__init__` so the `app` object is
+    created.
+    """
+    spec = importlib.util.spec_from_file_location(
+        APP_PACKAGE,
+        APP_DIRECTORY / "__init__.py",
+        submodule_search_locations=[str(APP_DIRECTORY)],
+    )
+    assert spec is not None and spec.loader is not None
+
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[APP_PACKAGE] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+class LoadTest:
+    """
+    Runs the app and a number of simulated clients, and collects how long each
+    step of their visits took.
+    """
+
+    def __init__(self, args: argparse.Namespace, package: types.ModuleType) -> None:
+        self.args = args
+        self.package = package
+        self.rng = random.Random(args.seed)
+        self.server = TestingServer(
+            package.app,
+            debug_mode=False,
+            running_in_window=False,
+        )
+
+        self.usernames: list[str] = []
+        self.latencies: dict[str, list[float]] = {step: [] for step in STEPS}
+        self.errors: dict[str, int] = {step: 0 for step in STEPS}
+        self.lags: list[float] = []
+        self.visits = 0
+
+        # Auth tokens handed out during earlier visits, for returning clients
+        self.auth_tokens: list[str] = []
+
+        self._next_sign_up = 0
+        self._running = True
+
+    async def _measure(self, step: str, action: t.Awaitable[t.Any]) -> t.Any:
+        start = time.perf_counter()
+
+        try:
+            result = await action
+        except Exception:
+            self.errors[step] += 1
+            raise
+
+        self.latencies[step].append(time.perf_counter() - start)
+        return result
+
+    async def _think(self) -> None:
+        await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+
+    async def _connect(self, auth_token: str) -> rio.Session:
+        transport = ClientTransport()
+        session = await self.server.create_session(
+            initial_message=rio_data_models.InitialClientMessage.from_defaults(
+                url="http://load.test/",
+                user_settings={"auth_token": auth_token},
+            ),
+            transport=transport,
+            # Every client gets an address of its own, like real visitors
+            # would. Otherwise the login throttle would treat them all as one.
+            client_ip=f"10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}",
+            client_port=self.rng.randrange(1024, 65536),
+            http_headers=starlette.datastructures.Headers(),
+        )
+
+        # The session is only usable once its first build has been sent
+        await transport.refreshed.wait()
+        return session
+
+    def _find(self, session: rio.Session, component_type: str) -> t.Any:
+        # Pages are imported by Rio itself, so match components by name rather
+        # than by class
+        root = session._get_user_root_component()
+
+        for component in root._iter_component_tree_():
+            if type(component).__name__ == component_type:
+                return component
+
+        raise LookupError(f"No {component_type} on {session.active_page_url}")
+
+    async def _login(self, session: rio.Session) -> None:
+        page = self._find(session, "LoginPage")
+        page.username = self.rng.choice(self.usernames)
+        page.password = SEED_PASSWORD
+
+        await page.login()
+
+        if page.error_message:
+            raise RuntimeError(page.error_message)
+
+        await session._refresh()
+
+    async def _sign_up(self, session: rio.Session) -> None:
+        form = self._find(session, "UserSignUpForm")
+        self._next_sign_up += 1
+        form.username_sign_up = f"load-{os.getpid()}-{self._next_sign_up}"
+        form.password_sign_up = SEED_PASSWORD
+        form.password_sign_up_repeat = SEED_PASSWORD
+
+        await form.on_sign_up()
+
+        if form.error_message:
+            raise RuntimeError(form.error_message)
+
+        await session._refresh()
+
+    async def _view_dashboard(self, session: rio.Session) -> None:
+        session.navigate_to("/app/admin")
+        await session._refresh()
+        self._find(session, "Dashboard")
+
+    async def _visit(self) -> None:
+        data_models = self.package.data_models
+
+        returning = self.auth_tokens and self.rng.random() < self.args.returning_ratio
+        auth_token = self.rng.choice(self.auth_tokens) if returning else ""
+
+        session = await self._measure("connect", self._connect(auth_token))
+
+        try:
+            # Clients without a valid token have to log in first
+            try:
+                session[data_models.AppUser]
+            except KeyError:
+                await self._think()
+
+                if self.rng.random() < self.args.sign_up_ratio:
+                    await self._measure("sign_up", self._sign_up(session))
+                else:
+                    await self._measure("login", self._login(session))
+
+                self.auth_tokens.append(session[data_models.UserSettings].auth_token)
+
+            await self._think()
+            await self._measure("dashboard", self._view_dashboard(session))
+            await self._think()
+        finally:
+            await session._close(close_remote_session=False)
+
+        self.visits += 1
+
+    async def _client(self) -> None:
+        while self._running:
+            try:
+                await self._visit()
+            except Exception:
+                # Already counted. Keep the load up regardless.
+                pass
+
+    async def _sample_lag(self) -> None:
+        # Sleep for a fixed interval, over and over. Any time beyond the
+        # interval is time the event loop was too busy to wake us up.
+        interval = self.args.lag_interval
+
+        while self._running:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.lags.append(max(time.perf_counter() - start - interval, 0))
+
+    async def run(self) -> float:
+        """
+        Start the app, put it under load for the configured duration and shut
+        it down again. Returns how long the load was kept up.
+        """
+        await self.server._on_start()
+
+        try:
+            pers = self.package.persistence.Persistence
+
+            for attachment in self.package.app.default_attachments:
+                if isinstance(attachment, pers):
+                    print(f"Seeding {self.args.users} users...")
+                    seeded = await seed_database(attachment, self.args.users, 0)
+                    self.usernames = seeded.usernames
+
+            # The first session builds everything for the first time. Keep
+            # that out of the results.
+            session = await self._connect("")
+            await session._close(close_remote_session=False)
+
+            print(f"Running {self.args.clients} clients for {self.args.duration:g} seconds...")
+            start = time.perf_counter()
+            tasks = [asyncio.create_task(self._client()) for _ in range(self.args.clients)]
+            lag_sampler = asyncio.create_task(self._sample_lag())
+
+            await asyncio.sleep(self.args.duration)
+            self._running = False
+
+            # Let the visits which are underway finish
+            await asyncio.gather(*tasks, lag_sampler)
+            return time.perf_counter() - start
+
+        finally:
+            await self.server._on_close()
+
+    def report(self, elapsed: float) -> dict[str, t.Any]:
+        lags = sorted(self.lags)
+
+        return {
+            "parameters": {
+                key: value for key, value in vars(self.args).items() if key != "output"
+            },
+            "elapsed_seconds": round(elapsed, 2),
+            "visits": self.visits,
+            "visits_per_second": round(self.visits / elapsed, 2),
+            "steps": {
+                step: LatencySummary.from_latencies(
+                    self.latencies[step],
+                    self.errors[step],
+                    elapsed,
+                ).as_dict()
+                for step in STEPS
+            },
+            "event_loop_lag_ms": {
+                "samples": len(lags),
+                "p50": round(percentile(lags, 50) * 1000, 3),
+                "p99": round(percentile(lags, 99) * 1000, 3),
+                "max": round(lags[-1] * 1000, 3) if lags else 0.0,
+            },
+        }
+
+
+def print_report(report: dict[str, t.Any]) -> None:
+    print()
+    print(
+        f"{report['visits']} visits in {report['elapsed_seconds']:g} s "
+        f"({report['visits_per_second']:g} visits/s)"
+    )
+
+    for step, summary in report["steps"].items():
+        print(
+            f"  {step:<10} {summary['operations']:>7} ok {summary['errors']:>5} errors  "
+            f"{summary['ops_per_second']:>8.1f} /s  "
+            f"p50 {summary['p50_ms']:>9.2f} ms  p99 {summary['p99_ms']:>9.2f} ms"
+        )
+
+    lag = report["event_loop_lag_ms"]
+    print(
+        f"  event loop lag: p50 {lag['p50']:.2f} ms  p99 {lag['p99']:.2f} ms  "
+        f"max {lag['max']:.2f} ms"
+    )
+
+
+def main() -> int:
+    args = parse_args()
+
+    # The app keeps its databases in `./db`. Run in a temporary directory, so
+    # the real ones aren't touched, and put a synthetic GeoIP database in
+    # place so nothing is downloaded.
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir("db")
+        mmdb_fixture.write_city_fixture("db/GeoLite2-City.mmdb")
+
+        load_test = LoadTest(args, import_app())
+        elapsed = asyncio.run(load_test.run())
+
+        # Leave the directory, so it can be removed
+        os.chdir(Path(__file__).resolve().parent)
+
+    report = load_test.report(elapsed)
+    print_report(report)
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Wrote results to {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+Writes small, synthetic GeoIP2 City databases, so GeoIP lookups can be
+benchmarked and tested without downloading the real (~60 MB) database.
+
+Only the parts of the MaxMind DB format needed for IPv4 City databases are
+implemented. The format is documented at
+https://maxmind.github.io/MaxMind-DB/
+
+Usage:
+
+    python benchmarks/mmdb_fixture.py <destination> [--networks N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import ipaddress
+import struct
+import time
+import typing as t
+
+# Locations the synthetic networks are spread over, as
+# `(country ISO code, country name, city name)`
+LOCATIONS = [
+    ("US", "United States", "New York"),
+    ("DE", "Germany", "Berlin"),
+    ("IN", "India", "Mumbai"),
+    ("BR", "Brazil", "São Paulo"),
+    ("JP", "Japan", "Tokyo"),
+    ("NG", "Nigeria", "Lagos"),
+    ("AU", "Australia", "Sydney"),
+    ("PK", "Pakistan", "Karachi"),
+]
+
+# Separates the search tree from the data section
+_DATA_SECTION_SEPARATOR = b"\x00" * 16
+
+# Marks the start of the metadata
+_METADATA_START_MARKER = b"\xab\xcd\xefMaxMind.com"
+
+# Each tree node consists of two records of this many bits
+_RECORD_SIZE = 24
+
+
+def _encode_control(type_number: int, size: int) -> bytes:
+    """
+    Encode the control byte(s) introducing a field of the given type and
+    payload size.
+    """
+    if size < 29:
+        size_bits, size_bytes = size, b""
+    elif size < 29 + 256:
+        size_bits, size_bytes = 29, bytes([size - 29])
+    elif size < 285 + 65536:
+        size_bits, size_bytes = 30, struct.pack(">H", size - 285)
+    else:
+        size_bits, size_bytes = 31, struct.pack(">I", size - 65821)[1:]
+
+    # Types above 7 are "extended": the type bits are zero and the actual type
+    # follows in the next byte
+    if type_number <= 7:
+        return bytes([(type_number << 5) | size_bits]) + size_bytes
+
+    return bytes([size_bits, type_number - 7]) + size_bytes
+
+
+def _encode_unsigned(type_number: int, value: int) -> bytes:
+    payload = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return _encode_control(type_number, len(payload)) + payload
+
+
+class Uint16(int):
+    """
+    An integer which is encoded as uint16, rather than uint32. Some metadata
+    fields must have this type.
+    """
+
+
+class Uint64(int):
+    """
+    An integer which is encoded as uint64, rather than uint32.
+    """
+
+
+def encode(value: t.Any) -> bytes:
+    """
+    Encode a value in the MaxMind DB data format. Supports strings, unsigned
+    integers (as uint32, unless wrapped in `Uint16` or `Uint64`), lists and
+    dictionaries with string keys.
+    """
+    if isinstance(value, Uint16):
+        return _encode_unsigned(5, value)
+
+    if isinstance(value, Uint64):
+        return _encode_unsigned(9, value)
+
+    if isinstance(value, str):
+        payload = value.encode("utf-8")
+        return _encode_control(2, len(payload)) + payload
+
+    if isinstance(value, bool):
+        return _encode_control(14, int(value))
+
+    if isinstance(value, int):
+        return _encode_unsigned(6, value)
+
+    if isinstance(value, dict):
+        return _encode_control(7, len(value)) + b"".join(
+            encode(key) + encode(item) for key, item in value.items()
+        )
+
+    if isinstance(value, list):
+        return _encode_control(11, len(value)) + b"".join(encode(item) for item in value)
+
+    raise TypeError(f"Can't encode values of type {type(value).__name__}")
+
+
+def _location_record(iso_code: str, country: str, city: str) -> dict[str, t.Any]:
+    return {
+        "city": {"names": {"en": city}},
+        "country": {"iso_code": iso_code, "names": {"en": country}},
+    }
+
+
+def write_database(
+    destination: str,
+    networks: t.Iterable[tuple[ipaddress.IPv4Network, dict[str, t.Any]]],
+    *,
+    database_type: str = "GeoLite2-City",
+) -> None:
+    """
+    Write an IPv4 MaxMind DB file mapping each of the given networks to its
+    record. Networks must not overlap.
+    """
+    # Identical records are only stored once
+    data = bytearray()
+    data_offsets: dict[bytes, int] = {}
+
+    # The search tree, as a list of `[left, right]` records. Each record is
+    # either the index of another node, `None` (no data), or a
+    # `("data", offset)` tuple.
+    nodes: list[list[t.Any]] = [[None, None]]
+
+    for network, record in networks:
+        encoded = encode(record)
+
+        if encoded not in data_offsets:
+            data_offsets[encoded] = len(data)
+            data += encoded
+
+        address = int(network.network_address)
+        node = 0
+
+        for depth in range(network.prefixlen):
+            bit = (address >> (31 - depth)) & 1
+
+            if depth == network.prefixlen - 1:
+                nodes[node][bit] = ("data", data_offsets[encoded])
+                break
+
+            child = nodes[node][bit]
+
+            if not isinstance(child, int):
+                child = len(nodes)
+                nodes.append([None, None])
+                nodes[node][bit] = child
+
+            node = child
+
+    node_count = len(nodes)
+
+    def record_value(record: t.Any) -> int:
+        if record is None:
+            return node_count
+
+        if isinstance(record, int):
+            return record
+
+        return node_count + len(_DATA_SECTION_SEPARATOR) + record[1]
+
+    tree = bytearray()
+
+    for left, right in nodes:
+        tree += record_value(left).to_bytes(3, "big")
+        tree += record_value(right).to_bytes(3, "big")
+
+    metadata = {
+        "binary_format_major_version": Uint16(2),
+        "binary_format_minor_version": Uint16(0),
+        "build_epoch": Uint64(int(time.time())),
+        "database_type": database_type,
+        "description": {"en": "Synthetic database for benchmarks"},
+        "ip_version": Uint16(4),
+        "languages": ["en"],
+        "node_count": node_count,
+        "record_size": Uint16(_RECORD_SIZE),
+    }
+
+    with open(destination, "wb") as f:
+        f.write(tree)
+        f.write(_DATA_SECTION_SEPARATOR)
+        f.write(data)
+        f.write(_METADATA_START_MARKER)
+        f.write(encode(metadata))
+
+
+def synthetic_networks(count: int) -> list[ipaddress.IPv4Network]:
+    """
+    Return `count` globally routable /24 networks, spread out over the IPv4
+    address space.
+    """
+    result = []
+    stride = max((224 << 16) // (count * 2), 1)
+    candidate = 1 << 16
+
+    while len(result) < count and candidate < (224 << 16):
+        network = ipaddress.IPv4Network((candidate << 8, 24))
+
+        if network.is_global:
+            result.append(network)
+
+        candidate += stride
+
+    return result
+
+
+def write_city_fixture(destination: str, network_count: int = 1024) -> list[ipaddress.IPv4Network]:
+    """
+    Write a synthetic City database with `network_count` /24 networks spread
+    over `LOCATIONS`. Returns the networks, so callers can pick addresses
+    which are known to be in the database.
+    """
+    networks = synthetic_networks(network_count)
+
+    write_database(
+        destination,
+        (
+            (network, _location_record(*LOCATIONS[index % len(LOCATIONS)]))
+            for index, network in enumerate(networks)
+        ),
+    )
+
+    return networks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("destination")
+    parser.add_argument("--networks", type=int, default=1024)
+    args = parser.parse_args()
+
+    networks = write_city_fixture(args.destination, args.networks)
+    print(f"Wrote {len(networks)} networks to {args.destination}")
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 import typing as t
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
@@ -8,32 +10,245 @@ import rio
 import os
 
 from . import components as comps
-from . import data_models, persistence
-from .utils import download_large_file
+from . import (
+    dashboard_stats,
+    data_models,
+    login_throttle,
+    metrics,
+    online_users,
+    persistence,
+    session_reaper,
+)
+from .utils import (
+    LoopMonitor,
+    PeriodicTask,
+    download_with_retries,
+    get_bool_setting,
+    get_hashing_service,
+    instrumented,
+    serve_prometheus,
+)
+from .utils import geoip2_with_flag
 
+_logger = logging.getLogger(__name__)
 
-async def on_app_start(app: rio.App) -> None:
-    # Download `GeoLite2-City.mmdb` file.
-    url = "https://xrc.freewebhostmost.com/GeoLite2-City.mmdb"
-    destination = "./db/GeoLite2-City.mmdb"
+# Tasks running in the background for as long as the app is running. Keeping
+# references to them here prevents them from being garbage collected.
+_background_tasks: set[asyncio.Task] = set()
 
-    if not os.path.exists("./db"):
-        os.mkdir("./db")
+# Serves the latency statistics to Prometheus, if enabled
+_prometheus_server: asyncio.Server | None = None
+
+# Services running for as long as the app is running, in the order they were
+# started. No session ever looks these up, so rather than attaching them to
+# every session they are kept here until the app closes.
+_services: list[LoopMonitor | PeriodicTask | dashboard_stats.StatsPublisher] = []
 
-    if not os.path.exists(destination):
-        download_large_file(
+# The app-wide instances which have to be shut down cleanly when the app
+# closes. They are also attached to the sessions, which look them up by type.
+_persistence: persistence.Persistence | None = None
+_metrics_store: metrics.MetricsStore | None = None
+
+
+async def download_geoip_database(destination: str) -> None:
+    # Download `GeoLite2-City.mmdb` file. The file is fetched in several
+    # segments at once, and the progress is published for the dashboard.
+    #
+    # Failed attempts are retried with backoff, resuming the partial file.
+    # Otherwise a single network hiccup would leave the app without location
+    # data until it is restarted. Once the file is in place, the GeoIP reload
+    # task picks it up.
+    url = "https://xrc.freewebhostmost.com/GeoLite2-City.mmdb"
+
+    try:
+        await download_with_retries(
             url=url,
             destination=destination,
+            connections=4,
+            on_progress=geoip2_with_flag.download_progress.update,
         )
+    except Exception:
+        _logger.exception("Failed to download the GeoIP database")
+
+
+async def on_app_start(app: rio.App) -> None:
+    global _persistence, _metrics_store
+
+    # Keep an eye on the event loop. Anything blocking it for too long freezes
+    # the app for all users, so such code is logged along with its stack.
+    loop_monitor = LoopMonitor(interval=0.1, threshold=0.1)
+    loop_monitor.start()
+    _services.append(loop_monitor)
+
+    if not os.path.exists("./db"):
+        os.mkdir("./db")
+
+    # Fetch the GeoIP database in the background, so the app can start serving
+    # right away. Until the download is complete, locations are reported as
+    # unknown.
+    #
+    # The download goes wherever the GeoIP service expects the file, so the two
+    # can't disagree.
+    geoip_database_path = geoip2_with_flag.geoip_service.database_path
+
+    if not os.path.exists(geoip_database_path):
+        task = asyncio.create_task(download_geoip_database(geoip_database_path))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
     # Create a persistence instance. This class hides the gritty details of
     # database interaction from the app.
-    pers = persistence.Persistence()
+    #
+    # Every connecting client extends its session. With `write_behind` these
+    # extensions are collected and written in batches, rather than committing
+    # each one individually.
+    #
+    # The database is SQLite by default. To run the app on several machines,
+    # point `RIO_ADMIN_DATABASE_URL` or the `[database]` section of `rio.toml`
+    # at a shared PostgreSQL server instead.
+    pers = await persistence.Persistence.open(write_behind=True)
+    _persistence = pers
 
     # Now attach it to the session. This way, the persistence instance is
     # available to all components using `self.session[persistence.Persistence]`
     app.default_attachments.append(pers)
 
+    # Reject login attempts which come too often before any password is
+    # hashed, so brute force attempts can't use up the server's CPU
+    app.default_attachments.append(login_throttle.LoginThrottle.from_settings())
+
+    # Keep track of who is online. The dashboard reads from this instead of
+    # inspecting every connected session itself.
+    online = online_users.OnlineUsers()
+    app.default_attachments.append(online)
+
+    # Record logins, sign-ups and the like over time. The counts are kept in
+    # memory and written to the database once a minute.
+    metrics_store = metrics.MetricsStore(pers)
+    await metrics_store.load_history()
+    _metrics_store = metrics_store
+    app.default_attachments.append(metrics_store)
 
+    metrics_flusher = PeriodicTask(metrics_store.flush, interval=60)
+    metrics_flusher.start()
+    _services.append(metrics_flusher)
+
+    # Gather the dashboard statistics once, centrally, and push them to all
+    # open dashboards whenever they change. Dashboards subscribe through their
+    # session, so the publisher is attached as well.
+    stats = dashboard_stats.StatsPublisher(
+        online,
+        metrics_store,
+        interval=2,
+        loop_monitor=loop_monitor,
+    )
+    stats.start()
+    _services.append(stats)
+    app.default_attachments.append(stats)
+
+    # Expired sessions are never deleted by the app itself. Clean them up in
+    # the background, every hour.
+    #
+    # If enabled, the space they took up is also returned to the operating
+    # system. This rebuilds existing SQLite databases once, which blocks writes
+    # for a while on large databases, so it has to be switched on explicitly.
+    reaper = session_reaper.SessionReaper(
+        pers,
+        interval=60 * 60,
+        vacuum=get_bool_setting(
+            "database",
+            "vacuum",
+            env_var="RIO_ADMIN_DATABASE_VACUUM",
+            default=False,
+        ),
+    )
+    reaper.start()
+    _services.append(reaper)
+
+    # In WAL mode, make sure the log is regularly copied back into the database
+    # file. Otherwise it can keep growing while readers are busy.
+    if (
+        isinstance(pers.backend, persistence.SqliteBackend)
+        and pers.backend.pool.tuning.checkpoint_interval is not None
+    ):
+        checkpointer = PeriodicTask(
+            pers.checkpoint,
+            interval=pers.backend.pool.tuning.checkpoint_interval,
+        )
+        checkpointer.start()
+        _services.append(checkpointer)
+
+    # Pick up new versions of the GeoIP database without a restart. Just
+    # replace the file, and it will be swapped in within a minute. This also
+    # fills in the locations of users who connected while the database was
+    # still downloading.
+    #
+    # Once downloaded, the database may also be opened by the first lookup
+    # rather than by a reload. Either way the load count changes, so compare
+    # that instead of relying on `reload_if_changed`'s result.
+    geoip_service = geoip2_with_flag.geoip_service
+    refreshed_load_count = geoip_service.load_count
+
+    async def reload_geoip_database() -> None:
+        nonlocal refreshed_load_count
+
+        await geoip_service.reload_if_changed()
+        load_count = geoip_service.load_count
+
+        if load_count != refreshed_load_count:
+            await online.refresh_locations()
+            refreshed_load_count = load_count
+
+    geoip_reloader = PeriodicTask(reload_geoip_database, interval=60)
+    geoip_reloader.start()
+    _services.append(geoip_reloader)
+
+    # Expose the latency statistics for Prometheus to scrape, if a port was
+    # configured. The endpoint is only reachable from the local machine unless
+    # `RIO_ADMIN_METRICS_HOST` says otherwise.
+    global _prometheus_server
+    metrics_port = os.environ.get("RIO_ADMIN_METRICS_PORT")
+
+    if metrics_port:
+        _prometheus_server = await serve_prometheus(
+            host=os.environ.get("RIO_ADMIN_METRICS_HOST", "127.0.0.1"),
+            port=int(metrics_port),
+        )
+
+
+async def on_app_close(app: rio.App) -> None:
+    global _prometheus_server, _persistence, _metrics_store
+
+    for task in list(_background_tasks):
+        task.cancel()
+
+    if _prometheus_server is not None:
+        _prometheus_server.close()
+        _prometheus_server = None
+
+    # Stop all background tasks before the database goes away. Later services
+    # may depend on earlier ones, so stop them in reverse.
+    while _services:
+        await _services.pop().stop()
+
+    # Write any metrics which haven't been stored yet
+    if _metrics_store is not None:
+        await _metrics_store.flush()
+        _metrics_store = None
+
+    # Close the GeoIP database
+    geoip2_with_flag.geoip_service.close()
+
+    # Shut down the worker processes used for password hashing
+    get_hashing_service().close()
+
+    # Close all database connections
+    if _persistence is not None:
+        await _persistence.close()
+        _persistence = None
+
+
+@instrumented("app.on_session_start")
 async def on_session_start(rio_session: rio.Session) -> None:
     # A new user has just connected. Check if they have a valid auth token.
     #
@@ -43,6 +258,10 @@ async def on_session_start(rio_session: rio.Session) -> None:
     # stored.
     user_settings = rio_session[data_models.UserSettings]
 
+    # Count the new session towards the online users
+    rio_session[online_users.OnlineUsers].add(rio_session)
+    rio_session[metrics.MetricsStore].record("session_start")
+
     # Get the persistence instance
     pers = rio_session[persistence.Persistence]
 
@@ -79,6 +298,11 @@ async def on_session_start(rio_session: rio.Session) -> None:
             )
 
 
+async def on_session_close(rio_session: rio.Session) -> None:
+    # The user has disconnected, so they're no longer online
+    rio_session[online_users.OnlineUsers].remove(rio_session)
+
+
 # Define a theme for Rio to use.
 #
 # You can modify the colors here to adapt the appearance of your app or website.
@@ -100,8 +324,12 @@ app = rio.App(
     #
     # `rio run` will also call it again each time the app is reloaded.
     on_app_start=on_app_start,
+    # This function will be called right before the app shuts down
+    on_app_close=on_app_close,
     # This function will be called each time a user connects
     on_session_start=on_session_start,
+    # This function will be called each time a user disconnects
+    on_session_close=on_session_close,
     # You can optionally provide a root component for the app. By default,
     # Rio's default navigation is used. By providing your own component, you
     # can create components which stay put while the user navigates between
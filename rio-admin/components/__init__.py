@@ -1,3 +1,6 @@
 from .root_component import RootComponent
 from .user_sign_up_form import UserSignUpForm
 from .dashboard import Dashboard
+from .event_chart import EventChart
+from .performance_panel import PerformancePanel
+from .users_table import UsersTable
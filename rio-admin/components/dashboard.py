@@ -1,6 +1,16 @@
-import random
+from __future__ import annotations
+
+from dataclasses import field
+
 import rio
-from ..utils import px_to_rem, get_country_from_ip
+from ..dashboard_stats import (
+    HISTORY_LENGTH,
+    LAG_BUCKETS,
+    StatsPublisher,
+    StatsSnapshot,
+)
+from ..utils import geoip2_with_flag, is_database_ready, px_to_rem
+from .event_chart import EventChart
 
 # Container
 CONTAINER_SPACING = 32
@@ -14,46 +24,104 @@ CARD_MARGIN_Y = 20
 # Card Icon
 CARD_ICON_SIZE = 52
 
+# Chart titles, by event
+EVENT_TITLES = {
+    "login": "Logins",
+    "sign_up": "Sign-ups",
+    "session_start": "Sessions",
+    "logout": "Logouts",
+    "login_throttled": "Throttled logins",
+}
+
+# Labels of the event loop lag buckets
+LAG_LABELS = tuple(f"≤ {bound * 1000:g} ms" for bound in LAG_BUCKETS) + (
+    f"> {LAG_BUCKETS[-1] * 1000:g} ms",
+)
+
 
 class Dashboard(rio.Component):
     """
     The Dashboard component is responsible for building a user interface that provides
     a summary of the online users and their geographical distribution.
+
+    The statistics are pushed to the dashboard by the app's `StatsPublisher`
+    whenever they change, so the dashboard stays up to date on its own.
     """
 
-    def build(self) -> rio.Component:
-        self.sessions = self.session._app_server.sessions
-        self.users_count = len(self.sessions)
-        self.users = {}
+    # The statistics currently on display. Starts out with the most recent
+    # ones when the dashboard is created.
+    snapshot: StatsSnapshot | None = None
+
+    # How many users are online, in total and by location
+    users_count: int = 0
+    users: dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        # Newer statistics will be pushed to the dashboard as they become
+        # available
+        self._apply_snapshot(self.session[StatsPublisher].latest)
+
+    @rio.event.on_mount
+    def on_mount(self) -> None:
+        self.session[StatsPublisher].subscribe(self._on_new_snapshot)
+
+    @rio.event.on_unmount
+    def on_unmount(self) -> None:
+        self.session[StatsPublisher].unsubscribe(self._on_new_snapshot)
+
+    def _apply_snapshot(self, snapshot: StatsSnapshot) -> None:
+        self.snapshot = snapshot
+        self.users_count = snapshot.online_count
+        self.users = dict(snapshot.location_counts)
+
+    async def _on_new_snapshot(self, snapshot: StatsSnapshot) -> None:
+        self._apply_snapshot(snapshot)
+        await self.force_refresh()
+
+    def _build_warming_up_text(self) -> str:
+        if is_database_ready():
+            return ""
 
-        for user in self.sessions:
-            # For Test
-            test_ips = ["103.209.79.0", "170.171.1.9", "103.177.248.0", "103.139.210.0"]
-            ip = test_ips[random.randint(0, len(test_ips) - 1)]
-            # ip = user.client_ip
-            response = get_country_from_ip(ip)
+        text = "Location data is warming up. Locations will show up once it's ready."
+        fraction = geoip2_with_flag.download_progress.fraction
 
-            if response is None:
-                key = "?:Unknown"
+        if fraction is not None:
+            text += f" ({fraction:.0%} downloaded)"
 
-                if self.users.get(key) is None:
-                    self.users[key] = [ip]
-                else:
-                    self.users[key].append(ip)
+        return text
 
-                continue
+    def build(self) -> rio.Component:
+        # Set by `__post_init__`, and kept up to date by the publisher
+        snapshot = self.snapshot
+        assert snapshot is not None
 
-            country, city, flag = response
-            key = f"{flag}:{country}, {city}"
+        # Lag means some code kept the server busy, so every connected user
+        # had to wait. It's only known if the app is monitoring the event loop.
+        lag_charts = []
 
-            if self.users.get(key) is None:
-                self.users[key] = [ip]
-            else:
-                self.users[key].append(ip)
+        if snapshot.loop_lag_counts:
+            lag_charts.append(
+                EventChart(
+                    title="Event loop lag",
+                    counts=snapshot.loop_lag_counts,
+                    labels=LAG_LABELS,
+                    caption=(
+                        f"p99 {snapshot.loop_lag_p99_ms} ms, "
+                        f"{snapshot.slow_callbacks} slow callbacks"
+                    ),
+                    align_x=0,
+                )
+            )
 
         return rio.Column(
             # Title
             rio.Text("Dashboard", style="heading1", align_x=0.5),
+            # The GeoIP database is downloaded in the background when the app
+            # first starts. Until then, locations can't be determined.
+            rio.Banner(
+                text=self._build_warming_up_text(),
+                style="info",
+            ),
             # Users Online Card
             rio.Card(
                 rio.Column(
@@ -68,6 +136,10 @@ class Dashboard(rio.Component):
                         style="heading3",
                         align_x=0.5,
                     ),
+                    rio.Text(
+                        f"{snapshot.logins_per_minute} logins in the last minute",
+                        align_x=0.5,
+                    ),
                     spacing=px_to_rem(CARD_SPACING),
                     margin_x=px_to_rem(CARD_MARGIN_X),
                     margin_y=px_to_rem(CARD_MARGIN_Y),
@@ -87,7 +159,7 @@ class Dashboard(rio.Component):
                                 align_x=0.5,
                             ),
                             rio.Text(key.split(":")[1], style="heading3", align_x=0.5),
-                            rio.Text(str(len(value)), align_x=0.5),
+                            rio.Text(str(value), align_x=0.5),
                             spacing=px_to_rem(CARD_SPACING),
                             margin_x=px_to_rem(CARD_MARGIN_X),
                             margin_y=px_to_rem(CARD_MARGIN_Y),
@@ -100,6 +172,20 @@ class Dashboard(rio.Component):
                 spacing=px_to_rem(CONTAINER_SPACING),
                 margin_y=px_to_rem(CONTAINER_MARGIN_Y),
             ),
+            # Event History Charts
+            rio.Text(f"Last {HISTORY_LENGTH} minutes", style="heading2"),
+            rio.Row(
+                *[
+                    EventChart(
+                        title=EVENT_TITLES.get(event, event),
+                        counts=counts,
+                    )
+                    for event, counts in snapshot.event_history
+                ],
+                spacing=px_to_rem(CONTAINER_SPACING),
+            ),
+            # Event Loop Lag Chart
+            *lag_charts,
             align_x=0,
             align_y=0,
             spacing=px_to_rem(CONTAINER_SPACING),
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import html
+
+import rio
+
+from ..utils import px_to_rem
+
+# Chart
+CHART_WIDTH = 300
+CHART_HEIGHT = 80
+BAR_GAP = 1
+
+# Card
+CARD_SPACING = 8
+CARD_MARGIN_X = 24
+CARD_MARGIN_Y = 20
+
+
+class EventChart(rio.Component):
+    """
+    A small bar chart showing how often an event happened over time, e.g. the
+    number of logins in each of the last 60 minutes.
+
+    The chart is drawn as an inline SVG, so it doesn't need any additional
+    dependencies.
+
+    ## Attributes
+
+    `title`: Shown above the chart.
+
+    `counts`: The value of each bar, oldest first.
+
+    `labels`: Optional label for each bar, shown when hovering over it.
+
+    `caption`: Shown below the title. Defaults to the sum of all counts.
+    """
+
+    title: str
+    counts: tuple[int, ...] = ()
+    labels: tuple[str, ...] = ()
+    caption: str = ""
+
+    def _build_svg(self) -> str:
+        color = self.session.theme.primary_color.hex
+        peak = max(self.counts, default=0)
+        bar_width = CHART_WIDTH / max(len(self.counts), 1)
+        bars = []
+
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+
+            height = CHART_HEIGHT * count / peak
+            label = f"{self.labels[index]}: {count}" if index < len(self.labels) else str(count)
+            bars.append(
+                f'<rect x="{index * bar_width:.2f}" y="{CHART_HEIGHT - height:.2f}" '
+                f'width="{max(bar_width - BAR_GAP, 1):.2f}" height="{height:.2f}" '
+                f'fill="#{color}"><title>{html.escape(label)}</title></rect>'
+            )
+
+        return (
+            f'<svg viewBox="0 0 {CHART_WIDTH} {CHART_HEIGHT}" '
+            f'width="100%" height="{CHART_HEIGHT}" preserveAspectRatio="none">'
+            f'{"".join(bars)}'
+            "</svg>"
+        )
+
+    def build(self) -> rio.Component:
+        return rio.Card(
+            rio.Column(
+                rio.Text(self.title, style="heading3"),
+                rio.Text(self.caption or f"{sum(self.counts)} in total", style="dim"),
+                rio.Html(
+                    self._build_svg(),
+                    min_width=px_to_rem(CHART_WIDTH),
+                    min_height=px_to_rem(CHART_HEIGHT),
+                ),
+                spacing=px_to_rem(CARD_SPACING),
+                margin_x=px_to_rem(CARD_MARGIN_X),
+                margin_y=px_to_rem(CARD_MARGIN_Y),
+            )
+        )
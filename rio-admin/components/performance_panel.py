@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from dataclasses import field
+
+import rio
+
+from ..utils import OperationSummary, instrumentation, px_to_rem
+
+# Container
+CONTAINER_SPACING = 32
+CONTAINER_MARGIN_Y = 32
+
+# How often the statistics are refreshed, in seconds
+REFRESH_INTERVAL = 2
+
+
+def _format_latency(seconds: float) -> str:
+    if seconds < 0.001:
+        return f"{seconds * 1_000_000:.0f} µs"
+
+    if seconds < 1:
+        return f"{seconds * 1000:.1f} ms"
+
+    return f"{seconds:.2f} s"
+
+
+class PerformancePanel(rio.Component):
+    """
+    Shows how long instrumented operations (database queries, password
+    hashing, GeoIP lookups, ...) take, along with how often they were called
+    and how often they failed.
+    """
+
+    summaries: list[OperationSummary] = field(default_factory=list)
+
+    @rio.event.on_populate
+    def on_populate(self) -> None:
+        self.summaries = instrumentation.summarize()
+
+    @rio.event.periodic(REFRESH_INTERVAL)
+    def on_refresh(self) -> None:
+        self.summaries = instrumentation.summarize()
+
+    def on_reset(self) -> None:
+        instrumentation.reset()
+        self.summaries = []
+
+    def build(self) -> rio.Component:
+        if not instrumentation.enabled:
+            content: rio.Component = rio.Banner(
+                "Instrumentation is disabled. Unset `RIO_ADMIN_INSTRUMENTATION` to enable it.",
+                style="info",
+            )
+        elif not self.summaries:
+            content = rio.Text("Nothing has been measured yet.", style="dim")
+        else:
+            content = rio.Table(
+                {
+                    "Operation": [s.name for s in self.summaries],
+                    "Calls": [s.calls for s in self.summaries],
+                    "Errors": [s.errors for s in self.summaries],
+                    "p50": [_format_latency(s.p50) for s in self.summaries],
+                    "p90": [_format_latency(s.p90) for s in self.summaries],
+                    "p99": [_format_latency(s.p99) for s in self.summaries],
+                    "Max": [_format_latency(s.max) for s in self.summaries],
+                },
+                show_row_numbers=False,
+            )
+
+        return rio.Column(
+            # Title
+            rio.Text("Performance", style="heading1", align_x=0.5),
+            content,
+            rio.Button(
+                "Reset",
+                icon="material/refresh",
+                shape="rounded",
+                style="minor",
+                on_press=self.on_reset,
+                is_sensitive=instrumentation.enabled,
+                align_x=1,
+            ),
+            align_x=0,
+            align_y=0,
+            spacing=px_to_rem(CONTAINER_SPACING),
+            margin_y=px_to_rem(CONTAINER_MARGIN_Y),
+        )
@@ -6,7 +6,7 @@ from dataclasses import KW_ONLY, field
 import rio
 
 from .. import components as comps
-from .. import data_models, persistence
+from .. import data_models, metrics, persistence
 
 
 class UserSignUpForm(rio.Component):
@@ -78,13 +78,22 @@ class UserSignUpForm(rio.Component):
             return
 
         # Create a new user
-        user_info = data_models.AppUser.new_with_defaults(
+        user_info = await data_models.AppUser.new_with_defaults_async(
             username=self.username_sign_up,
             password=self.password_sign_up,
         )
 
-        # Store the user in the database
-        await pers.create_user(user_info)
+        # Store the user in the database. Somebody else may have taken the
+        # username while the password was being hashed.
+        try:
+            await pers.create_user(user_info)
+        except persistence.UsernameTakenError:
+            self.error_message = "This username is already taken"
+            self.username_valid = False
+            self.passwords_valid = True
+            return
+
+        self.session[metrics.MetricsStore].record("sign_up")
 
         # Registration is complete - close the popup
         self.popup_open = False
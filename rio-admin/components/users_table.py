@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import uuid
+from dataclasses import field
+
+import rio
+
+from .. import data_models, persistence
+from ..utils import px_to_rem
+
+# How many users are shown at once
+PAGE_SIZE = 25
+
+# Container
+CONTAINER_SPACING = 16
+CONTAINER_MARGIN_Y = 32
+
+# Table
+ROW_SPACING = 24
+USERNAME_COLUMN_WIDTH = 240
+
+
+class UsersTable(rio.Component):
+    """
+    Lists all registered users, one page at a time.
+
+    There can be far too many users to display them all at once. Instead, only
+    the current page is loaded from the database and turned into components.
+    Users can be searched by the beginning of their username.
+    """
+
+    # The text entered into the search field
+    search_text: str = ""
+
+    # The users on the current page
+    users: list[data_models.AppUser] = field(default_factory=list)
+
+    # Pages are addressed by the ID of the user preceding them, rather than a
+    # page number. `None` stands for the first page.
+    current_page: uuid.UUID | None = None
+
+    # The addresses of all previous pages, needed to navigate back to them
+    previous_pages: list[uuid.UUID | None] = field(default_factory=list)
+
+    # Whether there are more users after the current page
+    has_next_page: bool = False
+
+    @rio.event.on_populate
+    async def on_populate(self) -> None:
+        await self._load_page()
+
+    async def _load_page(self) -> None:
+        """
+        Fetch the users of `current_page` from the database.
+        """
+        pers = self.session[persistence.Persistence]
+
+        # Request one user more than fits on the page. If it's there, there
+        # is another page after this one.
+        users = [
+            user
+            async for user in pers.iter_users(
+                after=self.current_page,
+                limit=PAGE_SIZE + 1,
+                username_prefix=self.search_text,
+            )
+        ]
+
+        self.has_next_page = len(users) > PAGE_SIZE
+        self.users = users[:PAGE_SIZE]
+
+    async def on_search(self, _: rio.TextInputConfirmEvent | None = None) -> None:
+        """
+        Start over at the first page, using the current search text.
+        """
+        self.current_page = None
+        self.previous_pages = []
+        await self._load_page()
+
+    async def on_next_page(self) -> None:
+        """
+        Move on to the page following the current one.
+        """
+        if not self.has_next_page:
+            return
+
+        self.previous_pages.append(self.current_page)
+        self.current_page = self.users[-1].id
+        await self._load_page()
+
+    async def on_previous_page(self) -> None:
+        """
+        Go back to the page preceding the current one.
+        """
+        if not self.previous_pages:
+            return
+
+        self.current_page = self.previous_pages.pop()
+        await self._load_page()
+
+    def build(self) -> rio.Component:
+        return rio.Column(
+            # Title
+            rio.Text("Users", style="heading1", align_x=0.5),
+            # Search
+            rio.TextInput(
+                text=self.bind().search_text,
+                label="Search by username",
+                on_confirm=self.on_search,
+            ),
+            # Table
+            rio.Column(
+                rio.Row(
+                    rio.Text(
+                        "Username",
+                        style="heading3",
+                        min_width=px_to_rem(USERNAME_COLUMN_WIDTH),
+                    ),
+                    rio.Text("Created", style="heading3"),
+                    spacing=px_to_rem(ROW_SPACING),
+                ),
+                *[
+                    rio.Row(
+                        rio.Text(
+                            user.username,
+                            min_width=px_to_rem(USERNAME_COLUMN_WIDTH),
+                        ),
+                        rio.Text(user.created_at.strftime("%Y-%m-%d %H:%M")),
+                        spacing=px_to_rem(ROW_SPACING),
+                    )
+                    for user in self.users
+                ],
+                spacing=px_to_rem(CONTAINER_SPACING / 2),
+            ),
+            # Pagination
+            rio.Row(
+                rio.Button(
+                    "Previous",
+                    icon="material/chevron_left",
+                    style="minor",
+                    is_sensitive=bool(self.previous_pages),
+                    on_press=self.on_previous_page,
+                ),
+                rio.Button(
+                    "Next",
+                    icon="material/chevron_right",
+                    style="minor",
+                    is_sensitive=self.has_next_page,
+                    on_press=self.on_next_page,
+                ),
+                spacing=px_to_rem(CONTAINER_SPACING),
+                align_x=0.5,
+            ),
+            align_x=0,
+            align_y=0,
+            spacing=px_to_rem(CONTAINER_SPACING),
+            margin_y=px_to_rem(CONTAINER_MARGIN_Y),
+        )
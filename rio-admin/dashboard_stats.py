@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+import time
+import typing as t
+from dataclasses import dataclass
+
+from .metrics import EVENTS, MetricsStore
+from .online_users import OnlineUsers
+from .utils import LoopMonitor, PeriodicTask
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StatsSnapshot:
+    """
+    The statistics shown on the dashboard, at a single point in time.
+
+    ## Attributes
+
+    `online_count`: Number of connected sessions.
+
+    `location_counts`: Number of sessions per location, as `(location, count)`
+        pairs sorted by location. See `OnlineUsers` for the location format.
+
+    `logins_per_minute`: Number of successful logins during the last minute.
+
+    `event_history`: How often each event happened in each of the last
+        `HISTORY_LENGTH` minutes, as `(event, counts)` pairs.
+
+    `loop_lag_counts`: How often the event loop lag fell into each of the
+        `LAG_BUCKETS`. The last entry counts everything above the largest
+        bucket.
+
+    `loop_lag_p99_ms`: The 99th percentile of the event loop lag, in
+        milliseconds.
+
+    `slow_callbacks`: How often the event loop was blocked for longer than the
+        monitor's threshold.
+    """
+
+    online_count: int
+    location_counts: tuple[tuple[str, int], ...]
+    logins_per_minute: int
+    event_history: tuple[tuple[str, tuple[int, ...]], ...]
+    loop_lag_counts: tuple[int, ...] = ()
+    loop_lag_p99_ms: int = 0
+    slow_callbacks: int = 0
+
+
+# Number of minutes of event history included in each snapshot
+HISTORY_LENGTH = 60
+
+# Upper bounds (in seconds) of the event loop lag buckets shown on the
+# dashboard
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+Subscriber = t.Callable[[StatsSnapshot], t.Awaitable[None]]
+
+
+def _without_loop_stats(snapshot: StatsSnapshot) -> StatsSnapshot:
+    """
+    Return the snapshot with the event loop statistics left out. The lag
+    histogram gains a sample several times per second, even while the app is
+    idle, so it would make every snapshot look new.
+    """
+    return dataclasses.replace(
+        snapshot,
+        loop_lag_counts=(),
+        loop_lag_p99_ms=0,
+        slow_callbacks=0,
+    )
+
+
+class StatsPublisher:
+    """
+    Periodically gathers the dashboard statistics and pushes them to all open
+    dashboards.
+
+    Statistics are gathered once per interval, no matter how many dashboards
+    are open. Subscribers are only notified if the statistics have actually
+    changed since the last time, so idle dashboards don't rebuild needlessly.
+
+    The event loop statistics are the exception. They change all the time, so
+    on their own they only cause a notification if the lag percentile or the
+    number of slow callbacks has changed, and at most once every
+    `lag_interval` seconds. Any other change publishes them along with it.
+
+    ## Attributes
+
+    `online_users`: Where to read the online users from.
+
+    `metrics`: Where to read the event counts from.
+
+    `loop_monitor`: Where to read the event loop lag from, if anywhere.
+
+    `interval`: Number of seconds between updates.
+
+    `lag_interval`: Minimum number of seconds between updates caused only by
+        changes to the event loop statistics.
+
+    `latest`: The most recently published snapshot.
+    """
+
+    def __init__(
+        self,
+        online_users: OnlineUsers,
+        metrics: MetricsStore,
+        interval: float = 2,
+        loop_monitor: LoopMonitor | None = None,
+        lag_interval: float = 30,
+    ) -> None:
+        self.online_users = online_users
+        self.metrics = metrics
+        self.loop_monitor = loop_monitor
+        self.interval = interval
+        self.lag_interval = lag_interval
+
+        self.latest = self.take_snapshot()
+        self._latest_hash = hash(_without_loop_stats(self.latest))
+        self._latest_published_at = time.monotonic()
+
+        self._subscribers: list[Subscriber] = []
+        self._task = PeriodicTask(self.publish, interval=interval)
+
+    def start(self) -> None:
+        """
+        Start publishing statistics in the background.
+        """
+        self._task.start()
+
+    async def stop(self) -> None:
+        """
+        Stop publishing statistics.
+        """
+        await self._task.stop()
+
+    def subscribe(self, subscriber: Subscriber) -> None:
+        """
+        Call `subscriber` with each new snapshot, until it is unsubscribed.
+        """
+        self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """
+        Stop calling `subscriber`. Does nothing if it isn't subscribed.
+        """
+        try:
+            self._subscribers.remove(subscriber)
+        except ValueError:
+            pass
+
+    def take_snapshot(self) -> StatsSnapshot:
+        """
+        Gather the current statistics.
+        """
+        loop_lag_counts: tuple[int, ...] = ()
+        loop_lag_p99_ms = 0
+        slow_callbacks = 0
+
+        if self.loop_monitor is not None:
+            histogram = self.loop_monitor.lag_histogram
+            cumulative = [0]
+
+            for _, count in histogram.cumulative_counts(LAG_BUCKETS):
+                cumulative.append(count)
+
+            cumulative.append(histogram.count)
+            loop_lag_counts = tuple(
+                current - previous
+                for previous, current in zip(cumulative, cumulative[1:])
+            )
+            loop_lag_p99_ms = round(histogram.percentile(99) * 1000)
+            slow_callbacks = self.loop_monitor.slow_callbacks
+
+        return StatsSnapshot(
+            online_count=self.online_users.count,
+            location_counts=tuple(sorted(self.online_users.snapshot().items())),
+            logins_per_minute=sum(self.metrics.series("login", "second", 60)),
+            event_history=tuple(
+                (event, tuple(self.metrics.series(event, "minute", HISTORY_LENGTH)))
+                for event in EVENTS
+            ),
+            loop_lag_counts=loop_lag_counts,
+            loop_lag_p99_ms=loop_lag_p99_ms,
+            slow_callbacks=slow_callbacks,
+        )
+
+    async def publish(self) -> None:
+        """
+        Gather the current statistics and pass them on to all subscribers, if
+        they have changed since the last time.
+        """
+        snapshot = self.take_snapshot()
+        snapshot_hash = hash(_without_loop_stats(snapshot))
+
+        # If nothing but the event loop statistics has changed, only pass on
+        # changes to the summary shown on the dashboard, and not too often
+        if snapshot_hash == self._latest_hash:
+            loop_stats = (snapshot.loop_lag_p99_ms, snapshot.slow_callbacks)
+            latest_loop_stats = (self.latest.loop_lag_p99_ms, self.latest.slow_callbacks)
+
+            if (
+                loop_stats == latest_loop_stats
+                or time.monotonic() - self._latest_published_at < self.lag_interval
+            ):
+                return
+
+        self.latest = snapshot
+        self._latest_hash = snapshot_hash
+        self._latest_published_at = time.monotonic()
+
+        results = await asyncio.gather(
+            *[subscriber(snapshot) for subscriber in list(self._subscribers)],
+            return_exceptions=True,
+        )
+
+        for result in results:
+            if isinstance(result, Exception):
+                _logger.error(
+                    "Failed to publish dashboard statistics",
+                    exc_info=result,
+                )
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import hashlib
 import os
 import secrets
 import uuid
@@ -9,6 +8,9 @@ from datetime import datetime, timezone
 
 import rio
 
+from . import password_hashing
+from .utils import instrumented
+
 
 @dataclass
 class UserSettings(rio.UserSettings):
@@ -63,6 +65,28 @@ class AppUser:
     password_hash: bytes
     password_salt: bytes
 
+    # How `password_hash` was computed: the algorithm and its parameters. See
+    # `password_hashing` for the format.
+    password_scheme: str = password_hashing.LEGACY_SCHEME
+
+    @property
+    def needs_rehash(self) -> bool:
+        """
+        Whether the password hash was computed using a different scheme than
+        the current one, and should be upgraded. This can only be done when
+        the user logs in, since the password is needed to compute the new
+        hash.
+        """
+        # Compare the parsed schemes rather than their text. The same scheme
+        # can be written in several ways, e.g. with its parameters in a
+        # different order, and that alone is no reason to rehash.
+        try:
+            scheme = password_hashing.parse_scheme(self.password_scheme)
+        except ValueError:
+            return True
+
+        return scheme != password_hashing.get_current_scheme()
+
     @classmethod
     def new_with_defaults(cls, username, password) -> AppUser:
         """
@@ -71,27 +95,89 @@ class AppUser:
         """
 
         password_salt = os.urandom(64)
+        scheme = password_hashing.get_current_scheme()
 
         return AppUser(
             id=uuid.uuid4(),
             username=username,
             created_at=datetime.now(timezone.utc),
-            password_hash=cls.get_password_hash(password, password_salt),
+            password_hash=scheme.hash(password, password_salt),
             password_salt=password_salt,
+            password_scheme=scheme.encode(),
         )
 
     @classmethod
-    def get_password_hash(cls, password, password_salt: bytes) -> bytes:
+    async def new_with_defaults_async(cls, username, password) -> AppUser:
         """
-        Compute the hash of a password using a given salt.
+        Like `new_with_defaults`, but the password is hashed in a worker
+        process, so the event loop stays responsive.
         """
-        return hashlib.pbkdf2_hmac(
-            "sha256",
-            password.encode("utf-8"),
-            password_salt,
-            100000,
+        password_salt = os.urandom(64)
+        scheme = password_hashing.get_current_scheme()
+
+        return AppUser(
+            id=uuid.uuid4(),
+            username=username,
+            created_at=datetime.now(timezone.utc),
+            password_hash=await scheme.hash_async(password, password_salt),
+            password_salt=password_salt,
+            password_scheme=scheme.encode(),
         )
 
+    @classmethod
+    def get_password_hash(
+        cls,
+        password,
+        password_salt: bytes,
+        password_scheme: str | None = None,
+    ) -> bytes:
+        """
+        Compute the hash of a password using a given salt. If no scheme is
+        given, the current one is used.
+        """
+        if password_scheme is None:
+            scheme = password_hashing.get_current_scheme()
+        else:
+            scheme = password_hashing.parse_scheme(password_scheme)
+
+        return scheme.hash(password, password_salt)
+
+    @classmethod
+    @instrumented("auth.get_password_hash")
+    async def get_password_hash_async(
+        cls,
+        password,
+        password_salt: bytes,
+        password_scheme: str | None = None,
+    ) -> bytes:
+        """
+        Compute the hash of a password using a given salt. If no scheme is
+        given, the current one is used. The work is done in a worker process
+        of the app's `HashingService`.
+        """
+        if password_scheme is None:
+            scheme = password_hashing.get_current_scheme()
+        else:
+            scheme = password_hashing.parse_scheme(password_scheme)
+
+        return await scheme.hash_async(password, password_salt)
+
+    async def rehash_password_async(self, password: str) -> None:
+        """
+        Recompute the password hash using the current scheme and a fresh salt.
+        Only the object is changed. Use `Persistence.update_password` to store
+        the new hash.
+
+        The password isn't checked, so make sure it's correct first.
+        """
+        password_salt = os.urandom(64)
+        scheme = password_hashing.get_current_scheme()
+
+        self.password_hash = await scheme.hash_async(password, password_salt)
+        self.password_salt = password_salt
+        self.password_scheme = scheme.encode()
+
+    @instrumented("auth.password_equals")
     def password_equals(self, password: str) -> bool:
         """
         Safely compare a password to the stored hash. This differs slightly from
@@ -99,5 +185,24 @@ class AppUser:
         """
         return secrets.compare_digest(
             self.password_hash,
-            self.get_password_hash(password, self.password_salt),
-        )
\ No newline at end of file
+            self.get_password_hash(
+                password,
+                self.password_salt,
+                self.password_scheme,
+            ),
+        )
+
+    @instrumented("auth.password_equals_async")
+    async def password_equals_async(self, password: str) -> bool:
+        """
+        Like `password_equals`, but the password is hashed in a worker process,
+        so the event loop stays responsive.
+        """
+        return secrets.compare_digest(
+            self.password_hash,
+            await self.get_password_hash_async(
+                password,
+                self.password_salt,
+                self.password_scheme,
+            ),
+        )
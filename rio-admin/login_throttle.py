@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import dataclasses
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .utils.config import get_setting
+
+
+@dataclass(frozen=True)
+class ThrottlePolicy:
+    """
+    How many login attempts a single account or IP address may make.
+
+    Attempts are limited by a token bucket: it holds up to `burst` tokens,
+    each attempt takes one, and tokens are refilled at `refill_per_second`.
+    This allows short bursts, but limits the sustained rate.
+
+    Additionally, repeated failures are met with exponential backoff. The
+    first `free_failures` failures in a row go unpunished. After that, each
+    further failure blocks all attempts for `base_delay` seconds, doubling
+    with every failure up to `max_delay`. Failures are forgotten after a
+    success, or after `max_delay` seconds without failure.
+
+    ## Attributes
+
+    `burst`: Number of attempts which may be made in quick succession.
+
+    `refill_per_second`: Number of attempts which may be made per second, in
+        the long run.
+
+    `free_failures`: Number of failures in a row before backoff kicks in.
+
+    `base_delay`: Number of seconds attempts are blocked after the first
+        punished failure.
+
+    `max_delay`: The longest attempts are ever blocked, in seconds.
+    """
+
+    burst: int
+    refill_per_second: float
+    free_failures: int
+    base_delay: float = 1
+    max_delay: float = 15 * 60
+
+    @classmethod
+    def from_settings(cls, name: str, default: ThrottlePolicy) -> ThrottlePolicy:
+        """
+        Read a policy from the app's settings. Each field is looked up as
+        `<name>_<field>` in the `[login_throttle]` section of `rio.toml`, e.g.
+        `ip_burst = 200`, or in the `RIO_ADMIN_LOGIN_THROTTLE_<NAME>_<FIELD>`
+        environment variable. Fields which aren't set keep their value from
+        `default`.
+
+        ## Raises
+
+        `ValueError`: If a setting isn't a number.
+        """
+        values = {}
+
+        for field in dataclasses.fields(cls):
+            key = f"{name}_{field.name}"
+            value = get_setting(
+                "login_throttle",
+                key,
+                env_var=f"RIO_ADMIN_LOGIN_THROTTLE_{key.upper()}",
+                default=str(getattr(default, field.name)),
+            )
+
+            # Annotations are strings, thanks to `from __future__ import
+            # annotations`
+            values[field.name] = int(value) if field.type == "int" else float(value)
+
+        return cls(**values)
+
+
+# Limits attempts per account and IP address, unless configured otherwise
+DEFAULT_ACCOUNT_POLICY = ThrottlePolicy(
+    burst=10,
+    refill_per_second=1 / 30,
+    free_failures=5,
+)
+
+# Limits attempts per IP address, unless configured otherwise
+DEFAULT_IP_POLICY = ThrottlePolicy(
+    burst=100,
+    refill_per_second=2,
+    free_failures=50,
+)
+
+
+@dataclass
+class _KeyState:
+    # Tokens left in the bucket, as of `updated_at`
+    tokens: float
+
+    # When `tokens` was last brought up to date, as `time.monotonic()`
+    updated_at: float
+
+    # Number of failures in a row, and when the last one happened
+    failures: int = 0
+    last_failure: float = 0
+
+    # Attempts are rejected until this time, as `time.monotonic()`
+    blocked_until: float = 0
+
+
+class LoginThrottle:
+    """
+    Rejects login attempts which come too often, before any work is spent on
+    them.
+
+    Verifying a password is deliberately slow. Without a limit, anyone trying
+    out lots of passwords, e.g. in a credential stuffing attack, gets to use up
+    all of the server's CPU. The throttle keeps track of attempts by client IP
+    address, and by account, i.e. username and IP address together. Each has
+    its own `ThrottlePolicy`, and attempts exceeding either are rejected.
+    Checking this takes next to no time, so rejected attempts cost almost
+    nothing.
+
+    Accounts are deliberately not limited across all addresses. Otherwise
+    anyone could lock a user out of their account, just by failing to log in
+    as them often enough. The flip side is that an attacker with many
+    addresses can spread guesses for a single account across them, limited
+    only by `ip_policy`.
+
+    All clients behind the same proxy or NAT share an address, so they also
+    share `ip_policy`'s limit. Make it generous enough for the largest group
+    of users expected behind a single address. If the app itself runs behind
+    a reverse proxy, make sure Rio sees the clients' addresses, not the
+    proxy's.
+
+    Only the `max_keys` most recently used accounts and IP addresses are
+    remembered, so memory use is bounded no matter how many an attacker tries.
+
+    ## Attributes
+
+    `account_policy`: Limits attempts per username and IP address.
+
+    `ip_policy`: Limits attempts per client IP address. This should be more
+        generous than `account_policy`, since many users may share an
+        address.
+
+    `max_keys`: Number of accounts and IP addresses kept track of.
+
+    `rejected`: Number of attempts rejected since the throttle was created.
+    """
+
+    def __init__(
+        self,
+        account_policy: ThrottlePolicy = DEFAULT_ACCOUNT_POLICY,
+        ip_policy: ThrottlePolicy = DEFAULT_IP_POLICY,
+        *,
+        max_keys: int = 100_000,
+    ) -> None:
+        self.account_policy = account_policy
+        self.ip_policy = ip_policy
+        self.max_keys = max_keys
+        self.rejected = 0
+
+        # Keyed by `("account", username, address)` or `("ip", address)`, in
+        # order of last use
+        self._states: OrderedDict[tuple[str, ...], _KeyState] = OrderedDict()
+
+    @classmethod
+    def from_settings(cls) -> LoginThrottle:
+        """
+        Create a throttle with the policies configured in the app's settings.
+        See `ThrottlePolicy.from_settings`. The account policy's settings are
+        prefixed with `account`, the IP address policy's with `ip`.
+
+        ## Raises
+
+        `ValueError`: If a setting isn't a number.
+        """
+        return cls(
+            account_policy=ThrottlePolicy.from_settings("account", DEFAULT_ACCOUNT_POLICY),
+            ip_policy=ThrottlePolicy.from_settings("ip", DEFAULT_IP_POLICY),
+        )
+
+    def _keys(self, username: str, ip: str) -> list[tuple[tuple[str, ...], ThrottlePolicy]]:
+        return [
+            (("account", username, ip), self.account_policy),
+            (("ip", ip), self.ip_policy),
+        ]
+
+    def _get_state(
+        self,
+        key: tuple[str, ...],
+        policy: ThrottlePolicy,
+        now: float,
+    ) -> _KeyState:
+        state = self._states.get(key)
+
+        if state is None:
+            state = _KeyState(tokens=policy.burst, updated_at=now)
+            self._states[key] = state
+
+            # Forget the least recently used key if there are too many
+            if len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+
+            # Refill the bucket for the time which has passed
+            state.tokens = min(
+                state.tokens + (now - state.updated_at) * policy.refill_per_second,
+                policy.burst,
+            )
+            state.updated_at = now
+
+        return state
+
+    def check(self, username: str, ip: str) -> float:
+        """
+        Register a login attempt. Returns `0` if it may go ahead, or otherwise
+        the number of seconds until the next attempt will be allowed.
+        """
+        now = time.monotonic()
+        retry_after = 0.0
+        states = []
+
+        for key, policy in self._keys(username, ip):
+            state = self._get_state(key, policy, now)
+            states.append(state)
+
+            retry_after = max(retry_after, state.blocked_until - now)
+
+            if state.tokens < 1:
+                retry_after = max(
+                    retry_after,
+                    (1 - state.tokens) / policy.refill_per_second,
+                )
+
+        if retry_after > 0:
+            self.rejected += 1
+            return retry_after
+
+        # Only attempts which go ahead take a token. Otherwise a client which
+        # keeps retrying would never be let through again.
+        for state in states:
+            state.tokens -= 1
+
+        return 0
+
+    def record_failure(self, username: str, ip: str) -> None:
+        """
+        Register a failed login attempt, e.g. due to a wrong password or an
+        unknown username.
+        """
+        now = time.monotonic()
+
+        for key, policy in self._keys(username, ip):
+            state = self._get_state(key, policy, now)
+
+            if now - state.last_failure > policy.max_delay:
+                state.failures = 0
+
+            state.failures += 1
+            state.last_failure = now
+
+            excess = state.failures - policy.free_failures
+
+            if excess > 0:
+                delay = min(
+                    policy.base_delay * 2 ** min(excess - 1, 32),
+                    policy.max_delay,
+                )
+                state.blocked_until = now + delay
+
+    def record_success(self, username: str, ip: str) -> None:
+        """
+        Register a successful login. This clears the account's failures. The
+        IP address's failures are kept, so an attacker can't reset them by
+        logging into an account of their own.
+        """
+        state = self._states.get(("account", username, ip))
+
+        if state is not None:
+            state.failures = 0
+            state.blocked_until = 0
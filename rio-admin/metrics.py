@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from . import persistence
+
+# The events which are recorded
+EVENTS = ("login", "sign_up", "session_start", "logout", "login_throttled")
+
+# The time resolutions events are counted at, as
+# `name -> (seconds per bucket, number of buckets kept)`
+RESOLUTIONS = {
+    "second": (1, 5 * 60),
+    "minute": (60, 24 * 60),
+    "hour": (60 * 60, 7 * 24),
+}
+
+# How long per-minute counts are kept in the database. They are only ever
+# loaded into the per-minute and per-hour buffers, so anything older than
+# those cover is of no use.
+HISTORY_SECONDS = max(
+    resolution * size
+    for name, (resolution, size) in RESOLUTIONS.items()
+    if name in ("minute", "hour")
+)
+
+# How often old counts are deleted from the database, in seconds
+PRUNE_INTERVAL = 60 * 60
+
+
+class RingCounter:
+    """
+    Counts events in fixed-size time buckets, keeping only the most recent
+    `size` buckets.
+
+    The counts are stored in a preallocated array which is used as a ring
+    buffer, so recording an event takes constant time and memory use never
+    grows.
+
+    ## Attributes
+
+    `resolution`: Length of each bucket in seconds.
+
+    `size`: Number of buckets kept.
+    """
+
+    def __init__(self, resolution: float, size: int) -> None:
+        self.resolution = resolution
+        self.size = size
+
+        # Each slot stores the count of one bucket, along with the number of
+        # that bucket. The number is used to detect slots holding a bucket
+        # which is so old that the ring has wrapped around since.
+        self._counts = array("q", [0] * size)
+        self._buckets = array("q", [-1] * size)
+
+    def add(self, timestamp: float, count: int = 1) -> None:
+        """
+        Count `count` events at the given UNIX timestamp.
+        """
+        bucket = int(timestamp // self.resolution)
+        slot = bucket % self.size
+
+        if self._buckets[slot] != bucket:
+            # Events older than the ring's contents are dropped
+            if self._buckets[slot] > bucket:
+                return
+
+            self._buckets[slot] = bucket
+            self._counts[slot] = 0
+
+        self._counts[slot] += count
+
+    def series(self, length: int, now: float | None = None) -> list[int]:
+        """
+        Return the counts of the last `length` buckets up to and including the
+        current one, oldest first.
+        """
+        if now is None:
+            now = time.time()
+
+        current = int(now // self.resolution)
+        result = []
+
+        for bucket in range(current - min(length, self.size) + 1, current + 1):
+            slot = bucket % self.size
+            result.append(self._counts[slot] if self._buckets[slot] == bucket else 0)
+
+        return result
+
+
+class MetricsStore:
+    """
+    Records app events like logins and sign-ups over time.
+
+    Events are counted in memory at several resolutions (per second, minute
+    and hour), each in a ring buffer of bounded size. Per-minute counts are
+    additionally written to the database in batches by `flush`, so history
+    survives restarts.
+
+    ## Attributes
+
+    `pers`: Where to store the history.
+    """
+
+    def __init__(self, pers: persistence.Persistence) -> None:
+        self.pers = pers
+
+        self._counters = {
+            event: {
+                name: RingCounter(resolution, size)
+                for name, (resolution, size) in RESOLUTIONS.items()
+            }
+            for event in EVENTS
+        }
+
+        # Per-minute counts which haven't been written to the database yet, as
+        # `(event, minute) -> count`
+        self._pending: dict[tuple[str, float], int] = {}
+
+        # When old counts were last deleted from the database, as a
+        # `time.monotonic` timestamp
+        self._last_pruned: float | None = None
+
+    def record(self, event: str, count: int = 1) -> None:
+        """
+        Record that `event` has just happened `count` times.
+        """
+        now = time.time()
+
+        for counter in self._counters[event].values():
+            counter.add(now, count)
+
+        key = (event, now // 60 * 60)
+        self._pending[key] = self._pending.get(key, 0) + count
+
+    def series(
+        self,
+        event: str,
+        resolution: str = "minute",
+        length: int = 60,
+    ) -> list[int]:
+        """
+        Return how often `event` happened in each of the last `length` time
+        buckets, oldest first.
+
+        ## Parameters
+
+        `event`: One of `EVENTS`.
+
+        `resolution`: One of `RESOLUTIONS`.
+
+        `length`: The number of buckets to return.
+        """
+        return self._counters[event][resolution].series(length)
+
+    async def flush(self) -> None:
+        """
+        Write all per-minute counts recorded since the last flush to the
+        database. Once an hour, counts which are too old to be loaded by
+        `load_history` are deleted as well.
+
+        If writing fails, the counts are kept, and written by the next flush.
+        """
+        if self._pending:
+            pending = self._pending
+            self._pending = {}
+
+            try:
+                await self.pers.add_event_counts(
+                    [(event, minute, count) for (event, minute), count in pending.items()]
+                )
+            except Exception:
+                # Merge the counts back into any recorded in the meantime.
+                # Cancellation is deliberately not handled here: the write may
+                # have been committed regardless, and retrying it would count
+                # the events twice.
+                for key, count in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + count
+
+                raise
+
+        now = time.monotonic()
+
+        if self._last_pruned is None or now - self._last_pruned >= PRUNE_INTERVAL:
+            await self.pers.delete_event_counts(
+                datetime.now(tz=timezone.utc) - timedelta(seconds=HISTORY_SECONDS)
+            )
+            self._last_pruned = now
+
+    async def load_history(self) -> None:
+        """
+        Fill the per-minute and per-hour buffers with counts stored in the
+        database, e.g. after a restart.
+        """
+        since = datetime.now(tz=timezone.utc) - timedelta(seconds=HISTORY_SECONDS)
+
+        for event, minute, count in await self.pers.get_event_counts(since):
+            if event not in self._counters:
+                continue
+
+            timestamp = minute.timestamp()
+            self._counters[event]["minute"].add(timestamp, count)
+            self._counters[event]["hour"].add(timestamp, count)
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import rio
+
+from .utils import IpLocation, geoip_service
+
+# Key used for sessions whose location couldn't be determined
+UNKNOWN_LOCATION = "?:Unknown"
+
+
+def _location_key(location: IpLocation) -> str:
+    """
+    Return the key under which sessions from `location` are counted.
+    """
+    if location.status != "found":
+        return UNKNOWN_LOCATION
+
+    return f"{location.flag}:{location.country}, {location.city}"
+
+
+class OnlineUsers:
+    """
+    Keeps track of all connected sessions and where they are connecting from.
+
+    Rather than walking all sessions each time the numbers are needed, the
+    counters are updated incrementally: once when a session connects and once
+    when it disconnects. Reading the current state is thus cheap, no matter how
+    many clients are connected.
+
+    Locations are keys of the form `"<flag>:<country>, <city>"`.
+    """
+
+    def __init__(self) -> None:
+        # The IP address and location of each connected session
+        self._session_ips: dict[rio.Session, str] = {}
+        self._session_locations: dict[rio.Session, str] = {}
+
+        # How many sessions are connected from each location
+        self._location_counts: dict[str, int] = {}
+
+    @property
+    def count(self) -> int:
+        """
+        The number of currently connected sessions.
+        """
+        return len(self._session_locations)
+
+    def add(self, rio_session: rio.Session) -> None:
+        """
+        Register a newly connected session.
+        """
+        if rio_session in self._session_locations:
+            return
+
+        ip = rio_session.client_ip
+        location = geoip_service.resolve_many([ip])[ip]
+
+        self._session_ips[rio_session] = ip
+        self._add_to_location(rio_session, _location_key(location))
+
+    def remove(self, rio_session: rio.Session) -> None:
+        """
+        Unregister a session which has disconnected.
+        """
+        if rio_session not in self._session_locations:
+            return
+
+        self._remove_from_location(rio_session)
+        del self._session_ips[rio_session]
+
+    async def refresh_locations(self) -> None:
+        """
+        Look up the locations of all connected sessions again. This is useful
+        after the GeoIP database has changed, e.g. once it has finished
+        downloading.
+        """
+        sessions = list(self._session_ips.items())
+        locations = await geoip_service.resolve_many_async(
+            ip for _, ip in sessions
+        )
+
+        for rio_session, ip in sessions:
+            # The session may have disconnected in the meantime
+            if rio_session not in self._session_locations:
+                continue
+
+            self._remove_from_location(rio_session)
+            self._add_to_location(rio_session, _location_key(locations[ip]))
+
+    def snapshot(self) -> dict[str, int]:
+        """
+        Return how many sessions are connected from each location.
+        """
+        return dict(self._location_counts)
+
+    def _add_to_location(self, rio_session: rio.Session, location: str) -> None:
+        self._session_locations[rio_session] = location
+        self._location_counts[location] = self._location_counts.get(location, 0) + 1
+
+    def _remove_from_location(self, rio_session: rio.Session) -> None:
+        location = self._session_locations.pop(rio_session)
+        remaining = self._location_counts[location] - 1
+
+        if remaining:
+            self._location_counts[location] = remaining
+        else:
+            del self._location_counts[location]
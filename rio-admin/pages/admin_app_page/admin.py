@@ -4,9 +4,9 @@ from pathlib import Path
 
 import rio
 
-from ...components import Dashboard
+from ...components import Dashboard, PerformancePanel, UsersTable
 from ...utils import px_to_rem
-from ... import data_models, persistence
+from ... import data_models, metrics, persistence
 
 SIDEBAR_BUTTONS = [
     {
@@ -17,6 +17,10 @@ SIDEBAR_BUTTONS = [
         "name": "Users",
         "icon": "material/person",
     },
+    {
+        "name": "Performance",
+        "icon": "material/speed",
+    },
     {
         "name": "Database",
         "icon": "material/database",
@@ -84,6 +88,7 @@ class AdminPage(rio.Component):
             user_session,
             new_valid_until=datetime.now(tz=timezone.utc),
         )
+        self.session[metrics.MetricsStore].record("logout")
 
         # Detach everything from the session. This informs all components that
         # nobody is logged in.
@@ -95,8 +100,6 @@ class AdminPage(rio.Component):
         self.session.navigate_to("/")
 
     def build(self) -> rio.Component:
-        print(self.session._app_server.sessions)
-
         return rio.Row(
             # Sidebar
             rio.Column(
@@ -150,6 +153,10 @@ class AdminPage(rio.Component):
                 (
                     Dashboard()
                     if self.active_tab == "Dashboard"
+                    else UsersTable()
+                    if self.active_tab == "Users"
+                    else PerformancePanel()
+                    if self.active_tab == "Performance"
                     else rio.Text(text=self.active_tab)
                 ),
             ),
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import logging
+import math
 import typing as t
 from dataclasses import KW_ONLY, field
 
 import rio
 
 from .. import components as comps
-from .. import data_models, persistence
+from .. import data_models, login_throttle, metrics, persistence
+
+_logger = logging.getLogger(__name__)
 
 
 def guard(event: rio.GuardEvent) -> str | None:
@@ -59,6 +63,18 @@ class LoginPage(rio.Component):
             self._currently_logging_in = True
             await self.force_refresh()
 
+            # Turn away clients which try too often, before spending any
+            # effort on them. Checking the password is expensive, so this is
+            # what keeps brute force attacks from overloading the server.
+            throttle = self.session[login_throttle.LoginThrottle]
+            client_ip = self.session.client_ip
+            retry_after = throttle.check(self.username, client_ip)
+
+            if retry_after > 0:
+                self.error_message = f"Too many login attempts. Please try again in {math.ceil(retry_after)} seconds."
+                self.session[metrics.MetricsStore].record("login_throttled")
+                return
+
             #  Try to find a user with this name
             pers = self.session[persistence.Persistence]
 
@@ -67,16 +83,33 @@ class LoginPage(rio.Component):
                     username=self.username
                 )
             except KeyError:
+                throttle.record_failure(self.username, client_ip)
                 self.error_message = "Invalid username. Please try again or create a new account."
                 return
 
             # Make sure their password matches
-            if not user_info.password_equals(self.password):
+            if not await user_info.password_equals_async(self.password):
+                throttle.record_failure(self.username, client_ip)
                 self.error_message = "Invalid password. Please try again or create a new account."
                 return
 
             # The login was successful
+            throttle.record_success(self.username, client_ip)
             self.error_message = ""
+            self.session[metrics.MetricsStore].record("login")
+
+            # Password hashes can only be recomputed while the password is
+            # known. If this one was computed using an outdated scheme, now is
+            # the time to upgrade it.
+            if user_info.needs_rehash:
+                try:
+                    await user_info.rehash_password_async(self.password)
+                    await pers.update_password(user_info)
+                except Exception:
+                    # The old hash still works, so let the user in regardless
+                    _logger.exception(
+                        "Couldn't upgrade the password hash of %r", user_info.username
+                    )
 
             # Create and store a session
             user_session = await pers.create_session(
@@ -0,0 +1,330 @@
+"""
+Password hashing schemes.
+
+Each user's password hash is stored along with the scheme it was computed
+with, e.g. `pbkdf2_sha256:iterations=100000` or `scrypt:n=16384,r=8,p=1`. This
+way the algorithm and its cost can be changed at any time: existing hashes
+remain verifiable using their own scheme, and are upgraded to the current one
+the next time their user logs in.
+
+The current scheme is read from the `RIO_ADMIN_PASSWORD_SCHEME` environment
+variable, or the `scheme` key in the `[passwords]` section of `rio.toml`. Use
+`calibrate` to find parameters which take a given amount of time on the
+current machine.
+"""
+
+from __future__ import annotations
+
+import abc
+import functools
+import hashlib
+import time
+import typing as t
+from dataclasses import dataclass
+
+from .utils import get_hashing_service, get_setting
+
+# The scheme all passwords were hashed with before schemes were stored. Users
+# created back then have this scheme in the database.
+LEGACY_SCHEME = "pbkdf2_sha256:iterations=100000"
+
+# Used for new hashes, unless configured otherwise
+DEFAULT_SCHEME = LEGACY_SCHEME
+
+# The largest `n` `ScryptScheme.calibrate` picks. At the default `r = 8`, each
+# hash then takes 128 MiB of memory.
+MAX_SCRYPT_N = 2**17
+
+# The most memory scrypt may be allowed to use. OpenSSL rejects any larger
+# limit.
+MAX_SCRYPT_MEMORY = 2**31 - 1
+
+
+class PasswordScheme(abc.ABC):
+    """
+    A key derivation function along with its parameters.
+
+    Schemes are written to the database as their `name`, followed by a colon
+    and their comma separated parameters. See `encode` and `parse_scheme`.
+    """
+
+    # Identifies the scheme in the database
+    name: t.ClassVar[str]
+
+    @abc.abstractmethod
+    def _derive(self, salt: bytes) -> t.Callable[[bytes], bytes]:
+        """
+        Return a function computing the hash of a password using the given
+        salt. It is sent to worker processes, so it must be picklable. Partial
+        applications of `hashlib` functions are.
+        """
+
+    @abc.abstractmethod
+    def parameters(self) -> dict[str, int]:
+        """
+        Return the scheme's parameters, as written to the database.
+        """
+
+    @classmethod
+    @abc.abstractmethod
+    def from_parameters(cls, parameters: dict[str, int]) -> PasswordScheme:
+        """
+        Create the scheme from the parameters written by `parameters`.
+
+        ## Raises
+
+        `ValueError`: If any parameters are missing, unknown or invalid.
+        """
+
+    @classmethod
+    @abc.abstractmethod
+    def calibrate(cls, target_seconds: float) -> PasswordScheme:
+        """
+        Choose parameters such that hashing a password takes about
+        `target_seconds` on the current machine.
+        """
+
+    def encode(self) -> str:
+        """
+        Return the scheme in the form stored in the database.
+        """
+        parameters = ",".join(f"{key}={value}" for key, value in self.parameters().items())
+        return f"{self.name}:{parameters}"
+
+    def hash(self, password: str, salt: bytes) -> bytes:
+        """
+        Compute the hash of a password using a given salt. This is slow by
+        design, so avoid calling it on the event loop. See `hash_async`.
+        """
+        return self._derive(salt)(password.encode("utf-8"))
+
+    async def hash_async(self, password: str, salt: bytes) -> bytes:
+        """
+        Like `hash`, but the work is done in a worker process of the app's
+        `HashingService`.
+        """
+        return await get_hashing_service().submit(
+            self._derive(salt),
+            password.encode("utf-8"),
+        )
+
+
+@dataclass(frozen=True)
+class Pbkdf2Scheme(PasswordScheme):
+    """
+    PBKDF2 with HMAC-SHA256. Its cost grows linearly with `iterations`.
+    """
+
+    name: t.ClassVar[str] = "pbkdf2_sha256"
+
+    iterations: int
+
+    def _derive(self, salt: bytes) -> t.Callable[[bytes], bytes]:
+        return functools.partial(
+            hashlib.pbkdf2_hmac,
+            "sha256",
+            salt=salt,
+            iterations=self.iterations,
+        )
+
+    def parameters(self) -> dict[str, int]:
+        return {"iterations": self.iterations}
+
+    @classmethod
+    def from_parameters(cls, parameters: dict[str, int]) -> Pbkdf2Scheme:
+        if set(parameters) != {"iterations"} or parameters["iterations"] < 1:
+            raise ValueError(f"Invalid {cls.name} parameters: {parameters}")
+
+        return cls(parameters["iterations"])
+
+    @classmethod
+    def calibrate(cls, target_seconds: float) -> Pbkdf2Scheme:
+        # Time a small number of iterations, and scale up. Keep doubling until
+        # the measurement is long enough to be reliable.
+        iterations = 1000
+
+        while True:
+            elapsed = _time_hash(cls(iterations))
+
+            if elapsed >= min(target_seconds, 0.05):
+                break
+
+            iterations *= 2
+
+        return cls(max(int(iterations * target_seconds / elapsed), 1))
+
+
+@dataclass(frozen=True)
+class ScryptScheme(PasswordScheme):
+    """
+    scrypt, a memory-hard function. Each hash needs `128 * n * r` bytes of
+    memory, which makes attacks on custom hardware expensive. `n` must be a
+    power of two. `p` runs the function that many times, increasing the cost
+    without needing more memory.
+    """
+
+    name: t.ClassVar[str] = "scrypt"
+
+    n: int
+    r: int = 8
+    p: int = 1
+
+    @property
+    def memory(self) -> int:
+        """
+        The number of bytes OpenSSL allocates for a hash: `n` blocks of
+        `128 * r` bytes, plus one block for each of the `p` runs, plus two.
+        """
+        return 128 * self.r * (self.n + self.p + 2)
+
+    def _derive(self, salt: bytes) -> t.Callable[[bytes], bytes]:
+        return functools.partial(
+            hashlib.scrypt,
+            salt=salt,
+            n=self.n,
+            r=self.r,
+            p=self.p,
+            # OpenSSL refuses to use more than 32 MiB by default. Allow as much
+            # as the parameters need, with some headroom, but no more than
+            # OpenSSL accepts as a limit.
+            maxmem=min(self.memory + 1024 * 1024, MAX_SCRYPT_MEMORY),
+        )
+
+    def parameters(self) -> dict[str, int]:
+        return {"n": self.n, "r": self.r, "p": self.p}
+
+    @classmethod
+    def from_parameters(cls, parameters: dict[str, int]) -> ScryptScheme:
+        if set(parameters) != {"n", "r", "p"}:
+            raise ValueError(f"Invalid {cls.name} parameters: {parameters}")
+
+        n, r, p = parameters["n"], parameters["r"], parameters["p"]
+
+        if n < 2 or n & (n - 1) or r < 1 or p < 1:
+            raise ValueError(f"Invalid {cls.name} parameters: {parameters}")
+
+        scheme = cls(n, r, p)
+
+        if scheme.memory > MAX_SCRYPT_MEMORY:
+            raise ValueError(
+                f"{cls.name} parameters need more than {MAX_SCRYPT_MEMORY} bytes"
+                f" of memory: {parameters}"
+            )
+
+        return scheme
+
+    @classmethod
+    def calibrate(cls, target_seconds: float) -> ScryptScheme:
+        # `n` has to be a power of two, so pick the largest one which still
+        # fits the target. Any remaining time is spent on `p`.
+        n = 1024
+
+        while n < MAX_SCRYPT_N and _time_hash(cls(n * 2)) <= target_seconds:
+            n *= 2
+
+        elapsed = _time_hash(cls(n))
+        p = max(int(target_seconds / elapsed), 1)
+
+        # Each run needs another block of memory, so `p` can't grow without
+        # bounds either. See `memory`.
+        max_p = MAX_SCRYPT_MEMORY // (128 * cls.r) - n - 2
+
+        return cls(n, p=min(p, max_p))
+
+
+def _time_hash(scheme: PasswordScheme) -> float:
+    start = time.perf_counter()
+    scheme.hash("calibration", b"\x00" * 64)
+    return time.perf_counter() - start
+
+
+# All supported schemes, by name
+SCHEMES: dict[str, type[PasswordScheme]] = {
+    scheme.name: scheme for scheme in (Pbkdf2Scheme, ScryptScheme)
+}
+
+
+@functools.lru_cache(maxsize=64)
+def parse_scheme(text: str) -> PasswordScheme:
+    """
+    Parse a scheme in the form stored in the database, e.g.
+    `scrypt:n=16384,r=8,p=1`.
+
+    ## Raises
+
+    `ValueError`: If the scheme is unknown or its parameters are invalid.
+    """
+    name, _, parameter_text = text.partition(":")
+
+    try:
+        scheme_type = SCHEMES[name]
+    except KeyError:
+        raise ValueError(f"Unknown password hashing scheme {name!r}") from None
+
+    parameters: dict[str, int] = {}
+
+    for item in filter(None, parameter_text.split(",")):
+        key, _, value = item.partition("=")
+
+        try:
+            parameters[key.strip()] = int(value)
+        except ValueError:
+            raise ValueError(f"Invalid password hashing scheme {text!r}") from None
+
+    return scheme_type.from_parameters(parameters)
+
+
+def calibrate(name: str, target_seconds: float) -> PasswordScheme:
+    """
+    Choose parameters for the named scheme such that hashing a password takes
+    about `target_seconds` on the current machine. Slower hashes are harder to
+    crack, but every login pays their cost, so this trades security against
+    how many logins per second the app can handle.
+
+    ## Raises
+
+    `ValueError`: If the scheme is unknown.
+    """
+    try:
+        scheme_type = SCHEMES[name]
+    except KeyError:
+        raise ValueError(f"Unknown password hashing scheme {name!r}") from None
+
+    return scheme_type.calibrate(target_seconds)
+
+
+# The scheme used for new hashes. Loaded from the configuration when first
+# needed.
+_current_scheme: PasswordScheme | None = None
+
+
+def get_current_scheme() -> PasswordScheme:
+    """
+    Return the scheme new password hashes should use.
+
+    ## Raises
+
+    `ValueError`: If the configured scheme is invalid.
+    """
+    global _current_scheme
+
+    if _current_scheme is None:
+        _current_scheme = parse_scheme(
+            get_setting(
+                "passwords",
+                "scheme",
+                env_var="RIO_ADMIN_PASSWORD_SCHEME",
+                default=DEFAULT_SCHEME,
+            )
+        )
+
+    return _current_scheme
+
+
+def set_current_scheme(scheme: PasswordScheme) -> None:
+    """
+    Change the scheme new password hashes use. Users with outdated hashes are
+    upgraded when they next log in.
+    """
+    global _current_scheme
+    _current_scheme = scheme
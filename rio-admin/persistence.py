@@ -1,10 +1,881 @@
+import abc
+import asyncio
+import json
+import logging
 import secrets
 import sqlite3
+import sys
+import typing as t
 import uuid
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 from . import data_models as data_models
+from . import password_hashing
+from .utils.config import get_setting
+from .utils.group_commit import GroupCommitQueue
+from .utils.instrumentation import instrumented
+from .utils.sqlite_pool import SqlitePool, SqliteTuning
+from .utils.ttl_cache import MISSING, TTLCache
+
+_logger = logging.getLogger(__name__)
+
+# Where the data is stored, unless configured otherwise. See
+# `load_database_url`.
+DEFAULT_DATABASE_URL = "sqlite:///db/user.db"
+
+
+class MigrationError(Exception):
+    """
+    Raised if the database can't be brought up to date automatically. The
+    message explains what needs to be fixed by hand.
+    """
+
+
+class UsernameTakenError(Exception):
+    """
+    Raised when creating a user whose username already belongs to another
+    user.
+    """
+
+
+def _check_usernames_unique(conn: sqlite3.Connection) -> None:
+    """
+    Make sure no two users share a username, so a unique index can be created.
+
+    Databases created before usernames had to be unique may contain
+    duplicates. Picking which of the accounts to keep can't be done
+    automatically, so the migration stops and lists them instead.
+
+    ## Raises
+
+    `MigrationError`: If there are duplicate usernames.
+    """
+    rows = conn.execute(
+        """
+        SELECT username, COUNT(*) FROM users
+        GROUP BY username
+        HAVING COUNT(*) > 1
+        ORDER BY username
+        LIMIT 20
+        """
+    ).fetchall()
+
+    if not rows:
+        return
+
+    duplicates = ", ".join(f"{username!r} ({count} users)" for username, count in rows)
+
+    raise MigrationError(
+        "Usernames have to be unique, but the database contains duplicates: "
+        f"{duplicates}. Rename or delete all but one user of each username, "
+        "e.g. using `sqlite3`, and start the app again."
+    )
+
+
+# The SQLite database schema is built up by these migrations, in order. Each entry
+# takes the schema from one version to the next, so the list index + 1 is the
+# version a database is at after the migration has run.
+#
+# Never modify or reorder migrations which have already been released. To
+# change the schema, append a new migration instead.
+#
+# Besides SQL statements, a migration may contain functions, which are called
+# with the connection at that point.
+MIGRATIONS: list[list[str | t.Callable[[sqlite3.Connection], None]]] = [
+    # Version 1: The 'users' and 'user_sessions' tables.
+    #
+    # We'll store dates as floats (UNIX timestamps), since SQLite doesn't have a
+    # native datetime type. Floats are easy to compare and convert, so they
+    # work well for this purpose.
+    #
+    # Databases created before migrations were introduced already contain
+    # these tables, hence the `IF NOT EXISTS`.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            password_hash BLOB NOT NULL,
+            password_salt BLOB NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            valid_until REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+    ],
+    # Version 2: Indexes for the lookups done during login and session
+    # handling. The username index also guarantees that usernames are unique.
+    [
+        _check_usernames_unique,
+        "CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users (username)",
+        "CREATE INDEX IF NOT EXISTS user_sessions_user_id ON user_sessions (user_id)",
+        "CREATE INDEX IF NOT EXISTS user_sessions_valid_until ON user_sessions (valid_until)",
+    ],
+    # Version 3: Index for paging through users in order of creation
+    [
+        "CREATE INDEX IF NOT EXISTS users_created_at_id ON users (created_at, id)",
+    ],
+    # Version 4: Per-minute event counts, e.g. of logins, for the dashboard's
+    # charts
+    [
+        """
+        CREATE TABLE IF NOT EXISTS event_counts (
+            event TEXT NOT NULL,
+            minute REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (event, minute)
+        ) WITHOUT ROWID
+        """,
+    ],
+    # Version 5: The scheme each password hash was computed with. All
+    # existing hashes were computed with the scheme used before this column
+    # existed.
+    [
+        f"""
+        ALTER TABLE users
+        ADD COLUMN password_scheme TEXT NOT NULL
+        DEFAULT '{password_hashing.LEGACY_SCHEME}'
+        """,
+    ],
+]
+
+# The columns of each table, in the order the row factories below expect them.
+# Queries always list their columns explicitly rather than relying on
+# `SELECT *`, so adding columns later can't break them.
+USER_COLUMNS = "id, username, created_at, password_hash, password_salt, password_scheme"
+SESSION_COLUMNS = "id, user_id, created_at, valid_until"
+
+# Users skipped by `create_users` are reported along with the field which was
+# already taken
+TakenField = t.Literal["username", "id"]
+
+
+def _user_from_row(cursor: sqlite3.Cursor, row: tuple) -> data_models.AppUser:
+    """
+    Row factory converting a row of `USER_COLUMNS` into an `AppUser`.
+    """
+    return data_models.AppUser(
+        id=uuid.UUID(row[0]),
+        username=row[1],
+        created_at=datetime.fromtimestamp(row[2], tz=timezone.utc),
+        password_hash=row[3],
+        password_salt=row[4],
+        password_scheme=row[5],
+    )
+
+
+def _session_from_row(
+    cursor: sqlite3.Cursor,
+    row: tuple,
+) -> data_models.UserSession:
+    """
+    Row factory converting a row of `SESSION_COLUMNS` into a `UserSession`.
+    """
+    return data_models.UserSession(
+        id=row[0],
+        user_id=uuid.UUID(row[1]),
+        created_at=datetime.fromtimestamp(row[2], tz=timezone.utc),
+        valid_until=datetime.fromtimestamp(row[3], tz=timezone.utc),
+    )
+
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """
+    Return the smallest string greater than every string starting with
+    `prefix`, or `None` if there is no such string.
+
+    Strings are compared by code point, which is how SQLite compares UTF-8
+    text by default.
+    """
+    # Characters which are already as large as possible can't be incremented.
+    # Drop them and increment the one before instead.
+    stripped = prefix.rstrip(chr(sys.maxunicode))
+
+    if not stripped:
+        return None
+
+    successor = ord(stripped[-1]) + 1
+
+    # Surrogates can't be encoded as UTF-8, so skip past them
+    if 0xD800 <= successor <= 0xDFFF:
+        successor = 0xE000
+
+    return stripped[:-1] + chr(successor)
+
+
+def _fetch_one(
+    conn: sqlite3.Connection,
+    sql: str,
+    parameters: t.Sequence[t.Any],
+    row_factory: t.Callable[[sqlite3.Cursor, tuple], t.Any],
+) -> t.Any:
+    """
+    Run a query and return its first row, converted using `row_factory`, or
+    `None` if there are no rows.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory
+    return cursor.execute(sql, parameters).fetchone()
+
+
+
+class PersistenceBackend(abc.ABC):
+    """
+    Stores users and sessions in some kind of database.
+
+    Backends only move data in and out of their database. Caching, batching of
+    session extensions and everything else shared between databases is done
+    by `Persistence`, which wraps a backend and is what the rest of the app
+    uses.
+
+    Lookups return `None` if nothing was found.
+    """
+
+    async def open(self) -> None:
+        """
+        Connect to the database and bring its schema up to date. Called once,
+        before any other method.
+        """
+
+    @abc.abstractmethod
+    async def close(self) -> None:
+        """
+        Close all database connections.
+        """
+
+    @abc.abstractmethod
+    async def create_user(self, user: data_models.AppUser) -> None:
+        """
+        Add a new user to the database.
+
+        ## Raises
+
+        `UsernameTakenError`: If another user already has the same username.
+        """
+
+    @abc.abstractmethod
+    async def create_users(
+        self,
+        users: t.Sequence[data_models.AppUser],
+    ) -> dict[str, TakenField]:
+        """
+        Add many users to the database in a single transaction. Users whose
+        username or ID is already taken, either by an existing user or by an
+        earlier user in `users`, are skipped. Returns a mapping from their
+        usernames to the field which was taken.
+        """
+
+    @abc.abstractmethod
+    async def get_user_by_username(
+        self,
+        username: str,
+    ) -> data_models.AppUser | None:
+        """
+        Retrieve a user by username.
+        """
+
+    @abc.abstractmethod
+    async def get_user_by_id(self, id: uuid.UUID) -> data_models.AppUser | None:
+        """
+        Retrieve a user by ID.
+        """
+
+    @abc.abstractmethod
+    async def update_password(self, user: data_models.AppUser) -> None:
+        """
+        Store a user's current password hash, salt and scheme.
+        """
+
+    @abc.abstractmethod
+    async def update_session_durations(
+        self,
+        updates: t.Sequence[tuple[str, datetime]],
+    ) -> list[str]:
+        """
+        Change when sessions expire, given as `(session_id, valid_until)`
+        pairs. All changes are written in one go.
+
+        Sessions which have already expired, e.g. because the user has logged
+        out, or which no longer exist are left alone. An extension which was
+        collected before the logout must not bring them back to life. Returns
+        the IDs of these sessions.
+        """
+
+    @abc.abstractmethod
+    async def write_sessions(
+        self,
+        created: t.Sequence[data_models.UserSession],
+        updated: t.Sequence[tuple[str, datetime]],
+    ) -> list[str]:
+        """
+        Add new sessions and change when existing ones expire, all in a single
+        transaction. New sessions are added first, so they can be updated in
+        the same call. Updates are applied in order.
+
+        Like `update_session_durations`, expired and missing sessions aren't
+        updated, and their IDs are returned.
+        """
+
+    @abc.abstractmethod
+    async def get_session_by_auth_token(
+        self,
+        auth_token: str,
+    ) -> data_models.UserSession | None:
+        """
+        Retrieve a session by its authentication token (session ID).
+        """
+
+    @abc.abstractmethod
+    def iter_all_users(
+        self,
+        batch_size: int,
+    ) -> t.AsyncIterator[data_models.AppUser]:
+        """
+        Yield all users, ordered by creation date, fetching `batch_size` users
+        at a time.
+        """
+
+    @abc.abstractmethod
+    def iter_users(
+        self,
+        *,
+        after: uuid.UUID | None,
+        limit: int,
+        username_prefix: str,
+    ) -> t.AsyncIterator[data_models.AppUser]:
+        """
+        Yield a page of users, ordered by creation date. See
+        `Persistence.iter_users`.
+        """
+
+    @abc.abstractmethod
+    async def add_event_counts(self, counts: list[tuple[str, float, int]]) -> None:
+        """
+        Add to the stored per-minute event counts. See
+        `Persistence.add_event_counts`.
+        """
+
+    @abc.abstractmethod
+    async def get_event_counts(
+        self,
+        since: datetime,
+    ) -> list[tuple[str, datetime, int]]:
+        """
+        Retrieve the per-minute event counts starting at `since`.
+        """
+
+    @abc.abstractmethod
+    async def delete_event_counts(self, before: datetime) -> int:
+        """
+        Delete the per-minute event counts older than `before`. Returns how
+        many were deleted.
+        """
+
+    @abc.abstractmethod
+    async def delete_expired_sessions(self, batch_size: int) -> int:
+        """
+        Delete up to `batch_size` expired sessions. Returns how many were
+        deleted.
+        """
+
+    async def checkpoint(self) -> None:
+        """
+        Do any periodic housekeeping the database needs. Does nothing unless
+        overridden.
+        """
+
+    async def enable_incremental_vacuum(self) -> None:
+        """
+        Prepare the database for `incremental_vacuum`. Does nothing unless
+        overridden.
+        """
+
+    async def incremental_vacuum(self, max_pages: int) -> None:
+        """
+        Return unused space to the operating system, if the database supports
+        it. Does nothing unless overridden.
+        """
+
+
+class SqliteBackend(PersistenceBackend):
+    """
+    Stores users and sessions in a local SQLite file.
+
+    User data is stored in the 'users' table, and session data is stored in the
+    'user_sessions' table. The schema is created and upgraded automatically
+    using the steps listed in `MIGRATIONS`.
+
+    Since the file is local, all app processes using it must run on the same
+    machine. Use `PostgresBackend` to spread the app over several machines.
+
+    ## Attributes
+
+    `db_path`: Path to the SQLite database file
+
+    `pool_size`: Number of reader connections. Queries never run on the event
+        loop itself, but on a pool of worker threads. Reads are spread across
+        `pool_size` connections, while all writes share a single dedicated
+        connection.
+
+    `tuning`: SQLite performance settings, such as the journal mode and cache
+        size, applied to every connection. See `SqliteTuning` for the
+        defaults.
+
+    ## Raises
+
+    `MigrationError`: If the database's schema can't be upgraded
+        automatically.
+    """
+
+    def __init__(
+        self,
+        db_path: Path = Path("./db/user.db"),
+        pool_size: int = 4,
+        tuning: SqliteTuning | None = None,
+    ) -> None:
+        self.pool = SqlitePool(db_path, pool_size=pool_size, tuning=tuning)
+
+        # Ensure the tables and indexes are up to date
+        try:
+            self._migrate()
+        except BaseException:
+            self.pool.close()
+            raise
+
+    async def close(self) -> None:
+        self.pool.close()
+
+    def _migrate(self) -> None:
+        """
+        Bring the database schema up to date by running all migrations which
+        haven't been applied yet. The current version is stored in the
+        'schema_version' table.
+        """
+
+        def get_version(conn: sqlite3.Connection) -> int:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"
+            )
+            row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+            return row[0] or 0
+
+        def apply(conn: sqlite3.Connection, version: int) -> None:
+            # Run each migration in a transaction of its own. If anything goes
+            # wrong, the database is left at the previous version.
+            conn.execute("BEGIN")
+
+            for statement in MIGRATIONS[version - 1]:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+
+            conn.execute("DELETE FROM schema_version")
+            conn.execute(
+                "INSERT INTO schema_version (version) VALUES (?)",
+                (version,),
+            )
+
+        current_version = self.pool.execute_sync(get_version)
+
+        for version in range(current_version + 1, len(MIGRATIONS) + 1):
+            self.pool.execute_sync(lambda conn: apply(conn, version))
+
+    async def create_user(self, user: data_models.AppUser) -> None:
+        # SQL command to insert a new user into the table. The pool commits the
+        # changes once the statement has run.
+        try:
+            await self.pool.write(
+                lambda conn: conn.execute(
+                    f"INSERT INTO users ({USER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        str(user.id),
+                        user.username,
+                        user.created_at.timestamp(),
+                        user.password_hash,
+                        user.password_salt,
+                        user.password_scheme,
+                    ),
+                )
+            )
+        except sqlite3.IntegrityError as err:
+            # The username index is the only constraint another user can
+            # violate. Someone else may have signed up with the same name
+            # since it was checked.
+            if "users.username" not in str(err):
+                raise
+
+            raise UsernameTakenError(user.username) from err
+
+    async def create_users(
+        self,
+        users: t.Sequence[data_models.AppUser],
+    ) -> dict[str, TakenField]:
+        def insert(conn: sqlite3.Connection) -> dict[str, TakenField]:
+            # Find the usernames and IDs which are already taken first. Since
+            # all writes go through this connection, nobody can take any of
+            # the others before the transaction is committed.
+            taken_usernames = {
+                row[0]
+                for row in conn.execute(
+                    "SELECT username FROM users WHERE username IN (SELECT value FROM json_each(?))",
+                    (json.dumps([user.username for user in users]),),
+                )
+            }
+            taken_ids = {
+                row[0]
+                for row in conn.execute(
+                    "SELECT id FROM users WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps([str(user.id) for user in users]),),
+                )
+            }
+
+            # Users earlier in the batch take their username and ID as well,
+            # so a later duplicate can't fail the entire transaction
+            skipped: dict[str, TakenField] = {}
+            rows = []
+
+            for user in users:
+                if user.username in taken_usernames:
+                    skipped[user.username] = "username"
+                    continue
+
+                if str(user.id) in taken_ids:
+                    skipped[user.username] = "id"
+                    continue
+
+                taken_usernames.add(user.username)
+                taken_ids.add(str(user.id))
+                rows.append(
+                    (
+                        str(user.id),
+                        user.username,
+                        user.created_at.timestamp(),
+                        user.password_hash,
+                        user.password_salt,
+                        user.password_scheme,
+                    )
+                )
+
+            conn.executemany(
+                f"INSERT INTO users ({USER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+            return skipped
+
+        return await self.pool.write(insert)
+
+    async def get_user_by_username(
+        self,
+        username: str,
+    ) -> data_models.AppUser | None:
+        # Look up the user in the database. The row factory wraps the first
+        # row of the result up in a neat Python class.
+        return await self.pool.read(
+            lambda conn: _fetch_one(
+                conn,
+                f"SELECT {USER_COLUMNS} FROM users WHERE username = ? LIMIT 1",
+                (username,),
+                _user_from_row,
+            )
+        )
+
+    async def get_user_by_id(self, id: uuid.UUID) -> data_models.AppUser | None:
+        # SQL command to get user by ID. Only the first row is of interest.
+        return await self.pool.read(
+            lambda conn: _fetch_one(
+                conn,
+                f"SELECT {USER_COLUMNS} FROM users WHERE id = ? LIMIT 1",
+                (str(id),),
+                _user_from_row,
+            )
+        )
+
+    async def update_password(self, user: data_models.AppUser) -> None:
+        await self.pool.write(
+            lambda conn: conn.execute(
+                """
+                UPDATE users
+                SET password_hash = ?, password_salt = ?, password_scheme = ?
+                WHERE id = ?
+                """,
+                (
+                    user.password_hash,
+                    user.password_salt,
+                    user.password_scheme,
+                    str(user.id),
+                ),
+            )
+        )
+
+    async def update_session_durations(
+        self,
+        updates: t.Sequence[tuple[str, datetime]],
+    ) -> list[str]:
+        return await self.pool.write(
+            lambda conn: self._write_session_durations(conn, updates)
+        )
+
+    async def write_sessions(
+        self,
+        created: t.Sequence[data_models.UserSession],
+        updated: t.Sequence[tuple[str, datetime]],
+    ) -> list[str]:
+        def write(conn: sqlite3.Connection) -> list[str]:
+            conn.executemany(
+                f"INSERT INTO user_sessions ({SESSION_COLUMNS}) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        session.id,
+                        str(session.user_id),
+                        session.created_at.timestamp(),
+                        session.valid_until.timestamp(),
+                    )
+                    for session in created
+                ],
+            )
+            return self._write_session_durations(conn, updated)
+
+        return await self.pool.write(write)
+
+    @staticmethod
+    def _write_session_durations(
+        conn: sqlite3.Connection,
+        updates: t.Sequence[tuple[str, datetime]],
+    ) -> list[str]:
+        # Only sessions which are still valid may be changed. Otherwise a
+        # delayed extension could undo a logout.
+        now = datetime.now(tz=timezone.utc).timestamp()
+        rejected = []
+
+        for session_id, valid_until in updates:
+            cursor = conn.execute(
+                """
+                UPDATE user_sessions
+                SET valid_until = ?
+                WHERE id = ? AND valid_until > ?
+                """,
+                (valid_until.timestamp(), session_id, now),
+            )
+
+            if cursor.rowcount == 0:
+                rejected.append(session_id)
+
+        return rejected
+
+    async def get_session_by_auth_token(
+        self,
+        auth_token: str,
+    ) -> data_models.UserSession | None:
+        # Query the database for the session. The row factory wraps the first
+        # row of the result up in a neat Python class.
+        return await self.pool.read(
+            lambda conn: _fetch_one(
+                conn,
+                f"SELECT {SESSION_COLUMNS} FROM user_sessions WHERE id = ? LIMIT 1",
+                (auth_token,),
+                _session_from_row,
+            )
+        )
+
+    async def iter_all_users(
+        self,
+        batch_size: int,
+    ) -> t.AsyncIterator[data_models.AppUser]:
+        async for batch in self.pool.iterate(
+            f"SELECT {USER_COLUMNS} FROM users ORDER BY created_at, id",
+            row_factory=_user_from_row,
+            batch_size=batch_size,
+        ):
+            for user in batch:
+                yield user
+
+    async def iter_users(
+        self,
+        *,
+        after: uuid.UUID | None,
+        limit: int,
+        username_prefix: str,
+    ) -> t.AsyncIterator[data_models.AppUser]:
+        conditions: list[str] = []
+        parameters: list[t.Any] = []
+
+        # Continue right after the given user. Comparing against the values
+        # stored in the database avoids any rounding issues from converting
+        # the timestamp back and forth.
+        if after is not None:
+            conditions.append(
+                "(created_at, id) > (SELECT created_at, id FROM users WHERE id = ?)"
+            )
+            parameters.append(str(after))
+
+        # Express the prefix as a range, so the username index can be used.
+        # (`LIKE` can't, since it is case-insensitive.)
+        if username_prefix:
+            conditions.append("username >= ?")
+            parameters.append(username_prefix)
+            upper_bound = _prefix_upper_bound(username_prefix)
+
+            if upper_bound is not None:
+                conditions.append("username < ?")
+                parameters.append(upper_bound)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        parameters.append(limit)
+
+        async for batch in self.pool.iterate(
+            f"SELECT {USER_COLUMNS} FROM users {where} ORDER BY created_at, id LIMIT ?",
+            parameters,
+            row_factory=_user_from_row,
+            batch_size=limit,
+        ):
+            for user in batch:
+                yield user
+
+    async def add_event_counts(self, counts: list[tuple[str, float, int]]) -> None:
+        await self.pool.write(
+            lambda conn: conn.executemany(
+                """
+                INSERT INTO event_counts (event, minute, count)
+                VALUES (?, ?, ?)
+                ON CONFLICT (event, minute) DO UPDATE
+                SET count = count + excluded.count
+                """,
+                counts,
+            )
+        )
+
+    async def get_event_counts(
+        self,
+        since: datetime,
+    ) -> list[tuple[str, datetime, int]]:
+        rows = await self.pool.read(
+            lambda conn: conn.execute(
+                """
+                SELECT event, minute, count FROM event_counts
+                WHERE minute >= ?
+                ORDER BY minute
+                """,
+                (since.timestamp(),),
+            ).fetchall()
+        )
+
+        return [
+            (event, datetime.fromtimestamp(minute, tz=timezone.utc), count)
+            for event, minute, count in rows
+        ]
+
+    async def delete_event_counts(self, before: datetime) -> int:
+        return await self.pool.write(
+            lambda conn: conn.execute(
+                "DELETE FROM event_counts WHERE minute < ?",
+                (before.timestamp(),),
+            ).rowcount
+        )
+
+    async def delete_expired_sessions(self, batch_size: int) -> int:
+        now = datetime.now(tz=timezone.utc)
+
+        cursor = await self.pool.write(
+            lambda conn: conn.execute(
+                """
+                DELETE FROM user_sessions
+                WHERE id IN (
+                    SELECT id FROM user_sessions
+                    WHERE valid_until < ?
+                    LIMIT ?
+                )
+                """,
+                (
+                    now.timestamp(),
+                    batch_size,
+                ),
+            )
+        )
+
+        return cursor.rowcount
+
+    async def checkpoint(self) -> None:
+        # In WAL mode, the log has to be copied back into the database file
+        # regularly. Otherwise it can keep growing while readers are busy.
+        await self.pool.checkpoint()
+
+    async def enable_incremental_vacuum(self) -> None:
+        def enable(conn: sqlite3.Connection) -> None:
+            # 2 means INCREMENTAL
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return
+
+            # The setting only takes effect once the database has been rebuilt.
+            # Even new databases need this, since enabling WAL mode already
+            # creates the file.
+            _logger.info(
+                "Rebuilding %s once to enable incremental vacuuming",
+                self.pool.db_path,
+            )
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+
+        await self.pool.write(enable)
+
+    async def incremental_vacuum(self, max_pages: int) -> None:
+        # `incremental_vacuum` returns one row per freed page, and only does
+        # its work while those rows are fetched.
+        await self.pool.write(
+            lambda conn: conn.execute(
+                f"PRAGMA incremental_vacuum({int(max_pages)})"
+            ).fetchall()
+        )
+
+
+def load_database_url(rio_toml: Path = Path("rio.toml")) -> str:
+    """
+    Return the URL of the database the app should use. The
+    `RIO_ADMIN_DATABASE_URL` environment variable takes precedence, followed
+    by the `url` key in the `[database]` section of `rio.toml`. If neither is
+    set, `DEFAULT_DATABASE_URL` is used.
+    """
+    return get_setting(
+        "database",
+        "url",
+        env_var="RIO_ADMIN_DATABASE_URL",
+        default=DEFAULT_DATABASE_URL,
+        rio_toml=rio_toml,
+    )
+
+
+def create_backend(url: str, **kwargs: t.Any) -> PersistenceBackend:
+    """
+    Create the backend for the database at the given URL. Any keyword
+    arguments are passed on to the backend.
+
+    Supported URLs are `sqlite:///<path>` (relative, or absolute with a fourth
+    slash) and `postgresql://...`. PostgreSQL requires the `asyncpg` package.
+
+    ## Raises
+
+    `ValueError`: If the URL's scheme isn't supported.
+    """
+    if url.startswith("sqlite:///"):
+        return SqliteBackend(Path(url.removeprefix("sqlite:///")), **kwargs)
+
+    if url.startswith(("postgres://", "postgresql://")):
+        # Only import the PostgreSQL backend if it's actually used, so
+        # `asyncpg` isn't needed otherwise
+        from .persistence_postgres import PostgresBackend
+
+        return PostgresBackend(url, **kwargs)
+
+    raise ValueError(f"Unsupported database URL: {url!r}")
 
 
 # Define the UserPersistence dataclass to handle database operations
@@ -12,77 +883,248 @@ class Persistence:
     """
     A class to handle database operations for users and sessions.
 
-    User data is stored in the 'users' table, and session data is stored in the
-    'user_sessions' table.
+    The actual database access is done by a `PersistenceBackend`, so the app
+    can store its data in SQLite (the default) or PostgreSQL. On top of the
+    backend, this class caches frequently used data and batches writes.
 
     You can adapt this class to your needs by adding more methods to interact
-    with the database or support different databases like MongoDB.
+    with the database, or support different databases like MongoDB by adding
+    another backend.
 
     ## Attributes
 
-    `db_path`: Path to the SQLite database file
+    `db_path`: Path to the SQLite database file. Ignored if `backend` is
+        given.
+
+    `pool_size`: Number of SQLite reader connections. Ignored if `backend` is
+        given.
+
+    `tuning`: SQLite performance settings. Ignored if `backend` is given.
+
+    `cache_size`: Maximum number of sessions and users kept in memory. Each
+        reconnecting client looks up its session and user, so caching them
+        saves a database round trip per connection.
+
+    `cache_ttl`: Number of seconds cached sessions and users are kept before
+        they are read from the database again. When running several app
+        processes, this is how long a change made by one of them may take to
+        show up in the others. A session which was logged out elsewhere is
+        dropped sooner, as soon as this process fails to extend it.
+
+    `write_behind`: If `True`, session extensions are not written to the
+        database right away. Instead they are collected and written in one go
+        every `flush_interval` seconds. Shortening a session, e.g. on logout,
+        is always written immediately.
+
+    `flush_interval`: Number of seconds between writes of collected session
+        extensions. Only used if `write_behind` is `True`.
+
+    `write_batch_delay`: New sessions, and session changes which are written
+        right away, are committed in batches (group commit): writes arriving
+        while another batch is being committed are gathered and committed
+        together. Callers still only return once their write has been
+        committed. If set, each batch additionally waits this many seconds for
+        more writes to join. See `GroupCommitQueue`.
+
+    `write_batch_size`: The most session writes committed together.
+
+    `backend`: Where to store the data. If not given, a `SqliteBackend` is
+        created from `db_path`, `pool_size` and `tuning`.
     """
 
-    def __init__(self, db_path: Path = Path("./db/user.db")) -> None:
+    def __init__(
+        self,
+        db_path: Path = Path("./db/user.db"),
+        pool_size: int = 4,
+        tuning: SqliteTuning | None = None,
+        cache_size: int = 10000,
+        cache_ttl: float = 5 * 60,
+        write_behind: bool = False,
+        flush_interval: float = 5,
+        write_batch_delay: float = 0,
+        write_batch_size: int = 256,
+        *,
+        backend: PersistenceBackend | None = None,
+    ) -> None:
         """
         Initialize the Persistence instance and ensure necessary tables exist.
         """
-        self.conn = sqlite3.connect(db_path)
-        self._create_user_table()  # Ensure the users table exists
-        self._create_session_table()  # Ensure the sessions table exists
-
-    def _create_user_table(self) -> None:
-        """
-        Create the 'users' table in the database if it does not exist. The table
-        stores user information including id, username, timestamps, and password
-        data.
-        """
-        # Create a cursor object to execute SQL commands
-        cursor = self.conn.cursor()
-
-        # We'll store dates as floats (UNIX timestamps), since SQLite doesn't
-        # have a native datetime type. Floats are easy to compare and convert,
-        # so they work well for this purpose.
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                username TEXT NOT NULL,
-                created_at REAL NOT NULL,
-                password_hash BLOB NOT NULL,
-                password_salt BLOB NOT NULL
-            )
-        """
+        if backend is None:
+            backend = SqliteBackend(db_path, pool_size=pool_size, tuning=tuning)
+
+        self.backend = backend
+
+        self._session_cache: TTLCache[str, data_models.UserSession] = TTLCache(
+            maxsize=cache_size,
+            ttl=cache_ttl,
+        )
+        self._user_cache: TTLCache[uuid.UUID, data_models.AppUser] = TTLCache(
+            maxsize=cache_size,
+            ttl=cache_ttl,
+        )
+
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+
+        # Session extensions which haven't been written yet, as a mapping from
+        # session IDs to their new `valid_until` timestamps
+        self._pending_extensions: dict[str, datetime] = {}
+        self._flush_task: asyncio.Task[None] | None = None
+
+        # Extensions currently being written. If writing them fails, those
+        # which haven't been superseded in the meantime are put back into
+        # `_pending_extensions`, to be retried with the next flush.
+        self._flushing_extensions: dict[str, datetime] = {}
+
+        # Sessions are created and updated during every login. Committing each
+        # of these writes on its own limits how many logins per second the
+        # database can take, so they are committed in batches instead. Each
+        # entry is either a new session, or a `(session_id, valid_until)`
+        # update.
+        self._session_writes: GroupCommitQueue[
+            data_models.UserSession | tuple[str, datetime]
+        ] = GroupCommitQueue(
+            self._write_session_batch,
+            max_delay=write_batch_delay,
+            max_batch_size=write_batch_size,
         )
 
-        # Commit the changes
-        self.conn.commit()
+    @classmethod
+    async def open(
+        cls,
+        url: str | None = None,
+        *,
+        backend_options: t.Mapping[str, t.Any] | None = None,
+        **kwargs: t.Any,
+    ) -> "Persistence":
+        """
+        Connect to the database at `url` and return a `Persistence` using it.
+        If no URL is given, it is read from the configuration using
+        `load_database_url`.
+
+        `backend_options` are passed on to the backend, e.g.
+        `{"pool_size": 8}` for SQLite or `{"max_pool_size": 20}` for
+        PostgreSQL. All other keyword arguments are passed on to the
+        constructor. The constructor's SQLite settings (`db_path`,
+        `pool_size` and `tuning`) don't apply here, since the backend is
+        created from the URL. Pass them as `backend_options` instead.
+        """
+        backend = create_backend(url or load_database_url(), **(backend_options or {}))
+        await backend.open()
+        return cls(backend=backend, **kwargs)
 
-    def _create_session_table(self) -> None:
+    @instrumented("persistence.close")
+    async def close(self) -> None:
         """
-        Create the 'user_sessions' table in the database if it does not exist.
-        The table stores session information including session id, user id, and
-        timestamps.
+        Write any pending changes and close all database connections.
         """
-        # Create a cursor object to execute SQL commands
-        cursor = self.conn.cursor()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
 
-        # Create the user_sessions table if it doesn't exist
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS user_sessions (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                created_at REAL NOT NULL,
-                valid_until REAL NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
+        try:
+            await self._session_writes.close()
+            await self.flush_session_writes()
+        finally:
+            await self.backend.close()
+
+    @instrumented("persistence.invalidate_session")
+    def invalidate_session(self, auth_token: str) -> None:
         """
-        )
+        Remove a session from the in-memory cache, forcing the next lookup to
+        hit the database.
+        """
+        self._session_cache.pop(auth_token)
+
+    @instrumented("persistence.invalidate_user")
+    def invalidate_user(self, id: uuid.UUID) -> None:
+        """
+        Remove a user from the in-memory cache, forcing the next lookup to hit
+        the database.
+        """
+        self._user_cache.pop(id)
+
+    def _take_pending_extensions(self) -> list[tuple[str, datetime]]:
+        pending = list(self._pending_extensions.items())
+        self._pending_extensions.clear()
+        return pending
+
+    @instrumented("persistence.flush_session_writes")
+    async def flush_session_writes(self) -> None:
+        """
+        Write all collected session extensions to the database. This is done
+        automatically every `flush_interval` seconds if `write_behind` is
+        enabled.
+        """
+        pending = self._take_pending_extensions()
+
+        if not pending:
+            return
+
+        self._flushing_extensions.update(pending)
+
+        try:
+            rejected = await self.backend.update_session_durations(pending)
+        except BaseException:
+            # Keep the extensions around, so the next flush tries again. Any
+            # which were superseded while writing have been removed from
+            # `_flushing_extensions`, and newer extensions take precedence.
+            for session_id, valid_until in pending:
+                if self._flushing_extensions.get(session_id) is valid_until:
+                    self._pending_extensions.setdefault(session_id, valid_until)
+
+            raise
+        finally:
+            for session_id, valid_until in pending:
+                if self._flushing_extensions.get(session_id) is valid_until:
+                    del self._flushing_extensions[session_id]
 
-        # Commit the changes
-        self.conn.commit()
+        self._forget_rejected_sessions(rejected)
 
+    def _forget_rejected_sessions(self, session_ids: t.Iterable[str]) -> None:
+        """
+        Drop sessions which the database refused to update from the cache. They
+        have expired, or were logged out, possibly by another app process whose
+        changes would otherwise only show up here once the cached copy
+        expires.
+        """
+        for session_id in session_ids:
+            self.invalidate_session(session_id)
+
+    @instrumented("persistence.write_session_batch")
+    async def _write_session_batch(
+        self,
+        writes: list[data_models.UserSession | tuple[str, datetime]],
+    ) -> None:
+        created = [write for write in writes if isinstance(write, data_models.UserSession)]
+        updated = [write for write in writes if isinstance(write, tuple)]
+        rejected = await self.backend.write_sessions(created, updated)
+        self._forget_rejected_sessions(rejected)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            # A failed flush, e.g. because the database is locked, must not
+            # end the task. The extensions are kept and retried next time.
+            try:
+                await self.flush_session_writes()
+            except Exception:
+                _logger.exception(
+                    "Failed to write %d session extensions. Retrying in %s seconds.",
+                    len(self._pending_extensions),
+                    self.flush_interval,
+                )
+
+    @instrumented("persistence.checkpoint")
+    async def checkpoint(self) -> None:
+        """
+        Do any periodic housekeeping the database needs, e.g. checkpointing
+        SQLite's write-ahead log.
+        """
+        await self.backend.checkpoint()
+
+    @instrumented("persistence.create_user", expected=(UsernameTakenError,))
     async def create_user(self, user: data_models.AppUser) -> None:
         """
         Add a new user to the database.
@@ -90,28 +1132,39 @@ class Persistence:
         ## Parameters
 
         `user`: The user object containing user details.
+
+        ## Raises
+
+        `UsernameTakenError`: If another user already has the same username.
         """
-        # Create a cursor object to execute SQL commands
-        cursor = self.conn.cursor()
-
-        # SQL command to insert a new user into the table
-        cursor.execute(
-            """
-            INSERT INTO users (id, username, created_at, password_hash, password_salt)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                str(user.id),
-                user.username,
-                user.created_at.timestamp(),
-                user.password_hash,
-                user.password_salt,
-            ),
-        )
+        await self.backend.create_user(user)
+
+    @instrumented("persistence.create_users")
+    async def create_users(
+        self,
+        users: t.Sequence[data_models.AppUser],
+    ) -> dict[str, TakenField]:
+        """
+        Add many users to the database at once. This is much faster than
+        calling `create_user` for each of them, since all users are written in
+        a single transaction. Users whose username or ID is already taken are
+        skipped. This includes users whose username or ID appeared earlier
+        in `users`.
+
+        Returns a mapping from the usernames of the skipped users to the field
+        which was already taken, i.e. `"username"` or `"id"`.
 
-        # Commit the changes
-        self.conn.commit()
+        ## Parameters
+
+        `users`: The users to add. Skipped users are reported by username, so
+            the usernames should be unique.
+        """
+        if not users:
+            return {}
 
+        return await self.backend.create_users(users)
+
+    @instrumented("persistence.get_user_by_username", expected=(KeyError,))
     async def get_user_by_username(
         self,
         username: str,
@@ -129,29 +1182,15 @@ class Persistence:
 
         `KeyError`: If there is no user with the specified username.
         """
-        # Look up the user in the database
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "SELECT * FROM users WHERE username = ? LIMIT 1",
-            (username,),
-        )
+        user = await self.backend.get_user_by_username(username)
 
-        # Get the first row from the result
-        row = cursor.fetchone()
-
-        # If a user was found, wrap it up in a neat Python class
-        if row:
-            return data_models.AppUser(
-                id=uuid.UUID(row[0]),
-                username=row[1],
-                created_at=datetime.fromtimestamp(row[2], tz=timezone.utc),
-                password_hash=row[3],
-                password_salt=row[4],
-            )
+        if user is not None:
+            return user
 
         # If no user was found, signal that with a KeyError
         raise KeyError(username)
 
+    @instrumented("persistence.get_user_by_id", expected=(KeyError,))
     async def get_user_by_id(
         self,
         id: uuid.UUID,
@@ -169,31 +1208,38 @@ class Persistence:
 
         `KeyError`: If there is no user with the specified ID.
         """
-        # Create a cursor object to execute SQL commands
-        cursor = self.conn.cursor()
+        # Users are looked up by ID each time a client reconnects. Try the
+        # cache first.
+        user = self._user_cache.get(id)
 
-        # SQL command to get user by ID
-        cursor.execute(
-            "SELECT * FROM users WHERE id = ? LIMIT 1",
-            (str(id),),
-        )
+        if user is not MISSING:
+            return user
 
-        # Get the first row from the result
-        row = cursor.fetchone()
-
-        # If a user was found, wrap it up in a neat Python class
-        if row:
-            return data_models.AppUser(
-                id=uuid.UUID(row[0]),
-                username=row[1],
-                created_at=datetime.fromtimestamp(row[2], tz=timezone.utc),
-                password_hash=row[3],
-                password_salt=row[4],
-            )
+        user = await self.backend.get_user_by_id(id)
+
+        if user is not None:
+            self._user_cache.set(id, user)
+            return user
 
         # If no user was found, signal that with a KeyError
         raise KeyError(id)
 
+    @instrumented("persistence.update_password")
+    async def update_password(self, user: data_models.AppUser) -> None:
+        """
+        Store a user's new password hash, e.g. after it was upgraded to the
+        current hashing scheme. The user's cached copy is dropped, so the next
+        lookup sees the change.
+
+        ## Parameters
+
+        `user`: The user, with the new `password_hash`, `password_salt` and
+            `password_scheme` already filled in.
+        """
+        await self.backend.update_password(user)
+        self.invalidate_user(user.id)
+
+    @instrumented("persistence.create_session")
     async def create_session(
         self,
         user_id: uuid.UUID,
@@ -217,25 +1263,17 @@ class Persistence:
             valid_until=now + timedelta(days=1),
         )
 
-        # Store the session in the database
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO user_sessions (id, user_id, created_at, valid_until)
-            VALUES (?, ?, ?, ?)
-            """,
-            (
-                session.id,
-                str(session.user_id),
-                session.created_at.timestamp(),
-                session.valid_until.timestamp(),
-            ),
-        )
-        self.conn.commit()
+        # Store the session in the database, along with any other sessions
+        # being created right now
+        await self._session_writes.submit(session)
+
+        # The client is about to use this session, so keep it around
+        self._session_cache.set(session.id, session)
 
         # Return the freshly created session
         return session
 
+    @instrumented("persistence.update_session_duration")
     async def update_session_duration(
         self,
         session: data_models.UserSession,
@@ -253,24 +1291,37 @@ class Persistence:
             considered valid.
         """
         # Update the session object
+        is_extension = new_valid_until >= session.valid_until
         session.valid_until = new_valid_until
 
-        # Commit the changes to persistence
-        cursor = self.conn.cursor()
-
-        cursor.execute(
-            """
-            UPDATE user_sessions
-            SET valid_until = ?
-            WHERE id = ?
-            """,
-            (
-                session.valid_until.timestamp(),
-                session.id,
-            ),
-        )
-        self.conn.commit()
+        # Sessions which are about to expire are no use to anyone. Drop them
+        # from the cache, so the next lookup sees the database's state.
+        if new_valid_until <= datetime.now(tz=timezone.utc):
+            self.invalidate_session(session.id)
+        else:
+            self._session_cache.set(session.id, session)
 
+        # If enabled, extensions are collected and written later. Only the
+        # latest extension of each session needs to be written.
+        if is_extension and self.write_behind:
+            self._pending_extensions[session.id] = new_valid_until
+
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_periodically())
+
+            return
+
+        # Any collected extension is now outdated. Make sure it can't overwrite
+        # this change later on, not even if it is being written right now and
+        # that fails.
+        self._pending_extensions.pop(session.id, None)
+        self._flushing_extensions.pop(session.id, None)
+
+        # Commit the changes to persistence, along with any other session
+        # writes happening right now
+        await self._session_writes.submit((session.id, new_valid_until))
+
+    @instrumented("persistence.get_session_by_auth_token", expected=(KeyError,))
     async def get_session_by_auth_token(
         self,
         auth_token: str,
@@ -288,26 +1339,150 @@ class Persistence:
         `KeyError`: If there is no session with the specified authentication
         token.
         """
-        # Create a cursor object to execute SQL commands
-        cursor = self.conn.cursor()
+        # Every connecting client looks up its session. Try the cache first.
+        session = self._session_cache.get(auth_token)
 
-        # Query the database for the session
-        cursor.execute(
-            "SELECT * FROM user_sessions WHERE id = ? ORDER BY created_at LIMIT 1",
-            (auth_token,),
-        )
+        if session is not MISSING:
+            return session
 
-        # Get the first row from the result
-        row = cursor.fetchone()
+        session = await self.backend.get_session_by_auth_token(auth_token)
 
-        # If a session was found, wrap it up in a neat Python class
-        if row:
-            return data_models.UserSession(
-                id=row[0],
-                user_id=uuid.UUID(row[1]),
-                created_at=datetime.fromtimestamp(row[2], tz=timezone.utc),
-                valid_until=datetime.fromtimestamp(row[3], tz=timezone.utc),
-            )
+        if session is not None:
+            self._session_cache.set(auth_token, session)
+            return session
 
         # If no session was found, signal that with a KeyError
-        raise KeyError(auth_token)
\ No newline at end of file
+        raise KeyError(auth_token)
+
+    @instrumented("persistence.iter_all_users")
+    async def iter_all_users(
+        self,
+        batch_size: int = 500,
+    ) -> t.AsyncIterator[data_models.AppUser]:
+        """
+        Yield all users in the database, ordered by creation date. Users are
+        fetched in batches, so memory use stays constant no matter how many
+        users there are.
+
+        ## Parameters
+
+        `batch_size`: How many users to fetch from the database at once.
+        """
+        async for user in self.backend.iter_all_users(batch_size):
+            yield user
+
+    @instrumented("persistence.iter_users")
+    async def iter_users(
+        self,
+        *,
+        after: uuid.UUID | None = None,
+        limit: int = 50,
+        username_prefix: str = "",
+    ) -> t.AsyncIterator[data_models.AppUser]:
+        """
+        Yield a page of users, ordered by creation date.
+
+        Pages are addressed by the last user of the previous page (keyset
+        pagination), rather than by an offset. This way fetching a page is
+        equally fast no matter how deep into the list it is.
+
+        ## Parameters
+
+        `after`: The ID of the last user on the previous page. If `None`, the
+            first page is returned.
+
+        `limit`: The maximum number of users to return.
+
+        `username_prefix`: Only return users whose username starts with this
+            prefix.
+        """
+        async for user in self.backend.iter_users(
+            after=after,
+            limit=limit,
+            username_prefix=username_prefix,
+        ):
+            yield user
+
+    @instrumented("persistence.add_event_counts")
+    async def add_event_counts(
+        self,
+        counts: list[tuple[str, float, int]],
+    ) -> None:
+        """
+        Add to the stored per-minute event counts. Counts for minutes which
+        already have an entry are added to the existing count.
+
+        ## Parameters
+
+        `counts`: `(event, minute, count)` tuples, where `minute` is the UNIX
+            timestamp of the start of the minute.
+        """
+        await self.backend.add_event_counts(counts)
+
+    @instrumented("persistence.get_event_counts")
+    async def get_event_counts(
+        self,
+        since: datetime,
+    ) -> list[tuple[str, datetime, int]]:
+        """
+        Retrieve the per-minute event counts starting at `since`, as
+        `(event, minute, count)` tuples ordered by time.
+
+        ## Parameters
+
+        `since`: The earliest minute to return.
+        """
+        return await self.backend.get_event_counts(since)
+
+    @instrumented("persistence.delete_event_counts")
+    async def delete_event_counts(self, before: datetime) -> int:
+        """
+        Delete the per-minute event counts older than `before`, which are no
+        longer needed. Returns the number of deleted counts.
+
+        ## Parameters
+
+        `before`: The earliest minute to keep.
+        """
+        return await self.backend.delete_event_counts(before)
+
+    @instrumented("persistence.delete_expired_sessions")
+    async def delete_expired_sessions(self, batch_size: int = 1000) -> int:
+        """
+        Delete sessions which are no longer valid from the database. At most
+        `batch_size` sessions are deleted, so the write lock is never held for
+        long. Returns the number of deleted sessions.
+
+        ## Parameters
+
+        `batch_size`: The maximum number of sessions to delete.
+        """
+        return await self.backend.delete_expired_sessions(batch_size)
+
+    @instrumented("persistence.enable_incremental_vacuum")
+    async def enable_incremental_vacuum(self) -> None:
+        """
+        Switch SQLite databases to `auto_vacuum = INCREMENTAL`, so
+        `incremental_vacuum` can return the space freed by deleted sessions to
+        the operating system. Other databases manage their space on their own,
+        and are left alone.
+
+        The setting only takes effect once the database has been rebuilt using
+        `VACUUM`. This happens once per database, on the writer thread, so the
+        event loop keeps running. It is instant for new databases, but on
+        large existing ones all writes wait until the rebuild is done.
+        """
+        await self.backend.enable_incremental_vacuum()
+
+    @instrumented("persistence.incremental_vacuum")
+    async def incremental_vacuum(self, max_pages: int = 1000) -> None:
+        """
+        Return up to `max_pages` free pages to the operating system. Only has
+        an effect on SQLite databases once `enable_incremental_vacuum` has
+        been called.
+
+        ## Parameters
+
+        `max_pages`: The maximum number of pages to free.
+        """
+        await self.backend.incremental_vacuum(max_pages)
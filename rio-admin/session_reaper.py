@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from . import persistence
+from .utils.periodic_task import PeriodicTask
+
+_logger = logging.getLogger(__name__)
+
+
+class SessionReaper(PeriodicTask):
+    """
+    Periodically deletes expired sessions from the database.
+
+    Sessions are never deleted when they expire or when users log out, so
+    without cleanup the 'user_sessions' table would grow forever. The reaper
+    removes expired sessions in small batches, so it never blocks other writes
+    for long. The first run happens right after the reaper is started.
+
+    ## Attributes
+
+    `pers`: The persistence instance to clean up.
+
+    `interval`: Number of seconds to wait between cleanup runs.
+
+    `batch_size`: Maximum number of sessions deleted per statement.
+
+    `vacuum`: Whether to return freed pages to the operating system after each
+        run. Before the first run, SQLite databases are set up for this using
+        `Persistence.enable_incremental_vacuum`, which rebuilds existing
+        databases once. Other databases manage their space on their own and
+        ignore this.
+
+    `last_removed`: Number of sessions removed by the most recent run.
+
+    `total_removed`: Number of sessions removed since the reaper was started.
+    """
+
+    def __init__(
+        self,
+        pers: persistence.Persistence,
+        *,
+        interval: float = 60 * 60,
+        batch_size: int = 1000,
+        vacuum: bool = False,
+    ) -> None:
+        super().__init__(self._reap, interval, immediately=True)
+
+        self.pers = pers
+        self.batch_size = batch_size
+        self.vacuum = vacuum
+
+        self.last_removed = 0
+        self.total_removed = 0
+
+        self._vacuum_enabled = False
+
+    async def run_once(self) -> int:
+        """
+        Delete all currently expired sessions, one batch at a time. Returns the
+        number of deleted sessions.
+        """
+        if self.vacuum and not self._vacuum_enabled:
+            await self.pers.enable_incremental_vacuum()
+            self._vacuum_enabled = True
+
+        removed = 0
+
+        while True:
+            batch = await self.pers.delete_expired_sessions(self.batch_size)
+            removed += batch
+
+            # A partial batch means there is nothing left to delete
+            if batch < self.batch_size:
+                break
+
+            # Give other writers a chance before the next batch
+            await asyncio.sleep(0)
+
+        if self.vacuum and removed:
+            await self.pers.incremental_vacuum()
+
+        self.last_removed = removed
+        self.total_removed += removed
+        return removed
+
+    async def _reap(self) -> None:
+        removed = await self.run_once()
+
+        if removed:
+            _logger.info("Deleted %d expired sessions", removed)
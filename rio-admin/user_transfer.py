@@ -0,0 +1,499 @@
+"""
+Bulk import and export of users.
+
+Creating users one at a time through `Persistence.create_user` commits each of
+them individually, which is far too slow to move a large user base into or
+out of the app. The functions here stream users from and to CSV or JSON Lines
+files instead, in chunks, so memory use stays constant no matter how large the
+file is.
+
+Both formats have the same fields:
+
+- `id`: The user's UUID. Optional on import, a new one is generated if missing.
+- `username`
+- `created_at`: ISO 8601 timestamp. Optional on import, defaults to now.
+- `password_hash` and `password_salt`: Hex encoded. Passwords are never
+  hashed during an import, so these must already have been computed.
+- `password_scheme`: How the hash was computed, e.g.
+  `pbkdf2_sha256:iterations=100000`. See `password_hashing`. Optional on
+  import, defaults to `password_hashing.LEGACY_SCHEME`. Users whose scheme
+  isn't the current one get their hash upgraded when they next log in.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import itertools
+import json
+import typing as t
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import data_models, password_hashing, persistence
+
+# The fields of each exported user, in order
+FIELDS = (
+    "id",
+    "username",
+    "created_at",
+    "password_hash",
+    "password_salt",
+    "password_scheme",
+)
+
+# Supported file formats, by file extension
+FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+}
+
+# Longest username accepted by an import
+MAX_USERNAME_LENGTH = 256
+
+# Why users skipped by `Persistence.create_users` are rejected, by the field
+# which was already taken
+TAKEN_REASONS: dict[persistence.TakenField, str] = {
+    "username": "The username is already taken",
+    "id": "The ID is already taken",
+}
+
+
+@dataclass
+class Rejection:
+    """
+    A record which couldn't be imported.
+
+    ## Attributes
+
+    `record_number`: Position of the record in the file, starting at 1. The
+        CSV header doesn't count. For JSON Lines, this is the line number.
+
+    `username`: The record's username, if it has one.
+
+    `reason`: Why the record was rejected.
+    """
+
+    record_number: int
+    username: str
+    reason: str
+
+
+@dataclass
+class ImportProgress:
+    """
+    How far an import has come.
+
+    ## Attributes
+
+    `read`: Number of records read from the file so far.
+
+    `imported`: Number of users added to the database so far.
+
+    `rejected`: Number of records which couldn't be imported so far.
+    """
+
+    read: int = 0
+    imported: int = 0
+    rejected: int = 0
+
+
+def format_from_path(path: Path) -> str:
+    """
+    Determine the file format from a path's extension.
+
+    ## Raises
+
+    `ValueError`: If the extension doesn't belong to a supported format.
+    """
+    try:
+        return FORMATS[path.suffix.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unsupported file type {path.suffix!r}. Use one of {', '.join(FORMATS)}."
+        ) from None
+
+
+def validate_username(username: str) -> str | None:
+    """
+    Check whether a username is acceptable. Returns the reason if it isn't,
+    `None` otherwise.
+    """
+    if not username.strip():
+        return "The username is empty"
+
+    if username != username.strip():
+        return "The username has leading or trailing whitespace"
+
+    if len(username) > MAX_USERNAME_LENGTH:
+        return f"The username is longer than {MAX_USERNAME_LENGTH} characters"
+
+    if not username.isprintable():
+        return "The username contains control characters"
+
+    return None
+
+
+@dataclass
+class _MalformedRecord:
+    """
+    Stands in for a record which couldn't be parsed at all.
+    """
+
+    reason: str
+
+
+def _read_records(
+    file: t.TextIO,
+    format: str,
+) -> t.Iterator[tuple[int, t.Any]]:
+    """
+    Yield the records of a file one at a time, along with their record
+    numbers.
+
+    A JSON Lines file is made up of independent lines, so a line which isn't
+    valid JSON is yielded as `_MalformedRecord` and reading continues. CSV
+    records can span several lines, so there is no telling where the next
+    one starts after an error. Those raise `csv.Error` instead.
+    """
+    if format == "csv":
+        yield from enumerate(csv.DictReader(file), start=1)
+        return
+
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as err:
+            yield line_number, _MalformedRecord(f"The line is not valid JSON: {err}")
+
+
+def _optional_string(record: dict[str, t.Any], field: str) -> str | None:
+    """
+    Return a field of an imported record, or `None` if the field is missing.
+
+    ## Raises
+
+    `ValueError`: If the field is present, but isn't a string.
+    """
+    value = record.get(field)
+
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"The field {field!r} is not a string")
+
+    return value
+
+
+def _user_from_record(record: t.Any) -> data_models.AppUser:
+    """
+    Convert an imported record into a user.
+
+    ## Raises
+
+    `ValueError`: If the record is invalid. The message says why.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("The record is not an object")
+
+    username = record.get("username")
+
+    if not isinstance(username, str):
+        raise ValueError("The username is missing")
+
+    reason = validate_username(username)
+
+    if reason is not None:
+        raise ValueError(reason)
+
+    # CSV fields are always strings (or `None` if missing), but JSON values can
+    # be anything. Check the types first, so a number where a string belongs
+    # rejects the record rather than aborting the import.
+    password_hash_hex = _optional_string(record, "password_hash")
+    password_salt_hex = _optional_string(record, "password_salt")
+
+    try:
+        password_hash = bytes.fromhex(password_hash_hex or "")
+        password_salt = bytes.fromhex(password_salt_hex or "")
+    except (TypeError, ValueError):
+        raise ValueError("The password hash or salt is not valid hex") from None
+
+    if not password_hash or not password_salt:
+        raise ValueError("The password hash or salt is missing")
+
+    password_scheme = (
+        _optional_string(record, "password_scheme") or password_hashing.LEGACY_SCHEME
+    )
+
+    try:
+        password_hashing.parse_scheme(password_scheme)
+    except ValueError:
+        raise ValueError("The password scheme is not supported") from None
+
+    id_text = _optional_string(record, "id")
+
+    try:
+        id = uuid.UUID(id_text) if id_text else uuid.uuid4()
+    except ValueError:
+        raise ValueError("The ID is not a valid UUID") from None
+
+    created_at_text = _optional_string(record, "created_at")
+
+    try:
+        created_at = (
+            datetime.fromisoformat(created_at_text)
+            if created_at_text
+            else datetime.now(timezone.utc)
+        )
+    except ValueError:
+        raise ValueError("The creation date is not a valid ISO 8601 timestamp") from None
+
+    # Timestamps without a timezone are taken to be UTC, like everywhere else
+    # in the app
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+
+    return data_models.AppUser(
+        id=id,
+        username=username,
+        created_at=created_at,
+        password_hash=password_hash,
+        password_salt=password_salt,
+        password_scheme=password_scheme,
+    )
+
+
+async def import_users(
+    pers: persistence.Persistence,
+    path: Path,
+    *,
+    format: str | None = None,
+    chunk_size: int = 5000,
+    on_progress: t.Callable[[ImportProgress], None] | None = None,
+    on_reject: t.Callable[[Rejection], None] | None = None,
+) -> ImportProgress:
+    """
+    Add all users in a CSV or JSON Lines file to the database.
+
+    The file is read `chunk_size` records at a time, and each chunk is written
+    in a single transaction. Invalid records, as well as users whose username
+    or ID is already taken, are skipped and reported to `on_reject`. Since every
+    chunk is committed on its own, an interrupted import can simply be run
+    again: users which made it into the database the first time around are
+    rejected as duplicates.
+
+    Returns the final counts.
+
+    ## Parameters
+
+    `pers`: Where to store the users.
+
+    `path`: The file to import.
+
+    `format`: Either `"csv"` or `"jsonl"`. Determined from the file extension
+        if not given.
+
+    `chunk_size`: How many records to write per transaction.
+
+    `on_progress`: Called after each chunk.
+
+    `on_reject`: Called for each record which couldn't be imported.
+
+
+    ## Raises
+
+    `ValueError`: If the format isn't supported, or the file isn't valid CSV.
+        Chunks read before the error remain imported. Malformed lines in a JSON
+        Lines file are rejected individually instead.
+    """
+    if format is None:
+        format = format_from_path(path)
+    elif format not in FORMATS.values():
+        raise ValueError(f"Unsupported format {format!r}")
+
+    progress = ImportProgress()
+
+    def reject(record_number: int, username: t.Any, reason: str) -> None:
+        progress.rejected += 1
+
+        if on_reject is not None:
+            on_reject(
+                Rejection(
+                    record_number,
+                    username if isinstance(username, str) else "",
+                    reason,
+                )
+            )
+
+    with path.open(newline="", encoding="utf-8") as file:
+        records = _read_records(file, format)
+
+        while True:
+            # Reading and parsing happens in a worker thread, so the event loop
+            # stays responsive if this runs inside the app
+            try:
+                chunk = await asyncio.to_thread(
+                    list, itertools.islice(records, chunk_size)
+                )
+            except csv.Error as err:
+                raise ValueError(
+                    f"{path} is not a valid {format} file: {err}"
+                ) from err
+
+            if not chunk:
+                break
+
+            progress.read += len(chunk)
+            users_by_name: dict[str, tuple[int, data_models.AppUser]] = {}
+            ids: set[uuid.UUID] = set()
+
+            for record_number, record in chunk:
+                if isinstance(record, _MalformedRecord):
+                    reject(record_number, None, record.reason)
+                    continue
+
+                try:
+                    user = _user_from_record(record)
+                except ValueError as err:
+                    username = record.get("username") if isinstance(record, dict) else None
+                    reject(record_number, username, str(err))
+                    continue
+
+                # Duplicates in earlier chunks are caught by the database.
+                # Within a chunk, only the first occurrence is kept.
+                if user.username in users_by_name:
+                    reject(record_number, user.username, "Duplicate username in the file")
+                    continue
+
+                if user.id in ids:
+                    reject(record_number, user.username, "Duplicate ID in the file")
+                    continue
+
+                users_by_name[user.username] = (record_number, user)
+                ids.add(user.id)
+
+            taken = await pers.create_users(
+                [user for _, user in users_by_name.values()]
+            )
+
+            for username, field in taken.items():
+                reject(
+                    users_by_name[username][0],
+                    username,
+                    TAKEN_REASONS[field],
+                )
+
+            progress.imported += len(users_by_name) - len(taken)
+
+            if on_progress is not None:
+                on_progress(progress)
+
+    return progress
+
+
+def _user_to_record(user: data_models.AppUser) -> dict[str, str]:
+    return {
+        "id": str(user.id),
+        "username": user.username,
+        "created_at": user.created_at.isoformat(),
+        "password_hash": user.password_hash.hex(),
+        "password_salt": user.password_salt.hex(),
+        "password_scheme": user.password_scheme,
+    }
+
+
+async def iter_export_lines(
+    pers: persistence.Persistence,
+    format: str,
+    *,
+    batch_size: int = 500,
+) -> t.AsyncIterator[str]:
+    """
+    Yield all users in the given format, one line at a time. For CSV the first
+    line is the header. Users are fetched from the database in batches, so
+    this works for any number of users.
+
+    ## Raises
+
+    `ValueError`: If the format isn't supported.
+    """
+    if format == "csv":
+        # The csv module only writes to files, so let it write each row to a
+        # buffer which is emptied right away
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS, lineterminator="\n")
+
+        def encode(record: dict[str, str]) -> str:
+            writer.writerow(record)
+            line = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return line
+
+        yield ",".join(FIELDS) + "\n"
+
+    elif format == "jsonl":
+
+        def encode(record: dict[str, str]) -> str:
+            return json.dumps(record) + "\n"
+
+    else:
+        raise ValueError(f"Unsupported format {format!r}")
+
+    async for user in pers.iter_all_users(batch_size=batch_size):
+        yield encode(_user_to_record(user))
+
+
+async def export_users(
+    pers: persistence.Persistence,
+    path: Path,
+    *,
+    format: str | None = None,
+    on_progress: t.Callable[[int], None] | None = None,
+) -> int:
+    """
+    Write all users to a CSV or JSON Lines file, which can be read by
+    `import_users`. Returns the number of exported users.
+
+    ## Parameters
+
+    `pers`: Where to read the users from.
+
+    `path`: The file to write. It is replaced if it exists.
+
+    `format`: Either `"csv"` or `"jsonl"`. Determined from the file extension
+        if not given.
+
+    `on_progress`: Called with the number of users exported so far, every
+        10000 users.
+
+
+    ## Raises
+
+    `ValueError`: If the format isn't supported.
+    """
+    if format is None:
+        format = format_from_path(path)
+
+    count = 0
+
+    with path.open("w", newline="", encoding="utf-8") as file:
+        lines = iter_export_lines(pers, format)
+
+        # Skip the CSV header, so only users are counted
+        if format == "csv":
+            file.write(await anext(lines))
+
+        async for line in lines:
+            file.write(line)
+            count += 1
+
+            if on_progress is not None and count % 10000 == 0:
+                on_progress(count)
+
+    return count
@@ -1,3 +1,30 @@
-from .downloader import download_large_file
-from .geoip2_with_flag import get_country_from_ip
+from .downloader import (
+    DownloadError,
+    DownloadProgress,
+    download_large_file,
+    download_with_retries,
+)
+from .geoip2_with_flag import (
+    GeoIPService,
+    IpLocation,
+    geoip_service,
+    get_country_from_ip,
+    is_database_ready,
+)
+from .config import get_bool_setting, get_setting
 from .px_to_rem import px_to_rem
+from .sqlite_pool import SqlitePool, SqliteTuning
+from .hashing_service import HashingService, get_hashing_service
+from .ttl_cache import MISSING, TTLCache
+from .periodic_task import PeriodicTask
+from .group_commit import GroupCommitQueue
+from .loop_monitor import LoopMonitor
+from .instrumentation import (
+    Instrumentation,
+    LatencyHistogram,
+    OperationSummary,
+    instrumentation,
+    instrumented,
+    measure,
+    serve_prometheus,
+)
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import tomlkit
+
+
+def get_setting(
+    section: str,
+    key: str,
+    *,
+    env_var: str,
+    default: str,
+    rio_toml: Path = Path("rio.toml"),
+) -> str:
+    """
+    Look up a setting of the app. The environment variable `env_var` takes
+    precedence, followed by `key` in the `[section]` of `rio.toml`. If
+    neither is set, `default` is returned.
+    """
+    value = os.environ.get(env_var)
+
+    if value:
+        return value
+
+    try:
+        with rio_toml.open() as f:
+            config = tomlkit.load(f).unwrap()
+    except FileNotFoundError:
+        return default
+
+    value = config.get(section, {}).get(key)
+
+    # Careful not to replace a `false` or `0` in the file with the default
+    if value is None or value == "":
+        return default
+
+    return value
+
+
+def get_bool_setting(
+    section: str,
+    key: str,
+    *,
+    env_var: str,
+    default: bool,
+    rio_toml: Path = Path("rio.toml"),
+) -> bool:
+    """
+    Like `get_setting`, but for settings which are either on or off. `true`,
+    `yes`, `on` and `1` turn the setting on, anything else turns it off.
+    """
+    value = get_setting(
+        section,
+        key,
+        env_var=env_var,
+        default=str(default),
+        rio_toml=rio_toml,
+    )
+    return str(value).strip().lower() in ("true", "yes", "on", "1")
@@ -1,27 +1,562 @@
-from tqdm import tqdm
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import typing as t
+from dataclasses import dataclass
+
 import httpx
 
+_logger = logging.getLogger(__name__)
+
+# Called with the number of bytes downloaded so far and the total size of the
+# file, if known
+ProgressCallback = t.Callable[[int, int | None], None]
+
+# How often the progress of a parallel download is written to disk, in
+# seconds. Saving after every chunk would rewrite the progress file thousands
+# of times for a large download. Recording less progress than was actually
+# written is harmless - a resumed download just fetches those bytes again.
+PROGRESS_SAVE_INTERVAL = 1.0
+
+
+class DownloadError(Exception):
+    """
+    Raised if a download finished, but the result doesn't match what was
+    expected.
+    """
+
+
+@dataclass
+class DownloadProgress:
+    """
+    Keeps track of how far along a download is. Pass its `update` method as
+    `on_progress` to `download_large_file`.
+    """
+
+    downloaded: int = 0
+    total: int | None = None
+
+    @property
+    def fraction(self) -> float | None:
+        """
+        How much of the file has been downloaded, from 0 to 1, or `None` if the
+        total size isn't known.
+        """
+        if not self.total:
+            return None
+
+        return min(self.downloaded / self.total, 1)
+
+    def update(self, downloaded: int, total: int | None) -> None:
+        self.downloaded = downloaded
+        self.total = total
+
+
+def _get_total_size(response: httpx.Response, offset: int) -> int | None:
+    """
+    Return the size of the complete file, as reported by the server, or `None`
+    if the server didn't say.
+    """
+    # Partial responses report the total in `Content-Range`, e.g.
+    # `bytes 100-999/1000`
+    content_range = response.headers.get("Content-Range")
+
+    if content_range is not None:
+        total = content_range.rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+
+    content_length = response.headers.get("Content-Length")
+
+    if content_length is not None:
+        return offset + int(content_length)
+
+    return None
+
+
+def _sha256_of_file(path: str, chunk_size: int) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+async def _probe_range_support(client: httpx.AsyncClient, url: str) -> int | None:
+    """
+    Return the size of the file at `url` if the server supports range
+    requests for it, and `None` otherwise.
+    """
+    # Ask for just the first byte. Servers supporting ranges answer with a
+    # partial response, which also reveals the total size.
+    async with client.stream("GET", url, headers={"Range": "bytes=0-0"}) as response:
+        response.raise_for_status()
+
+        if response.status_code != 206:
+            return None
+
+        return _get_total_size(response, 0)
+
+
+async def _download_single(
+    client: httpx.AsyncClient,
+    url: str,
+    partial_path: str,
+    chunk_size: int,
+    on_progress: ProgressCallback | None,
+) -> int | None:
+    """
+    Download the file in a single stream, resuming the partial file if there
+    is one. Returns the total size reported by the server, if any.
+    """
+    # Resume where a previous attempt left off
+    offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    async with client.stream("GET", url, headers=headers) as response:
+        # The partial file is already complete, or larger than the actual
+        # file. Either way, it can't be trusted - start over.
+        if response.status_code == 416:
+            restart = True
+        else:
+            restart = False
+            response.raise_for_status()
+
+            # If the server ignored the range, it sends the whole file
+            if response.status_code != 206:
+                offset = 0
+
+            total = _get_total_size(response, offset)
+            downloaded = offset
+
+            with open(partial_path, "ab" if offset else "wb") as f:
+                async for chunk in response.aiter_bytes(chunk_size=chunk_size):
+                    # Writing to disk can block for a long time, e.g. on a
+                    # slow or busy drive. Don't stall the event loop meanwhile.
+                    await asyncio.to_thread(f.write, chunk)
+                    downloaded += len(chunk)
+
+                    if on_progress is not None:
+                        on_progress(downloaded, total)
+
+    if restart:
+        os.remove(partial_path)
+        return await _download_single(
+            client,
+            url,
+            partial_path,
+            chunk_size,
+            on_progress,
+        )
+
+    return total
+
+
+def _write_and_flush(f: t.BinaryIO, chunk: bytes) -> None:
+    f.write(chunk)
+    f.flush()
+
+
+def _progress_path(partial_path: str) -> str:
+    """
+    Return where the per-segment progress of a parallel download into
+    `partial_path` is kept.
+    """
+    return partial_path + ".progress"
+
+
+def _remove_partial(partial_path: str) -> None:
+    """
+    Delete a partial download along with its progress file, if any, so the
+    next attempt starts over.
+    """
+    for path in (partial_path, _progress_path(partial_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _load_segments(progress_path: str, total: int) -> list[list[int]] | None:
+    """
+    Read the progress of an interrupted parallel download, as written by
+    `_save_segments`. Returns `None` if there is none, or if it doesn't fit a
+    file of `total` bytes.
+    """
+    try:
+        with open(progress_path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        if data["total"] != total:
+            return None
+
+        segments = [
+            [int(start), int(end), int(received)]
+            for start, end, received in data["segments"]
+        ]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+    # The segments must cover the whole file, in order
+    position = 0
+
+    for start, end, received in segments:
+        if start != position or end < start or not 0 <= received <= end - start + 1:
+            return None
+
+        position = end + 1
+
+    return segments if position == total else None
+
+
+def _save_segments(progress_path: str, total: int, segments: list[list[int]]) -> None:
+    """
+    Record how many bytes of each segment have been written. Each segment is
+    stored as `[start, end, received]`.
+    """
+    # Write to a temporary file first, so an interruption can't leave a
+    # half-written progress file behind
+    temporary_path = progress_path + ".tmp"
+
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump({"total": total, "segments": segments}, f)
+
+    os.replace(temporary_path, progress_path)
+
+
+async def _download_parallel(
+    client: httpx.AsyncClient,
+    url: str,
+    partial_path: str,
+    total: int,
+    connections: int,
+    chunk_size: int,
+    on_progress: ProgressCallback | None,
+) -> None:
+    """
+    Download the file using `connections` concurrent range requests, each
+    writing its own segment of the file.
+
+    The partial file is preallocated, so its size says nothing about how much
+    has been downloaded. Instead, the progress of each segment is recorded in
+    a separate file as data arrives. An interrupted download picks up each
+    segment where it left off.
+    """
+    progress_path = _progress_path(partial_path)
+    segments = _load_segments(progress_path, total)
+
+    if (
+        segments is None
+        or not os.path.exists(partial_path)
+        or os.path.getsize(partial_path) != total
+    ):
+        segment_size = -(-total // connections)
+        segments = [
+            [start, min(start + segment_size, total) - 1, 0]
+            for start in range(0, total, segment_size)
+        ]
+
+        # Preallocate the file, so every segment can be written at its final
+        # position right away
+        with open(partial_path, "wb") as f:
+            f.truncate(total)
+
+        _save_segments(progress_path, total, segments)
+
+    downloaded = sum(received for _, _, received in segments)
+    last_saved = time.monotonic()
+
+    def save_progress_throttled() -> None:
+        nonlocal last_saved
+
+        now = time.monotonic()
+
+        if now - last_saved >= PROGRESS_SAVE_INTERVAL:
+            _save_segments(progress_path, total, segments)
+            last_saved = now
+
+    async def download_segment(segment: list[int]) -> None:
+        nonlocal downloaded
+
+        start, end, received = segment
+        length = end - start + 1
+
+        if received == length:
+            return
+
+        async with client.stream(
+            "GET",
+            url,
+            headers={"Range": f"bytes={start + received}-{end}"},
+        ) as response:
+            response.raise_for_status()
+
+            if response.status_code != 206:
+                raise DownloadError(f"Server ignored the requested range: {url}")
+
+            with open(partial_path, "r+b") as f:
+                f.seek(start + received)
+
+                async for chunk in response.aiter_bytes(chunk_size=chunk_size):
+                    # Anything beyond the segment would overwrite the next one
+                    if len(chunk) > length - segment[2]:
+                        raise DownloadError(
+                            f"Received more than the requested range {start}-{end}: {url}"
+                        )
+
+                    # Only record data as received once it has been handed to
+                    # the operating system. A resumed download must never skip
+                    # data which didn't make it into the file.
+                    #
+                    # The write happens in a thread, so a slow drive doesn't
+                    # stall the event loop.
+                    await asyncio.to_thread(_write_and_flush, f, chunk)
+                    segment[2] += len(chunk)
+                    downloaded += len(chunk)
+                    save_progress_throttled()
+
+                    if on_progress is not None:
+                        on_progress(downloaded, total)
+
+        # The file was preallocated, so its size says nothing about whether
+        # all data has arrived. Check each segment instead.
+        if segment[2] != length:
+            raise DownloadError(
+                f"Expected {length} bytes for range {start}-{end}, but got {segment[2]}: {url}"
+            )
+
+    tasks = [asyncio.create_task(download_segment(segment)) for segment in segments]
 
-def download_large_file(url: str, destination: str, chunk_size: int = 1024 * 1024) -> None:
     try:
-        with httpx.stream("GET", url) as response:
-            response.raise_for_status()  # Ensure the request was successful
-            total = int(response.headers.get("Content-Length", 0))
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # If one segment fails, or the download is cancelled, stop all others
+        # too. Otherwise they would keep writing to the file in the
+        # background.
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        # Progress is only saved every so often while data arrives. Record
+        # everything received before giving up, so a resumed download doesn't
+        # fetch it again.
+        _save_segments(progress_path, total, segments)
+
+
+async def download_large_file(
+    url: str,
+    destination: str,
+    chunk_size: int = 1024 * 1024,
+    *,
+    connections: int = 1,
+    expected_size: int | None = None,
+    expected_sha256: str | None = None,
+    on_progress: ProgressCallback | None = None,
+    client: httpx.AsyncClient | None = None,
+) -> None:
+    """
+    Download a file without blocking the event loop.
+
+    The data is first written to `<destination>.part`, and only moved to
+    `destination` once the download is complete and verified. Thus
+    `destination` either doesn't exist or contains the complete file.
+
+    With a single connection, an interrupted download is resumed where it left
+    off, provided the server supports range requests. With multiple
+    connections, the file is split into segments which are downloaded
+    concurrently. Their progress is kept in `<destination>.part.progress`, so
+    an interrupted parallel download is resumed as well. If the server doesn't
+    support range requests, this falls back to a single connection.
+
+    ## Parameters
+
+    `url`: The URL to download.
+
+    `destination`: Where to store the downloaded file.
+
+    `chunk_size`: How many bytes to read from the network at once.
+
+    `connections`: How many concurrent requests to use.
+
+    `expected_size`: The size of the file in bytes. If not given, the size
+        reported by the server is used, if any.
+
+    `expected_sha256`: The hex-encoded SHA-256 hash of the file. If given, the
+        download is rejected if the hash doesn't match.
+
+    `on_progress`: Called with the number of bytes downloaded so far and the
+        total size of the file (if known) each time data arrives.
+
+    `client`: The HTTP client to use. If not given, a new one is created for
+        the download.
 
-            with tqdm(total=total, unit="B", unit_scale=True, desc="Downloading") as pbar:
-                with open(destination, "wb") as f:
-                    for chunk in response.iter_bytes(chunk_size=chunk_size):
-                        f.write(chunk)
-                        pbar.update(len(chunk))
 
-        print(f"\nDownload complete: {destination}")
+    ## Raises
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    `httpx.HTTPError`: If the request fails.
+
+    `DownloadError`: If the downloaded file doesn't match the expected size or
+        hash. The partial file is removed, so the next attempt starts over.
+    """
+    if client is None:
+        async with httpx.AsyncClient(
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=max(connections, 1)),
+        ) as client:
+            await download_large_file(
+                url,
+                destination,
+                chunk_size,
+                connections=connections,
+                expected_size=expected_size,
+                expected_sha256=expected_sha256,
+                on_progress=on_progress,
+                client=client,
+            )
+        return
+
+    partial_path = destination + ".part"
+    progress_path = _progress_path(partial_path)
+
+    # A partial file without a progress file was left behind by a single
+    # stream. Its size is how much has been downloaded, so keep resuming it
+    # that way rather than starting over with several connections.
+    resume_single = os.path.exists(partial_path) and not os.path.exists(progress_path)
+
+    if connections > 1 and not resume_single:
+        total = await _probe_range_support(client, url)
+    else:
+        total = None
+
+    if total is not None:
+        await _download_parallel(
+            client,
+            url,
+            partial_path,
+            total,
+            connections,
+            chunk_size,
+            on_progress,
+        )
+    else:
+        # A file preallocated by a parallel download can't be resumed by a
+        # single stream, since its size doesn't reflect the progress
+        if os.path.exists(progress_path):
+            _remove_partial(partial_path)
+
+        total = await _download_single(
+            client,
+            url,
+            partial_path,
+            chunk_size,
+            on_progress,
+        )
+
+    if expected_size is None:
+        expected_size = total
+
+    # Make sure the file is complete and intact
+    actual_size = os.path.getsize(partial_path)
+
+    if expected_size is not None and actual_size != expected_size:
+        # A short file from a single stream can still be resumed. Anything
+        # else is broken.
+        if actual_size > expected_size or os.path.exists(progress_path):
+            _remove_partial(partial_path)
+
+        raise DownloadError(
+            f"Expected {expected_size} bytes, but got {actual_size}: {url}"
+        )
+
+    if expected_sha256 is not None:
+        actual_sha256 = await asyncio.to_thread(
+            _sha256_of_file,
+            partial_path,
+            chunk_size,
+        )
+
+        if actual_sha256 != expected_sha256.lower():
+            _remove_partial(partial_path)
+            raise DownloadError(f"Checksum mismatch: {url}")
+
+    # Atomically move the file into place. Readers will either see no file at
+    # all, or the complete one.
+    os.replace(partial_path, destination)
+    _remove_partial(partial_path)
+    _logger.info("Downloaded %s to %s", url, destination)
+
+
+async def download_with_retries(
+    url: str,
+    destination: str,
+    *,
+    initial_delay: float = 30,
+    max_delay: float = 3600,
+    **kwargs: t.Any,
+) -> None:
+    """
+    Like `download_large_file`, but keeps trying until the download succeeds.
+
+    Failed attempts are logged and retried with exponential backoff, starting
+    at `initial_delay` seconds and doubling up to `max_delay`. Since partial
+    downloads are kept, each attempt picks up where the previous one left off.
+
+    Any additional keyword arguments are passed on to `download_large_file`.
+
+    ## Parameters
+
+    `url`: The URL to download.
+
+    `destination`: Where to store the downloaded file.
+
+    `initial_delay`: How many seconds to wait after the first failure.
+
+    `max_delay`: The longest time to wait between two attempts, in seconds.
+    """
+    delay = initial_delay
+
+    while True:
+        try:
+            await download_large_file(url, destination, **kwargs)
+            return
+        except (httpx.HTTPError, DownloadError, OSError):
+            _logger.warning(
+                "Failed to download %s, retrying in %s seconds",
+                url,
+                delay,
+                exc_info=True,
+            )
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
 
 
 if __name__ == "__main__":
+    from tqdm import tqdm
+
     # Example Usage
     file_url = "https://xrc.freewebhostmost.com/GeoLite2-City.mmdb"
     destination = "./GeoLite2-City.mmdb"
-    download_large_file(file_url, destination)
+
+    with tqdm(unit="B", unit_scale=True, desc="Downloading") as pbar:
+
+        def on_progress(downloaded: int, total: int | None) -> None:
+            pbar.total = total
+            pbar.update(downloaded - pbar.n)
+
+        asyncio.run(
+            download_large_file(
+                file_url,
+                destination,
+                connections=4,
+                on_progress=on_progress,
+            )
+        )
+
+    print(f"Download complete: {destination}")
@@ -1,22 +1,370 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import ipaddress
+import os
+import threading
+import typing as t
+from dataclasses import dataclass
+
 import flag
 import geoip2.database
+import geoip2.errors
+
+from .downloader import DownloadProgress
+from .instrumentation import instrumented
+from .ttl_cache import MISSING, TTLCache
 
-# Path to the GeoLite2-City.mmdb file
+# Path to the GeoLite2-City.mmdb file. If it doesn't exist when the app starts,
+# it is downloaded to this location.
 DATABASE_PATH = "./db/GeoLite2-City.mmdb"
 
+# Progress of the database download, if one is running
+download_progress = DownloadProgress()
+
+# Lookup results are cached, so repeated lookups of the same address don't
+# have to touch the database at all.
+#
+# Optionally, addresses can be grouped by network prefix (e.g. /24 for IPv4),
+# so that all addresses in the same network share a single cache entry. This
+# trades a little accuracy for a much higher hit rate.
+CACHE_SIZE = 4096
+CACHE_TTL = 60 * 60
+CACHE_PREFIX_LENGTH_V4: int | None = None
+CACHE_PREFIX_LENGTH_V6: int | None = None
+
+
+@dataclass(frozen=True)
+class IpLocation:
+    """
+    The result of resolving an IP address.
+
+    ## Attributes
+
+    `status`: How the lookup went:
+
+        - `"found"`: The location is known. All other fields are set.
+        - `"private"`: The address is private or reserved (e.g. `127.0.0.1`),
+          so it has no location.
+        - `"not_found"`: The address is not in the database.
+        - `"error"`: The address is invalid, or the lookup failed.
+
+    `country`: The English name of the country.
+
+    `city`: The English name of the city.
+
+    `flag`: The country's flag emoji.
+    """
+
+    status: t.Literal["found", "private", "not_found", "error"]
+    country: str | None = None
+    city: str | None = None
+    flag: str | None = None
+
+    def as_tuple(self) -> tuple[str, str, str] | None:
+        """
+        Return the location as a `(country, city, flag)` tuple, or `None` if it
+        isn't known.
+        """
+        if self.status != "found":
+            return None
+
+        return (self.country, self.city, self.flag)  # type: ignore
+
+
+def _cache_key(ip_address: str) -> str:
+    """
+    Return the key under which the lookup result for `ip_address` is cached.
+    """
+    if CACHE_PREFIX_LENGTH_V4 is None and CACHE_PREFIX_LENGTH_V6 is None:
+        return ip_address
+
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return ip_address
+
+    prefix_length = (
+        CACHE_PREFIX_LENGTH_V4 if address.version == 4 else CACHE_PREFIX_LENGTH_V6
+    )
+
+    if prefix_length is None:
+        return ip_address
+
+    return str(ipaddress.ip_network(f"{address}/{prefix_length}", strict=False))
+
+
+class _ReaderHandle:
+    """
+    A database reader, along with the number of lookups currently using it.
+    Once a newer database has been loaded, the old reader is retired and closed
+    as soon as its last lookup finishes.
+    """
+
+    def __init__(self, reader: geoip2.database.Reader, mtime: float) -> None:
+        self.reader = reader
+        self.mtime = mtime
+        self.active_lookups = 0
+        self.retired = False
+
+    def close_if_unused(self) -> None:
+        if self.retired and self.active_lookups == 0:
+            self.reader.close()
+
+
+class GeoIPService:
+    """
+    Resolves IP addresses to locations using a GeoIP2 database.
+
+    The database is opened once and then kept open. Opening it parses the
+    file's metadata, which is far too slow to do for every lookup. The file is
+    memory-mapped, so the operating system takes care of keeping the hot parts
+    of it in memory.
+
+    When the database file is replaced by a newer version, `reload_if_changed`
+    opens the new file and swaps it in without interrupting lookups: lookups
+    which are already running finish on the old database, which is closed
+    afterwards. Replace the file atomically (e.g. using `os.replace`) so a
+    half-written file is never picked up.
+
+    ## Attributes
+
+    `database_path`: Path to the `.mmdb` file.
+
+    `lookup_cache`: Cache of recent lookup results. It is cleared whenever a
+        new database is loaded.
+
+    `load_count`: Number of times a database has been loaded, either on first
+        use or by `reload_if_changed`. When this changes, earlier lookup
+        results may be outdated.
+    """
+
+    def __init__(self, database_path: str = DATABASE_PATH) -> None:
+        self.database_path = database_path
+        self.lookup_cache: TTLCache[str, IpLocation] = TTLCache(
+            maxsize=CACHE_SIZE,
+            ttl=CACHE_TTL,
+        )
 
+        self.load_count = 0
+
+        self._handle: _ReaderHandle | None = None
+        self._lock = threading.Lock()
+
+    def is_ready(self) -> bool:
+        """
+        Whether the database is available. Right after the app is first
+        started it may still be downloading, in which case all lookups return
+        `None`.
+        """
+        return self._handle is not None or os.path.exists(self.database_path)
+
+    def _open(self) -> _ReaderHandle:
+        mtime = os.path.getmtime(self.database_path)
+        reader = geoip2.database.Reader(
+            self.database_path,
+            mode=geoip2.database.MODE_MMAP,
+        )
+        return _ReaderHandle(reader, mtime)
+
+    def _swap(self, handle: _ReaderHandle) -> None:
+        with self._lock:
+            old_handle = self._handle
+            self._handle = handle
+            self.load_count += 1
+
+            # Results from the old database may be outdated
+            self.lookup_cache.clear()
+
+            if old_handle is not None:
+                old_handle.retired = True
+                old_handle.close_if_unused()
+
+    def _acquire(self) -> tuple[_ReaderHandle, int]:
+        """
+        Return the current reader, along with the load count at the time.
+        """
+        with self._lock:
+            # Open the database on first use
+            if self._handle is None:
+                self._handle = self._open()
+                self.load_count += 1
+
+            self._handle.active_lookups += 1
+            return self._handle, self.load_count
+
+    def _release(self, handle: _ReaderHandle) -> None:
+        with self._lock:
+            handle.active_lookups -= 1
+            handle.close_if_unused()
+
+    def _resolve_one(
+        self,
+        handle: _ReaderHandle,
+        ip_address: str,
+        new_results: dict[str, IpLocation],
+    ) -> IpLocation:
+        """
+        Resolve a single address, using the cache if possible. Results which
+        weren't cached yet are added to `new_results`, by cache key.
+        """
+        key = _cache_key(ip_address)
+
+        # Addresses in the same network share their result, even before it
+        # has made it into the cache
+        result = new_results.get(key, MISSING)
+
+        if result is MISSING:
+            result = self.lookup_cache.get(key)
+
+        if result is not MISSING:
+            return result
+
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return IpLocation("error")
+
+        if not address.is_global:
+            result = IpLocation("private")
+        else:
+            try:
+                response = handle.reader.city(ip_address)
+                result = IpLocation(
+                    "found",
+                    country=response.country.names["en"],
+                    city=response.city.names["en"],
+                    flag=flag.flag(response.country.iso_code),
+                )
+            except geoip2.errors.AddressNotFoundError:
+                result = IpLocation("not_found")
+            except Exception:
+                result = IpLocation("error")
+
+        new_results[key] = result
+        return result
+
+    def _cache_results(self, results: dict[str, IpLocation], load_count: int) -> None:
+        """
+        Cache lookup results, unless a new database was loaded while they were
+        being looked up. The cache has been cleared since, and the results may
+        be outdated.
+        """
+        with self._lock:
+            if self.load_count != load_count:
+                return
+
+            for key, result in results.items():
+                self.lookup_cache.set(key, result)
+
+    @instrumented("geoip.resolve_many")
+    def resolve_many(self, ip_addresses: t.Iterable[str]) -> dict[str, IpLocation]:
+        """
+        Resolve many IP addresses in one go. Each distinct address is only
+        looked up once, and all lookups share a single database reader.
+
+        Returns a dictionary mapping each distinct address to its location.
+        If the database isn't available (yet), all addresses resolve to
+        `"error"`.
+        """
+        unique_addresses = set(ip_addresses)
+
+        try:
+            handle, load_count = self._acquire()
+        except Exception:
+            return {ip_address: IpLocation("error") for ip_address in unique_addresses}
+
+        new_results: dict[str, IpLocation] = {}
+
+        try:
+            results = {
+                ip_address: self._resolve_one(handle, ip_address, new_results)
+                for ip_address in unique_addresses
+            }
+        finally:
+            self._release(handle)
+
+        self._cache_results(new_results, load_count)
+        return results
+
+    async def resolve_many_async(
+        self,
+        ip_addresses: t.Iterable[str],
+    ) -> dict[str, IpLocation]:
+        """
+        Like `resolve_many`, but runs in a worker thread, so the event loop
+        stays responsive even for large batches.
+        """
+        return await asyncio.to_thread(self.resolve_many, list(ip_addresses))
+
+    def count_locations(
+        self,
+        ip_addresses: t.Iterable[str],
+    ) -> collections.Counter[IpLocation]:
+        """
+        Resolve the given addresses and count how many of them are in each
+        location. Unlike `resolve_many`, duplicate addresses count multiple
+        times.
+        """
+        ip_addresses = list(ip_addresses)
+        locations = self.resolve_many(ip_addresses)
+        return collections.Counter(locations[ip] for ip in ip_addresses)
+
+    def lookup(self, ip_address: str) -> tuple[str, str, str] | None:
+        """
+        Get the country and flag for an IP address. Returns a tuple with
+        country, city, and flag, or `None` if the location can't be determined.
+        """
+        return self.resolve_many([ip_address])[ip_address].as_tuple()
+
+    async def reload_if_changed(self) -> bool:
+        """
+        Load the database file again if it has changed since it was last
+        loaded. The file is opened in a worker thread, so this doesn't block
+        the event loop. Returns whether a new database was loaded.
+        """
+        try:
+            mtime = os.path.getmtime(self.database_path)
+        except OSError:
+            return False
+
+        handle = self._handle
+
+        if handle is not None and handle.mtime == mtime:
+            return False
+
+        self._swap(await asyncio.to_thread(self._open))
+        return True
+
+    def close(self) -> None:
+        """
+        Close the database once all running lookups have finished.
+        """
+        with self._lock:
+            handle = self._handle
+            self._handle = None
+
+            if handle is not None:
+                handle.retired = True
+                handle.close_if_unused()
+
+
+# The service shared by the entire app
+geoip_service = GeoIPService()
+
+
+def is_database_ready() -> bool:
+    """
+    Whether the app's GeoIP2 database is available.
+    """
+    return geoip_service.is_ready()
+
+
+@instrumented("geoip.get_country_from_ip")
 def get_country_from_ip(ip_address) -> tuple[str, str, str] | None:
     """
     Get the country and flag for an IP address using GeoIP2.
     Returns a tuple with country, city, and flag.
     """
-    try:
-        with geoip2.database.Reader(DATABASE_PATH) as reader:
-            response = reader.city(ip_address)
-            return (
-                response.country.names["en"],
-                response.city.names["en"],
-                flag.flag(response.country.iso_code),
-            )
-    except:
-        return None
+    return geoip_service.lookup(ip_address)
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import typing as t
+
+T = t.TypeVar("T")
+
+
+class GroupCommitQueue(t.Generic[T]):
+    """
+    Collects writes from many callers and commits them together.
+
+    Committing a transaction has a fixed cost, no matter how much it contains.
+    When many callers write at the same time, e.g. during a login storm, it is
+    much cheaper to commit all of their writes in one transaction than each on
+    its own.
+
+    Callers `submit` their writes. If nothing is being committed at the time,
+    a write is committed right away, so a lone caller doesn't wait any longer
+    than before. Writes submitted while a commit is in progress pile up, and
+    once it is done, all of them are handed to `commit` as a single batch.
+    The busier the database, the larger the batches become. Optionally, each
+    batch can additionally be held back for up to `max_delay` seconds, or
+    until `max_batch_size` writes have accumulated, to gather even more
+    writes.
+
+    `submit` only returns once the batch containing the write has been
+    committed. If committing a batch fails, its writes are retried one by one,
+    so only the callers whose writes are actually at fault see an exception.
+
+    ## Attributes
+
+    `commit`: Writes a batch of items in a single transaction.
+
+    `max_delay`: How long to wait for more writes before committing, in
+        seconds. `0` only gathers writes which arrive while the previous batch
+        is being committed.
+
+    `max_batch_size`: The most writes committed together.
+
+    `batches`: Number of batches committed so far.
+    """
+
+    def __init__(
+        self,
+        commit: t.Callable[[list[T]], t.Awaitable[None]],
+        *,
+        max_delay: float = 0,
+        max_batch_size: int = 256,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("`max_batch_size` must be at least 1")
+
+        self.commit = commit
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+
+        self._pending: list[tuple[T, asyncio.Future[None]]] = []
+        self._batch_full = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    async def submit(self, item: T) -> None:
+        """
+        Queue `item` to be written, and wait until it has been committed.
+
+        ## Raises
+
+        Whatever `commit` raised when the item was written on its own.
+
+        `asyncio.CancelledError`: If the queue's task was cancelled, e.g.
+            during shutdown, before the item was committed. The item may or
+            may not have been written.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+        await future
+
+    async def close(self) -> None:
+        """
+        Commit all queued writes right away and wait until they are done.
+        """
+        self._batch_full.set()
+
+        if self._task is not None:
+            await self._task
+
+    async def _run(self) -> None:
+        batch: list[tuple[T, asyncio.Future[None]]] = []
+
+        try:
+            while self._pending:
+                # Give other callers a chance to add their writes, unless the
+                # batch is already full. Even without a delay, callers which
+                # were started at the same time get to join.
+                if len(self._pending) < self.max_batch_size:
+                    if self.max_delay > 0:
+                        try:
+                            await asyncio.wait_for(
+                                self._batch_full.wait(), self.max_delay
+                            )
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await asyncio.sleep(0)
+
+                batch = self._pending[: self.max_batch_size]
+                del self._pending[: self.max_batch_size]
+                self._batch_full.clear()
+
+                await self._commit_batch(batch)
+        finally:
+            self._task = None
+
+            # If the task ended early, e.g. because it was cancelled during
+            # shutdown, nobody is going to commit the remaining writes. Don't
+            # leave their callers waiting forever.
+            for _, future in [*batch, *self._pending]:
+                if not future.done():
+                    future.cancel()
+
+            self._pending.clear()
+
+    async def _commit_batch(self, batch: list[tuple[T, asyncio.Future[None]]]) -> None:
+        self.batches += 1
+
+        try:
+            await self.commit([item for item, _ in batch])
+        except Exception as err:
+            # A single write on its own can't be split up any further
+            if len(batch) == 1:
+                _, future = batch[0]
+
+                if not future.done():
+                    future.set_exception(err)
+
+                return
+
+            # Find out which writes are to blame. The rest succeed.
+            for entry in batch:
+                await self._commit_batch([entry])
+
+            return
+
+        for _, future in batch:
+            # The caller may have been cancelled in the meantime
+            if not future.done():
+                future.set_result(None)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import typing as t
+from concurrent.futures import ProcessPoolExecutor
+
+T = t.TypeVar("T")
+
+
+def _get_worker_context() -> multiprocessing.context.BaseContext:
+    """
+    Return the multiprocessing context used to start worker processes.
+
+    Forking a process running an event loop, database connections and other
+    threads copies all of their state, including locks which may be held at
+    that very moment. The workers are started from a clean interpreter
+    instead: via a fork server where available, and by spawning them
+    otherwise.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+
+    return multiprocessing.get_context("spawn")
+
+
+class HashingService:
+    """
+    Runs CPU-heavy work, such as password hashing, in a pool of worker
+    processes.
+
+    Key derivation functions like PBKDF2 are deliberately slow. Computing them
+    on the event loop freezes every connected session until the hash is done,
+    so they are shipped off to separate processes instead. The functions passed
+    to `submit` must be picklable, e.g. `hashlib.pbkdf2_hmac`.
+
+    To protect the pool from being flooded, at most `max_pending` jobs are
+    handed to the workers at once. Additional callers wait their turn.
+
+    ## Attributes
+
+    `max_workers`: Number of worker processes. Defaults to the number of CPU
+        cores.
+
+    `max_pending`: Maximum number of jobs submitted to the pool at once.
+        Defaults to twice the number of workers.
+    """
+
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        max_pending: int | None = None,
+    ) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 2
+
+        # The pool is only started once it is actually needed. This keeps
+        # importing the module cheap.
+        self._executor: ProcessPoolExecutor | None = None
+        self._slots = asyncio.Semaphore(self.max_pending)
+
+        self._queue_depth = 0
+        self._peak_queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        The number of jobs which have been submitted but not finished yet. This
+        includes jobs waiting for a free slot.
+        """
+        return self._queue_depth
+
+    @property
+    def peak_queue_depth(self) -> int:
+        """
+        The highest `queue_depth` observed so far.
+        """
+        return self._peak_queue_depth
+
+    async def submit(self, function: t.Callable[..., T], *args: t.Any) -> T:
+        """
+        Run `function(*args)` in a worker process and return its result.
+        """
+        self._queue_depth += 1
+        self._peak_queue_depth = max(self._peak_queue_depth, self._queue_depth)
+
+        try:
+            async with self._slots:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=_get_worker_context(),
+                    )
+
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._executor,
+                    function,
+                    *args,
+                )
+        finally:
+            self._queue_depth -= 1
+
+    def close(self) -> None:
+        """
+        Shut down the worker processes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# The service shared by the entire app
+_hashing_service: HashingService | None = None
+
+
+def get_hashing_service() -> HashingService:
+    """
+    Return the app-wide `HashingService`, creating it if necessary.
+    """
+    global _hashing_service
+
+    if _hashing_service is None:
+        _hashing_service = HashingService()
+
+    return _hashing_service
@@ -0,0 +1,482 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+import typing as t
+from dataclasses import dataclass
+
+_logger = logging.getLogger(__name__)
+
+F = t.TypeVar("F", bound=t.Callable[..., t.Any])
+
+# Each power of two is split into this many linear sub-buckets, so every
+# bucket is at most 1/16th (~6%) wider than the values it holds
+SUB_BUCKET_BITS = 4
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+# Latencies are recorded in microseconds, up to 2^36 µs (~19 hours). Anything
+# larger ends up in the last bucket.
+MAX_EXPONENT = 32
+BUCKET_COUNT = (MAX_EXPONENT + 1) * SUB_BUCKET_COUNT
+
+# Upper bounds (in seconds) of the buckets in the Prometheus export
+EXPORT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _bucket_index(microseconds: int) -> int:
+    """
+    Return the histogram bucket a value falls into.
+    """
+    if microseconds < SUB_BUCKET_COUNT:
+        return max(microseconds, 0)
+
+    exponent = microseconds.bit_length() - SUB_BUCKET_BITS - 1
+    index = exponent * SUB_BUCKET_COUNT + (microseconds >> exponent)
+    return min(index, BUCKET_COUNT - 1)
+
+
+def _bucket_upper_bound(index: int) -> int:
+    """
+    Return the smallest value (in microseconds) which is too large for the
+    bucket with the given index.
+    """
+    if index < SUB_BUCKET_COUNT:
+        return index + 1
+
+    exponent, sub_bucket = divmod(index, SUB_BUCKET_COUNT)
+    return (SUB_BUCKET_COUNT + sub_bucket + 1) << (exponent - 1)
+
+
+class LatencyHistogram:
+    """
+    A histogram of latencies with HDR-style buckets.
+
+    Bucket widths grow with the values they hold: each power of two is split
+    into `SUB_BUCKET_COUNT` equally sized buckets. This keeps the relative
+    error of all reported percentiles below ~6%, whether an operation takes
+    microseconds or seconds, while using a small, fixed amount of memory.
+    Recording a value takes constant time.
+
+    Not thread-safe on its own. `OperationStats` takes care of locking.
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.counts[_bucket_index(int(seconds * 1_000_000))] += 1
+        self.count += 1
+        self.sum += seconds
+
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percentile: float) -> float:
+        """
+        Return the latency (in seconds) below which `percentile` percent of
+        all recorded values fall. This is the upper bound of the bucket
+        containing the value, so it errs on the slow side.
+        """
+        if not self.count:
+            return 0.0
+
+        threshold = self.count * percentile / 100
+        seen = 0
+
+        for index, count in enumerate(self.counts):
+            seen += count
+
+            if count and seen >= threshold:
+                return min(_bucket_upper_bound(index) / 1_000_000, self.max)
+
+        return self.max
+
+    def cumulative_counts(
+        self,
+        upper_bounds: t.Iterable[float],
+    ) -> list[tuple[float, int]]:
+        """
+        Return how many values were at most each of the given upper bounds (in
+        seconds), as `(upper_bound, count)` pairs. Since the bounds rarely
+        line up with the histogram's buckets exactly, values are counted
+        towards a bound if their entire bucket is below it.
+        """
+        result = []
+        index = 0
+        seen = 0
+
+        for upper_bound in sorted(upper_bounds):
+            limit = upper_bound * 1_000_000
+
+            while index < BUCKET_COUNT and _bucket_upper_bound(index) <= limit:
+                seen += self.counts[index]
+                index += 1
+
+            result.append((upper_bound, seen))
+
+        return result
+
+
+class OperationStats:
+    """
+    Latency histogram, call count and error count of a single operation.
+
+    ## Attributes
+
+    `name`: The operation's name, e.g. `"persistence.create_session"`.
+
+    `histogram`: The latencies of all calls, including failed ones.
+
+    `errors`: How many calls raised an exception.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.histogram = LatencyHistogram()
+        self.errors = 0
+
+        self._lock = threading.Lock()
+
+    @property
+    def calls(self) -> int:
+        return self.histogram.count
+
+    def record(self, seconds: float, failed: bool = False) -> None:
+        with self._lock:
+            self.histogram.record(seconds)
+
+            if failed:
+                self.errors += 1
+
+
+@dataclass(frozen=True)
+class OperationSummary:
+    """
+    The statistics of a single operation, at a single point in time. All
+    latencies are in seconds.
+    """
+
+    name: str
+    calls: int
+    errors: int
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+
+class Instrumentation:
+    """
+    Collects latency statistics of instrumented operations.
+
+    Operations are instrumented using the `instrumented` decorator or the
+    `measure` context manager. While disabled, both call straight through to
+    the wrapped code, so instrumentation can be left in place at virtually no
+    cost.
+
+    ## Attributes
+
+    `enabled`: Whether statistics are currently being collected.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._operations: dict[str, OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> OperationStats:
+        """
+        Return the statistics of the operation called `name`, creating them if
+        necessary.
+        """
+        try:
+            return self._operations[name]
+        except KeyError:
+            pass
+
+        with self._lock:
+            return self._operations.setdefault(name, OperationStats(name))
+
+    def reset(self) -> None:
+        """
+        Forget all statistics collected so far.
+        """
+        with self._lock:
+            self._operations = {}
+
+    def summarize(self) -> list[OperationSummary]:
+        """
+        Return the current statistics of all operations, sorted by name.
+        """
+        result = []
+
+        for name, stats in sorted(self._operations.items()):
+            with stats._lock:
+                histogram = stats.histogram
+                result.append(
+                    OperationSummary(
+                        name=name,
+                        calls=histogram.count,
+                        errors=stats.errors,
+                        p50=histogram.percentile(50),
+                        p90=histogram.percentile(90),
+                        p99=histogram.percentile(99),
+                        max=histogram.max,
+                    )
+                )
+
+        return result
+
+    def render_prometheus(self, prefix: str = "rio_admin") -> str:
+        """
+        Return all statistics in the Prometheus text exposition format.
+        """
+        duration = f"{prefix}_operation_duration_seconds"
+        errors = f"{prefix}_operation_errors_total"
+
+        lines = [
+            f"# HELP {duration} How long instrumented operations took.",
+            f"# TYPE {duration} histogram",
+        ]
+        error_lines = [
+            f"# HELP {errors} How many instrumented operations raised an exception.",
+            f"# TYPE {errors} counter",
+        ]
+
+        for name, stats in sorted(self._operations.items()):
+            label = f'operation="{name}"'
+
+            with stats._lock:
+                histogram = stats.histogram
+
+                for upper_bound, count in histogram.cumulative_counts(EXPORT_BUCKETS):
+                    lines.append(f'{duration}_bucket{{{label},le="{upper_bound}"}} {count}')
+
+                lines.append(f'{duration}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f"{duration}_sum{{{label}}} {histogram.sum}")
+                lines.append(f"{duration}_count{{{label}}} {histogram.count}")
+                error_lines.append(f"{errors}{{{label}}} {stats.errors}")
+
+        return "\n".join(lines + error_lines) + "\n"
+
+
+# The instrumentation shared by the entire app. Set `RIO_ADMIN_INSTRUMENTATION`
+# to `0` to disable it.
+instrumentation = Instrumentation(
+    enabled=os.environ.get("RIO_ADMIN_INSTRUMENTATION", "1") != "0",
+)
+
+
+# Exceptions which end an operation early, without it having failed
+_NOT_FAILURES = (GeneratorExit, asyncio.CancelledError)
+
+
+class _Measurement:
+    """
+    Context manager returned by `measure`.
+    """
+
+    __slots__ = ("_stats", "_expected", "_start")
+
+    def __init__(
+        self,
+        stats: OperationStats,
+        expected: tuple[type[BaseException], ...] = (),
+    ) -> None:
+        self._stats = stats
+        self._expected = _NOT_FAILURES + expected
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._stats.record(
+            time.perf_counter() - self._start,
+            exc_type is not None and not issubclass(exc_type, self._expected),
+        )
+
+
+class _NoMeasurement:
+    """
+    Context manager returned by `measure` while instrumentation is disabled.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_NO_MEASUREMENT = _NoMeasurement()
+
+
+def measure(name: str) -> t.ContextManager[None]:
+    """
+    Record how long the body of a `with` block takes, as operation `name`.
+
+    ```python
+    with measure("geoip.lookup"):
+        ...
+    ```
+    """
+    if not instrumentation.enabled:
+        return _NO_MEASUREMENT
+
+    return _Measurement(instrumentation.get(name))
+
+
+async def _measure_async_iterator(
+    stats: OperationStats,
+    iterator: t.AsyncIterator[t.Any],
+    expected: tuple[type[BaseException], ...] = (),
+) -> t.AsyncIterator[t.Any]:
+    # The time is measured from the first item being requested until the
+    # iterator is exhausted or closed
+    start = time.perf_counter()
+    failed = False
+
+    try:
+        async for item in iterator:
+            yield item
+    except BaseException as error:
+        failed = not isinstance(error, _NOT_FAILURES + expected)
+        raise
+    finally:
+        stats.record(time.perf_counter() - start, failed)
+
+
+def instrumented(
+    name: str,
+    *,
+    expected: tuple[type[BaseException], ...] = (),
+) -> t.Callable[[F], F]:
+    """
+    Decorator which records how long each call of the decorated function
+    takes, as operation `name`. Works for regular functions, coroutine
+    functions and async generators. For async generators, the time from the
+    first item being requested until the generator is done is recorded.
+
+    ## Parameters
+
+    `name`: The name the statistics are recorded under.
+
+    `expected`: Exceptions which are part of the function's regular
+        behavior, e.g. a `KeyError` signalling that nothing was found. These
+        aren't counted as errors.
+    """
+
+    def decorator(function: F) -> F:
+        if inspect.isasyncgenfunction(function):
+
+            @functools.wraps(function)
+            def async_generator_wrapper(*args, **kwargs):
+                iterator = function(*args, **kwargs)
+
+                if not instrumentation.enabled:
+                    return iterator
+
+                return _measure_async_iterator(
+                    instrumentation.get(name),
+                    iterator,
+                    expected,
+                )
+
+            return async_generator_wrapper  # type: ignore
+
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def coroutine_wrapper(*args, **kwargs):
+                if not instrumentation.enabled:
+                    return await function(*args, **kwargs)
+
+                with _Measurement(instrumentation.get(name), expected):
+                    return await function(*args, **kwargs)
+
+            return coroutine_wrapper  # type: ignore
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return function(*args, **kwargs)
+
+            with _Measurement(instrumentation.get(name), expected):
+                return function(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+async def _handle_prometheus_request(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    try:
+        request_line = await reader.readline()
+
+        # Skip the headers
+        while (await reader.readline()).strip():
+            pass
+
+        parts = request_line.decode("latin-1").split()
+
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+            status = "200 OK"
+            body = instrumentation.render_prometheus().encode("utf-8")
+        else:
+            status = "404 Not Found"
+            body = b"Not Found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n"
+            "\r\n".encode("latin-1")
+            + body
+        )
+        await writer.drain()
+    except Exception:
+        _logger.exception("Failed to serve metrics request")
+    finally:
+        writer.close()
+
+
+async def serve_prometheus(host: str = "127.0.0.1", port: int = 9100) -> asyncio.Server:
+    """
+    Serve the collected statistics at `http://<host>:<port>/metrics`, so they
+    can be scraped by Prometheus. Close the returned server to stop serving.
+
+    The endpoint is deliberately served separately from the app, so it isn't
+    exposed to the public along with it.
+    """
+    return await asyncio.start_server(_handle_prometheus_request, host, port)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from .instrumentation import LatencyHistogram
+
+_logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """
+    Watches the event loop for blocking code.
+
+    Anything synchronous running on the event loop, such as hashing a password
+    or a slow database call, keeps all other sessions waiting. The monitor
+    detects this in two ways:
+
+    - A task sleeps for `interval` seconds, over and over. Any time beyond the
+      interval which passes before it wakes up is time the loop was busy. These
+      delays are recorded in `lag_histogram`.
+
+    - A watchdog thread checks whether that task is overdue by more than
+      `threshold` seconds. If so, whatever the loop is currently stuck in is
+      logged along with its stack, e.g. `Persistence.create_session` or
+      `Dashboard.build`. Each stall is only logged once.
+
+    ## Attributes
+
+    `interval`: How often the lag is sampled, in seconds.
+
+    `threshold`: How long the loop may be blocked before the blocking code is
+        logged, in seconds.
+
+    `lag_histogram`: How late the sampling task woke up, in seconds.
+
+    `slow_callbacks`: How many times the loop was blocked for longer than
+        `threshold`.
+    """
+
+    def __init__(self, *, interval: float = 0.1, threshold: float = 0.1) -> None:
+        self.interval = interval
+        self.threshold = threshold
+
+        self.lag_histogram = LatencyHistogram()
+        self.slow_callbacks = 0
+
+        # When the sampling task last started sleeping, as `time.monotonic()`
+        self._last_beat: float | None = None
+        self._reported_beat: float | None = None
+
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """
+        Start monitoring the running event loop. Does nothing if the monitor is
+        already running.
+        """
+        if self._task is not None:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample())
+
+        self._watchdog = threading.Thread(
+            target=self._watch,
+            name="event-loop-watchdog",
+            daemon=True,
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """
+        Stop monitoring.
+        """
+        if self._task is None:
+            return
+
+        self._stopped.set()
+        self._task.cancel()
+
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        self._task = None
+        self._last_beat = None
+
+    async def _sample(self) -> None:
+        while True:
+            start = time.monotonic()
+            self._last_beat = start
+
+            await asyncio.sleep(self.interval)
+            self.lag_histogram.record(max(time.monotonic() - start - self.interval, 0))
+
+    def _watch(self) -> None:
+        # Check a few times per threshold, so stalls are caught while they are
+        # still happening
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._last_beat
+
+            if beat is None or beat == self._reported_beat:
+                continue
+
+            blocked = time.monotonic() - beat - self.interval
+
+            if blocked <= self.threshold:
+                continue
+
+            self._reported_beat = beat
+            self.slow_callbacks += 1
+
+            frame = sys._current_frames().get(self._loop_thread_id)  # type: ignore
+            stack = "".join(traceback.format_stack(frame)) if frame else "(unknown)"
+
+            _logger.warning(
+                "The event loop has been blocked for %.0f ms. It is currently running:\n%s",
+                blocked * 1000,
+                stack,
+            )
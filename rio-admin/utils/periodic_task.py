@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import typing as t
+
+_logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """
+    Calls an async function over and over in the background, waiting
+    `interval` seconds between calls. Exceptions are logged rather than ending
+    the task.
+
+    ## Attributes
+
+    `function`: The function to call.
+
+    `interval`: Number of seconds to wait between calls.
+
+    `immediately`: Whether the first call happens as soon as the task is
+        started, rather than after the first interval.
+    """
+
+    def __init__(
+        self,
+        function: t.Callable[[], t.Awaitable[t.Any]],
+        interval: float,
+        *,
+        immediately: bool = False,
+    ) -> None:
+        self.function = function
+        self.interval = interval
+        self.immediately = immediately
+
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        """
+        Start calling the function in the background. Does nothing if the task
+        is already running.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background task and wait for it to finish.
+        """
+        if self._task is None:
+            return
+
+        self._task.cancel()
+
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        self._task = None
+
+    async def _run(self) -> None:
+        if not self.immediately:
+            await asyncio.sleep(self.interval)
+
+        while True:
+            try:
+                await self.function()
+            except Exception:
+                _logger.exception("Periodic task %r failed", self.function)
+
+            await asyncio.sleep(self.interval)
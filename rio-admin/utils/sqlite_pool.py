@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import sqlite3
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+T = t.TypeVar("T")
+
+
+@dataclass
+class SqliteTuning:
+    """
+    Performance settings applied to every connection of a `SqlitePool`.
+
+    The defaults favor concurrency: in WAL mode readers never block the writer
+    (and vice versa), and `synchronous = NORMAL` only syncs to disk at
+    checkpoints rather than on every commit. A crash can lose the most recent
+    transactions, but never corrupts the database.
+
+    See https://www.sqlite.org/pragma.html for details on each setting.
+
+    ## Attributes
+
+    `journal_mode`: The journal mode, e.g. `"WAL"` or `"DELETE"`.
+
+    `synchronous`: How aggressively to sync to disk, e.g. `"NORMAL"` or
+        `"FULL"`.
+
+    `mmap_size`: Number of bytes of the database file to access via memory
+        mapping. `0` disables memory mapping.
+
+    `cache_size`: Size of the page cache of each connection. Negative values
+        are in KiB, positive values in pages.
+
+    `busy_timeout`: Number of milliseconds to wait for a lock before giving up.
+
+    `temp_store`: Where to keep temporary tables and indices, e.g. `"MEMORY"`
+        or `"FILE"`.
+
+    `checkpoint_interval`: Number of seconds between WAL checkpoints, or `None`
+        to leave checkpoints entirely to SQLite.
+
+    `cached_statements`: Number of prepared statements each connection keeps
+        around for reuse.
+    """
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 256 * 1024 * 1024
+    cache_size: int = -64 * 1024
+    busy_timeout: int = 5000
+    temp_store: str = "MEMORY"
+    checkpoint_interval: float | None = 5 * 60
+    cached_statements: int = 256
+
+    def apply(self, conn: sqlite3.Connection) -> None:
+        """
+        Apply the settings to the given connection.
+        """
+        conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA temp_store = {self.temp_store}")
+
+
+class SqlitePool:
+    """
+    A small asynchronous connection pool for SQLite.
+
+    SQLite allows many concurrent readers but only a single writer. This pool
+    mirrors that: it keeps a bounded set of reader connections and one
+    dedicated writer connection. All queries are executed in worker threads, so
+    the asyncio event loop (and with it every connected Rio session) stays
+    responsive while the database is busy.
+
+    ## Attributes
+
+    `db_path`: Path to the SQLite database file
+
+    `pool_size`: Number of reader connections kept open
+
+    `tuning`: Performance settings applied to each connection
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        pool_size: int = 4,
+        tuning: SqliteTuning | None = None,
+    ) -> None:
+        if pool_size < 1:
+            raise ValueError("`pool_size` must be at least 1")
+
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.tuning = SqliteTuning() if tuning is None else tuning
+
+        # The writer gets a thread of its own. Running every write on the same
+        # thread keeps them strictly ordered, and the lock makes sure callers
+        # don't interleave statements of different transactions.
+        self._writer = self._connect()
+        self._writer_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="sqlite-writer",
+        )
+        self._writer_lock = asyncio.Lock()
+
+        # Readers are handed out from a queue. If all of them are busy, callers
+        # wait until one is returned instead of opening more connections.
+        self._reader_executor = ThreadPoolExecutor(
+            max_workers=pool_size,
+            thread_name_prefix="sqlite-reader",
+        )
+        self._readers: asyncio.Queue[sqlite3.Connection] = asyncio.Queue()
+        self._reader_connections = [self._connect() for _ in range(pool_size)]
+
+        for conn in self._reader_connections:
+            self._readers.put_nowait(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are used from worker threads, never concurrently, so the
+        # same-thread check would only get in the way.
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.tuning.cached_statements,
+        )
+        self.tuning.apply(conn)
+        return conn
+
+    def execute_sync(self, function: t.Callable[[sqlite3.Connection], T]) -> T:
+        """
+        Run `function` on the writer connection right away, blocking the
+        caller, and commit afterwards. This is meant for setup code which runs
+        before the app starts serving requests.
+        """
+        try:
+            result = function(self._writer)
+        except BaseException:
+            self._writer.rollback()
+            raise
+
+        self._writer.commit()
+        return result
+
+    def _release_reader_when_done(
+        self,
+        future: concurrent.futures.Future[t.Any],
+        conn: sqlite3.Connection,
+        cursor: sqlite3.Cursor | None = None,
+    ) -> None:
+        """
+        Return a reader connection to the pool once `future`, the last job
+        using it, has finished.
+
+        Cancelling the task awaiting a job doesn't stop the worker thread
+        running it. If the connection were returned right away, another task
+        could start using it while that thread is still busy with it.
+        """
+        loop = asyncio.get_running_loop()
+
+        def release(_: concurrent.futures.Future[t.Any]) -> None:
+            if cursor is not None:
+                cursor.close()
+
+            # Runs in the worker thread, so hand the connection back to the
+            # event loop. If the loop is already gone, `close` takes care of
+            # the connection.
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._readers.put_nowait, conn)
+
+        future.add_done_callback(release)
+
+    async def read(self, function: t.Callable[[sqlite3.Connection], T]) -> T:
+        """
+        Run `function` with a reader connection in a worker thread and return
+        its result.
+        """
+        conn = await self._readers.get()
+
+        future = self._reader_executor.submit(function, conn)
+        self._release_reader_when_done(future, conn)
+
+        return await asyncio.wrap_future(future)
+
+    async def iterate(
+        self,
+        sql: str,
+        parameters: t.Sequence[t.Any] = (),
+        *,
+        row_factory: t.Callable[[sqlite3.Cursor, tuple], T] | None = None,
+        batch_size: int = 500,
+    ) -> t.AsyncIterator[list[T]]:
+        """
+        Run a query on a reader connection and yield the resulting rows in
+        batches of up to `batch_size`. Only a single batch is held in memory at
+        a time, so this is suitable for queries returning many rows.
+
+        The reader connection stays checked out until iteration finishes.
+        """
+        conn = await self._readers.get()
+        cursor = conn.cursor()
+        cursor.row_factory = row_factory
+
+        # The most recent job using the connection. Jobs run one after another,
+        # so once it is done, the connection is free again.
+        future = self._reader_executor.submit(cursor.execute, sql, parameters)
+
+        try:
+            await asyncio.wrap_future(future)
+
+            while True:
+                future = self._reader_executor.submit(cursor.fetchmany, batch_size)
+                batch = await asyncio.wrap_future(future)
+
+                if not batch:
+                    break
+
+                yield batch
+        finally:
+            self._release_reader_when_done(future, conn, cursor)
+
+    async def write(self, function: t.Callable[[sqlite3.Connection], T]) -> T:
+        """
+        Run `function` with the writer connection in a worker thread. The
+        transaction is committed if `function` succeeds, and rolled back if it
+        raises.
+        """
+        async with self._writer_lock:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._writer_executor,
+                self.execute_sync,
+                function,
+            )
+
+    async def checkpoint(self) -> None:
+        """
+        Copy the contents of the write-ahead log back into the database file.
+        This keeps the log from growing without bounds while readers are
+        constantly active. Does nothing unless the database is in WAL mode.
+        """
+        await self.write(
+            lambda conn: conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        )
+
+    def close(self) -> None:
+        """
+        Close all connections and shut down the worker threads.
+        """
+        self._writer_executor.shutdown(wait=True)
+        self._reader_executor.shutdown(wait=True)
+        self._writer.close()
+
+        # Connections still in use by a cancelled job haven't made it back
+        # into the queue yet, so close them all, not just the idle ones
+        for conn in self._reader_connections:
+            conn.close()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+K = t.TypeVar("K")
+V = t.TypeVar("V")
+
+# Returned by `TTLCache.get` if the key isn't in the cache. `None` can't be
+# used for this, since it's a perfectly valid value to cache.
+MISSING: t.Any = object()
+
+
+class TTLCache(t.Generic[K, V]):
+    """
+    A bounded least-recently-used cache whose entries expire after a fixed
+    amount of time.
+
+    The cache is thread-safe, so it can be shared between the event loop and
+    worker threads.
+
+    ## Attributes
+
+    `maxsize`: Maximum number of entries. Once exceeded, the least recently
+        used entry is evicted.
+
+    `ttl`: Number of seconds after which an entry expires. `None` means entries
+        never expire.
+
+    `hits`: How many lookups were answered from the cache.
+
+    `misses`: How many lookups found nothing (or only an expired entry).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        # Maps keys to `(expires_at, value)` tuples, in order of last use
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V:
+        """
+        Return the value stored for `key`, or `MISSING` if there is no
+        (unexpired) entry.
+        """
+        with self._lock:
+            try:
+                expires_at, value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return MISSING
+
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        """
+        Store `value` for `key`, evicting the least recently used entry if the
+        cache is full.
+        """
+        expires_at = float("inf") if self.ttl is None else time.monotonic() + self.ttl
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        """
+        Remove the entry for `key`, if there is one.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Remove all entries. The hit and miss counters are left untouched.
+        """
+        with self._lock:
+            self._entries.clear()
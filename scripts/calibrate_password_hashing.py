@@ -0,0 +1,89 @@
+"""
+Finds password hashing parameters which suit the current machine.
+
+Slower hashes are harder to crack, but every login and sign-up has to compute
+one. This script picks parameters which make a single hash take about the
+given time, and estimates how many logins per second the machine can then
+handle.
+
+Usage:
+
+    python scripts/calibrate_password_hashing.py [--scheme scrypt] [--target-ms 100]
+
+Put the resulting scheme into the `[passwords]` section of `rio.toml`. Users
+are moved to it as they log in.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Make `app_modules` in the project's root directory importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_modules import import_app_module  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    password_hashing = import_app_module("password_hashing")
+
+    parser = argparse.ArgumentParser(
+        description="Pick password hashing parameters for this machine.",
+    )
+    parser.add_argument(
+        "--scheme",
+        choices=sorted(password_hashing.SCHEMES),
+        default="pbkdf2_sha256",
+    )
+    parser.add_argument(
+        "--target-ms",
+        type=float,
+        default=100,
+        help="How long a single hash should take, in milliseconds",
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=5,
+        help="Number of hashes timed to verify the result",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    password_hashing = import_app_module("password_hashing")
+
+    print(f"Calibrating {args.scheme} for {args.target_ms:g} ms per hash...")
+    scheme = password_hashing.calibrate(args.scheme, args.target_ms / 1000)
+
+    # Verify the result, since calibration only takes a single measurement
+    timings = []
+
+    for _ in range(args.samples):
+        start = time.perf_counter()
+        scheme.hash("calibration", os.urandom(64))
+        timings.append(time.perf_counter() - start)
+
+    median = statistics.median(timings)
+    workers = os.cpu_count() or 1
+
+    print()
+    print(f"Scheme:            {scheme.encode()}")
+    print(f"Time per hash:     {median * 1000:.1f} ms (median of {args.samples})")
+    print(f"Logins per second: about {workers / median:.0f} using {workers} cores")
+    print()
+    print("Add this to rio.toml to use it for new and upgraded hashes:")
+    print()
+    print("[passwords]")
+    print(f'scheme = "{scheme.encode()}"')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Imports users into the app's database, or exports them from it.
+
+Usage:
+
+    python scripts/user_transfer.py import users.csv [--rejects rejects.csv]
+    python scripts/user_transfer.py export users.jsonl
+
+The file format (CSV or JSON Lines) is determined from the file extension. See
+`rio-admin/user_transfer.py` for the fields of each user. Passwords must
+already be hashed, so an import never spends time on hashing.
+
+The database is the one the app would use, so run this from the project's
+root directory, or pass `--database`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import sys
+import typing as t
+from pathlib import Path
+
+from tqdm import tqdm
+
+# Make `app_modules` in the project's root directory importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app_modules import import_app_module  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bulk import or export users.")
+    parser.add_argument(
+        "--database",
+        help="Database URL. Defaults to the one configured for the app.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Add users from a file")
+    import_parser.add_argument("path", type=Path)
+    import_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=5000,
+        help="Number of users written per transaction",
+    )
+    import_parser.add_argument(
+        "--rejects",
+        type=Path,
+        help="Write records which couldn't be imported to this CSV file",
+    )
+
+    export_parser = commands.add_parser("export", help="Write all users to a file")
+    export_parser.add_argument("path", type=Path)
+
+    return parser.parse_args()
+
+
+async def run_import(args: argparse.Namespace, pers: t.Any) -> int:
+    user_transfer = import_app_module("user_transfer")
+
+    rejects_file = None if args.rejects is None else args.rejects.open("w", newline="")
+    rejects_writer = None if rejects_file is None else csv.writer(rejects_file)
+
+    if rejects_writer is not None:
+        rejects_writer.writerow(["record_number", "username", "reason"])
+
+    def on_reject(rejection) -> None:
+        if rejects_writer is not None:
+            rejects_writer.writerow(
+                [rejection.record_number, rejection.username, rejection.reason]
+            )
+
+    with tqdm(unit=" records") as progress_bar:
+
+        def on_progress(progress) -> None:
+            progress_bar.update(progress.read - progress_bar.n)
+            progress_bar.set_postfix_str(
+                f"imported={progress.imported}, rejected={progress.rejected}"
+            )
+
+        try:
+            progress = await user_transfer.import_users(
+                pers,
+                args.path,
+                chunk_size=args.chunk_size,
+                on_progress=on_progress,
+                on_reject=on_reject,
+            )
+        finally:
+            if rejects_file is not None:
+                rejects_file.close()
+
+    print(
+        f"Read {progress.read} records: imported {progress.imported}, "
+        f"rejected {progress.rejected}"
+    )
+
+    if progress.rejected and args.rejects is not None:
+        print(f"Wrote the rejected records to {args.rejects}")
+
+    return 0 if not progress.rejected else 1
+
+
+async def run_export(args: argparse.Namespace, pers: t.Any) -> int:
+    user_transfer = import_app_module("user_transfer")
+
+    with tqdm(unit=" users") as progress_bar:
+        count = await user_transfer.export_users(
+            pers,
+            args.path,
+            on_progress=lambda count: progress_bar.update(count - progress_bar.n),
+        )
+        progress_bar.update(count - progress_bar.n)
+
+    print(f"Exported {count} users to {args.path}")
+    return 0
+
+
+async def run(args: argparse.Namespace) -> int:
+    persistence = import_app_module("persistence")
+    pers = await persistence.Persistence.open(args.database)
+
+    try:
+        if args.command == "import":
+            return await run_import(args, pers)
+
+        return await run_export(args, pers)
+    finally:
+        await pers.close()
+
+
+def main() -> int:
+    args = parse_args()
+
+    try:
+        return asyncio.run(run(args))
+    except (OSError, ValueError) as err:
+        print(f"Error: {err}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
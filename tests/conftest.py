@@ -0,0 +1,14 @@
+"""
+Tests run against the app's modules without starting the Rio app. Import them
+using `app_modules.import_app_module`, like the benchmarks and scripts do.
+"""
+
+import sys
+from pathlib import Path
+
+PROJECT_DIRECTORY = Path(__file__).resolve().parent.parent
+
+# Make `app_modules` in the project's root directory importable, along with
+# the benchmarks' fixtures, e.g. `mmdb_fixture`
+sys.path.insert(0, str(PROJECT_DIRECTORY))
+sys.path.insert(0, str(PROJECT_DIRECTORY / "benchmarks"))
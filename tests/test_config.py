@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import pytest
+
+from app_modules import import_app_module
+
+config = import_app_module("utils.config")
+
+
+@pytest.mark.parametrize(
+    ("toml", "env", "expected"),
+    [
+        ("", None, True),
+        ("[database]\nvacuum = false\n", None, False),
+        ("[database]\nvacuum = true\n", None, True),
+        ("[database]\nvacuum = false\n", "yes", True),
+        ("", "0", False),
+    ],
+)
+def test_bool_setting(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    toml: str,
+    env: str | None,
+    expected: bool,
+) -> None:
+    rio_toml = tmp_path / "rio.toml"
+    rio_toml.write_text(toml)
+
+    if env is None:
+        monkeypatch.delenv("TEST_VACUUM", raising=False)
+    else:
+        monkeypatch.setenv("TEST_VACUUM", env)
+
+    value = config.get_bool_setting(
+        "database",
+        "vacuum",
+        env_var="TEST_VACUUM",
+        default=True,
+        rio_toml=rio_toml,
+    )
+    assert value is expected
@@ -0,0 +1,78 @@
+import asyncio
+
+from app_modules import import_app_module
+
+dashboard_stats = import_app_module("dashboard_stats")
+metrics = import_app_module("metrics")
+online_users = import_app_module("online_users")
+utils = import_app_module("utils")
+
+
+def create_publisher(loop_monitor, **kwargs):
+    # The metrics store only needs the database to load and store history
+    return dashboard_stats.StatsPublisher(
+        online_users.OnlineUsers(),
+        metrics.MetricsStore(None),
+        loop_monitor=loop_monitor,
+        **kwargs,
+    )
+
+
+def test_idle_app_sends_no_notifications() -> None:
+    async def main() -> list:
+        loop_monitor = utils.LoopMonitor(interval=0.01, threshold=1)
+        loop_monitor.start()
+
+        try:
+            # Let the lag histogram fill up a little
+            await asyncio.sleep(0.1)
+
+            publisher = create_publisher(loop_monitor, interval=0.05)
+            notifications = []
+
+            async def subscriber(snapshot) -> None:
+                notifications.append(snapshot)
+
+            publisher.subscribe(subscriber)
+
+            for _ in range(20):
+                await asyncio.sleep(0.05)
+                await publisher.publish()
+
+            # The lag histogram kept growing all along
+            assert publisher.take_snapshot().loop_lag_counts != publisher.latest.loop_lag_counts
+
+            return notifications
+        finally:
+            await loop_monitor.stop()
+
+    assert asyncio.run(main()) == []
+
+
+def test_changed_loop_stats_are_published_after_lag_interval() -> None:
+    async def main() -> None:
+        loop_monitor = utils.LoopMonitor()
+        publisher = create_publisher(loop_monitor, lag_interval=0.1)
+        notifications = []
+
+        async def subscriber(snapshot) -> None:
+            notifications.append(snapshot)
+
+        publisher.subscribe(subscriber)
+        loop_monitor.slow_callbacks += 1
+
+        # Held back at first
+        await publisher.publish()
+        assert notifications == []
+
+        await asyncio.sleep(0.1)
+        await publisher.publish()
+        assert [snapshot.slow_callbacks for snapshot in notifications] == [1]
+
+        # Other changes are published right away, along with the loop stats
+        publisher.metrics.record("login")
+        loop_monitor.slow_callbacks += 1
+        await publisher.publish()
+        assert [snapshot.slow_callbacks for snapshot in notifications] == [1, 2]
+
+    asyncio.run(main())
@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+from pathlib import Path
+
+import httpx
+import pytest
+
+from app_modules import import_app_module
+
+downloader = import_app_module("utils.downloader")
+
+URL = "https://example.com/file.bin"
+CONTENT = bytes(range(256)) * 1000
+
+
+class RangeServer:
+    """
+    Serves `CONTENT`, honoring range requests. Requests for ranges starting at
+    `fail_at` fail after `fail_delay` seconds, all others succeed after `delay`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        *,
+        fail_at: int | None = None,
+        delay: float = 0,
+        fail_delay: float = 0,
+    ) -> None:
+        self.fail_at = fail_at
+        self.delay = delay
+        self.fail_delay = fail_delay
+        self.requested_ranges: list[tuple[int, int]] = []
+        self.active = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        range_header = request.headers.get("Range")
+
+        if range_header is None:
+            return httpx.Response(200, content=CONTENT)
+
+        first, _, last = range_header.removeprefix("bytes=").partition("-")
+        start = int(first)
+        end = int(last) if last else len(CONTENT) - 1
+        self.requested_ranges.append((start, end))
+
+        if start == self.fail_at:
+            await asyncio.sleep(self.fail_delay)
+            return httpx.Response(500)
+
+        self.active += 1
+
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+
+        return httpx.Response(
+            206,
+            content=CONTENT[start : end + 1],
+            headers={"Content-Range": f"bytes {start}-{end}/{len(CONTENT)}"},
+        )
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+
+def test_parallel_download(tmp_path: Path) -> None:
+    destination = tmp_path / "file.bin"
+    server = RangeServer()
+
+    async def main() -> None:
+        async with server.client() as client:
+            await downloader.download_large_file(
+                URL,
+                str(destination),
+                chunk_size=4096,
+                connections=4,
+                expected_sha256=hashlib.sha256(CONTENT).hexdigest(),
+                client=client,
+            )
+
+    asyncio.run(main())
+
+    assert destination.read_bytes() == CONTENT
+    assert not Path(str(destination) + ".part").exists()
+
+
+def test_failed_segment_stops_the_others(tmp_path: Path) -> None:
+    destination = tmp_path / "file.bin"
+    segment_size = -(-len(CONTENT) // 4)
+
+    # One segment fails right away, while the others are still waiting for
+    # their responses
+    server = RangeServer(fail_at=segment_size, delay=0.2)
+
+    async def main() -> None:
+        async with server.client() as client:
+            with pytest.raises(httpx.HTTPStatusError):
+                await downloader.download_large_file(
+                    URL,
+                    str(destination),
+                    connections=4,
+                    client=client,
+                )
+
+            assert server.active == 0
+
+    asyncio.run(main())
+
+    assert not destination.exists()
+
+
+def test_interrupted_parallel_download_is_resumed(tmp_path: Path) -> None:
+    destination = tmp_path / "file.bin"
+    segment_size = -(-len(CONTENT) // 4)
+
+    async def main() -> None:
+        # The first attempt fails for one segment, after the others have
+        # completed
+        async with RangeServer(fail_at=segment_size, fail_delay=0.2).client() as client:
+            with pytest.raises(httpx.HTTPStatusError):
+                await downloader.download_large_file(
+                    URL,
+                    str(destination),
+                    connections=4,
+                    client=client,
+                )
+
+        # The second attempt only fetches the missing segment
+        server = RangeServer()
+
+        async with server.client() as client:
+            await downloader.download_large_file(
+                URL,
+                str(destination),
+                connections=4,
+                client=client,
+            )
+
+        assert server.requested_ranges == [
+            (0, 0),  # Probe for range support
+            (segment_size, 2 * segment_size - 1),
+        ]
+
+    asyncio.run(main())
+
+    assert destination.read_bytes() == CONTENT
+    assert list(tmp_path.iterdir()) == [destination]
+
+
+def test_single_stream_partial_file_is_resumed(tmp_path: Path) -> None:
+    destination = tmp_path / "file.bin"
+    Path(str(destination) + ".part").write_bytes(CONTENT[:1000])
+    server = RangeServer()
+
+    async def main() -> None:
+        async with server.client() as client:
+            await downloader.download_large_file(
+                URL,
+                str(destination),
+                connections=4,
+                client=client,
+            )
+
+    asyncio.run(main())
+
+    assert server.requested_ranges == [(1000, len(CONTENT) - 1)]
+    assert destination.read_bytes() == CONTENT
+
+
+def test_progress_is_not_saved_after_every_chunk(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    destination = tmp_path / "file.bin"
+    saved: list[int] = []
+    save_segments = downloader._save_segments
+
+    def count_saves(progress_path: str, total: int, segments: list[list[int]]) -> None:
+        saved.append(sum(received for _, _, received in segments))
+        save_segments(progress_path, total, segments)
+
+    monkeypatch.setattr(downloader, "_save_segments", count_saves)
+
+    async def main() -> None:
+        async with RangeServer().client() as client:
+            await downloader.download_large_file(
+                URL,
+                str(destination),
+                chunk_size=1024,
+                connections=4,
+                client=client,
+            )
+
+    asyncio.run(main())
+
+    # Hundreds of chunks arrive, but the progress is only saved when the
+    # download starts and once it ends
+    assert saved == [0, len(CONTENT)]
+    assert destination.read_bytes() == CONTENT
+
+
+def test_failed_download_is_retried(tmp_path: Path) -> None:
+    destination = tmp_path / "file.bin"
+    segment_size = -(-len(CONTENT) // 4)
+    server = RangeServer(fail_at=segment_size)
+    attempts = 0
+
+    async def handle(request: httpx.Request) -> httpx.Response:
+        nonlocal attempts
+
+        # The probe starts every attempt. Let the third one succeed.
+        if request.headers.get("Range") == "bytes=0-0":
+            attempts += 1
+
+            if attempts == 3:
+                server.fail_at = None
+
+        return await server.handle(request)
+
+    async def main() -> None:
+        transport = httpx.MockTransport(handle)
+
+        async with httpx.AsyncClient(transport=transport) as client:
+            await downloader.download_with_retries(
+                URL,
+                str(destination),
+                initial_delay=0.01,
+                connections=4,
+                client=client,
+            )
+
+    asyncio.run(main())
+
+    assert attempts == 3
+    assert destination.read_bytes() == CONTENT
+    assert list(tmp_path.iterdir()) == [destination]
@@ -0,0 +1,78 @@
+import asyncio
+import os
+from pathlib import Path
+
+import mmdb_fixture
+
+from app_modules import import_app_module
+
+geoip2_with_flag = import_app_module("utils.geoip2_with_flag")
+
+
+def test_first_use_after_download_counts_as_load(tmp_path: Path) -> None:
+    path = tmp_path / "GeoLite2-City.mmdb"
+    service = geoip2_with_flag.GeoIPService(str(path))
+
+    # Still downloading
+    assert service.resolve_many(["8.8.8.8"])["8.8.8.8"].status == "error"
+    assert service.load_count == 0
+
+    networks = mmdb_fixture.write_city_fixture(str(path), network_count=16)
+    address = str(networks[0].network_address + 1)
+
+    try:
+        # A lookup opens the new file before the reloader gets to it. The
+        # reloader then sees nothing to reload, but the load count tells that
+        # earlier results are outdated.
+        assert service.resolve_many([address])[address].status == "found"
+        assert not asyncio.run(service.reload_if_changed())
+        assert service.load_count == 1
+    finally:
+        service.close()
+
+
+def test_reload_during_lookup_doesnt_cache_outdated_result(tmp_path: Path) -> None:
+    path = tmp_path / "GeoLite2-City.mmdb"
+    network = mmdb_fixture.synthetic_networks(1)[0]
+    address = str(network.network_address + 1)
+
+    def write_location(destination: Path, country: str) -> None:
+        mmdb_fixture.write_database(
+            str(destination),
+            [
+                (
+                    network,
+                    {
+                        "city": {"names": {"en": "Somewhere"}},
+                        "country": {"iso_code": "US", "names": {"en": country}},
+                    },
+                )
+            ],
+        )
+
+    write_location(path, "Old")
+    service = geoip2_with_flag.GeoIPService(str(path))
+
+    try:
+        assert service.resolve_many(["1.1.1.1"])  # Opens the database
+        old_reader = service._handle.reader
+        lookup_city = old_reader.city
+
+        # Another thread loads a new database while this lookup is running
+        def city_then_reload(ip_address: str):
+            response = lookup_city(ip_address)
+
+            new_path = tmp_path / "new.mmdb"
+            write_location(new_path, "New")
+            os.replace(new_path, path)
+            assert asyncio.run(service.reload_if_changed())
+
+            return response
+
+        old_reader.city = city_then_reload
+
+        # The running lookup still gets the old result, but must not cache it
+        assert service.resolve_many([address])[address].country == "Old"
+        assert service.resolve_many([address])[address].country == "New"
+    finally:
+        service.close()
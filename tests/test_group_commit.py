@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from app_modules import import_app_module
+
+group_commit = import_app_module("utils.group_commit")
+
+
+def test_max_delay_gathers_writes() -> None:
+    async def main() -> None:
+        batches = []
+
+        async def commit(items: list[int]) -> None:
+            batches.append(items)
+
+        queue = group_commit.GroupCommitQueue(commit, max_delay=0.05)
+
+        async def submit_later(item: int, delay: float) -> None:
+            await asyncio.sleep(delay)
+            await queue.submit(item)
+
+        # The batch isn't full, so it is committed once the delay runs out,
+        # along with the write which arrived in the meantime
+        await asyncio.gather(submit_later(1, 0), submit_later(2, 0.01))
+
+        assert batches == [[1, 2]]
+
+    asyncio.run(main())
+
+
+def test_cancelling_the_queue_releases_callers() -> None:
+    async def main() -> None:
+        committing = asyncio.Event()
+
+        async def commit(items: list[int]) -> None:
+            committing.set()
+            await asyncio.Event().wait()
+
+        queue = group_commit.GroupCommitQueue(commit)
+
+        # One write is being committed, the other one waits for the next batch
+        first = asyncio.create_task(queue.submit(1))
+        await committing.wait()
+        second = asyncio.create_task(queue.submit(2))
+        await asyncio.sleep(0)
+
+        queue._task.cancel()
+
+        for caller in (first, second):
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(caller, 1)
+
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+import asyncio
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app_modules import import_app_module
+
+hashing_service = import_app_module("utils.hashing_service")
+
+
+def test_jobs_wait_for_a_free_slot() -> None:
+    service = hashing_service.HashingService(max_workers=4, max_pending=2)
+
+    # Run the jobs in threads, so the test can watch how many are handed to
+    # the pool at once
+    service._executor = ThreadPoolExecutor(max_workers=4)
+    lock = threading.Lock()
+    running = 0
+    peak_running = 0
+
+    def job(duration: float) -> float:
+        nonlocal running, peak_running
+
+        with lock:
+            running += 1
+            peak_running = max(peak_running, running)
+
+        time.sleep(duration)
+
+        with lock:
+            running -= 1
+
+        return duration
+
+    async def main() -> None:
+        tasks = [asyncio.create_task(service.submit(job, 0.05)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+
+        # Waiting jobs count towards the queue depth, too
+        assert service.queue_depth == 5
+
+        assert await asyncio.gather(*tasks) == [0.05] * 5
+
+    try:
+        asyncio.run(main())
+    finally:
+        service.close()
+
+    assert peak_running == 2
+    assert service.queue_depth == 0
+    assert service.peak_queue_depth == 5
+
+
+def test_workers_are_not_forked() -> None:
+    service = hashing_service.HashingService(max_workers=1)
+
+    async def main() -> bytes:
+        return await service.submit(hashlib.pbkdf2_hmac, "sha256", b"pw", b"salt", 1)
+
+    try:
+        result = asyncio.run(main())
+        start_method = service._executor._mp_context.get_start_method()
+    finally:
+        service.close()
+
+    assert result == hashlib.pbkdf2_hmac("sha256", b"pw", b"salt", 1)
+    assert start_method in ("forkserver", "spawn")
@@ -0,0 +1,146 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app_modules import import_app_module
+
+instrumentation = import_app_module("utils.instrumentation")
+
+
+def unique_name() -> str:
+    # The decorator records into the app-wide instrumentation, so keep each
+    # test's operations apart
+    return f"test.{uuid.uuid4().hex}"
+
+
+def test_histogram_percentiles() -> None:
+    histogram = instrumentation.LatencyHistogram()
+
+    for millisecond in range(1, 101):
+        histogram.record(millisecond / 1000)
+
+    assert histogram.count == 100
+    assert histogram.max == 0.1
+    assert histogram.sum == pytest.approx(5.05)
+
+    # Percentiles err on the slow side, by at most one bucket width
+    for percentile, exact in [(50, 0.05), (90, 0.09), (99, 0.099), (100, 0.1)]:
+        assert exact <= histogram.percentile(percentile) <= exact * 1.07
+
+    assert instrumentation.LatencyHistogram().percentile(50) == 0
+
+
+def test_histogram_buckets() -> None:
+    # Every value falls into a bucket whose bounds contain it
+    for microseconds in [0, 1, 15, 16, 17, 100, 1000, 123456, 10**9]:
+        index = instrumentation._bucket_index(microseconds)
+        assert microseconds < instrumentation._bucket_upper_bound(index)
+
+        if index:
+            assert microseconds >= instrumentation._bucket_upper_bound(index - 1)
+
+    # Huge values end up in the last bucket
+    histogram = instrumentation.LatencyHistogram()
+    histogram.record(10**9)
+    assert histogram.counts[-1] == 1
+
+    histogram = instrumentation.LatencyHistogram()
+
+    for seconds in [0.0001, 0.002, 0.002, 0.3]:
+        histogram.record(seconds)
+
+    assert histogram.cumulative_counts([1.0, 0.001, 0.01]) == [
+        (0.001, 1),
+        (0.01, 3),
+        (1.0, 4),
+    ]
+
+
+def test_instrumented_function() -> None:
+    name = unique_name()
+
+    @instrumentation.instrumented(name, expected=(KeyError,))
+    def lookup(key: str) -> str:
+        return {"a": "found"}[key]
+
+    assert lookup("a") == "found"
+
+    with pytest.raises(KeyError):
+        lookup("b")
+
+    stats = instrumentation.instrumentation.get(name)
+    assert (stats.calls, stats.errors) == (2, 0)
+
+    @instrumentation.instrumented(name)
+    def fail() -> None:
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        fail()
+
+    assert (stats.calls, stats.errors) == (3, 1)
+
+
+def test_instrumented_coroutine() -> None:
+    name = unique_name()
+
+    @instrumentation.instrumented(name, expected=(KeyError,))
+    async def lookup(key: str) -> str:
+        await asyncio.sleep(0.01)
+        return {"a": "found"}[key]
+
+    async def main() -> None:
+        assert await lookup("a") == "found"
+
+        with pytest.raises(KeyError):
+            await lookup("b")
+
+        # A cancelled call didn't fail
+        task = asyncio.create_task(lookup("a"))
+        await asyncio.sleep(0)
+        task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+    stats = instrumentation.instrumentation.get(name)
+    assert (stats.calls, stats.errors) == (3, 0)
+    assert stats.histogram.max >= 0.01
+
+
+def test_instrumented_async_generator() -> None:
+    name = unique_name()
+
+    @instrumentation.instrumented(name, expected=(KeyError,))
+    async def items(count: int, error: type[Exception] | None = None):
+        for index in range(count):
+            await asyncio.sleep(0.01)
+            yield index
+
+        if error is not None:
+            raise error
+
+    async def main() -> None:
+        assert [item async for item in items(3)] == [0, 1, 2]
+
+        # Stopping early isn't a failure
+        iterator = items(3)
+        assert await anext(iterator) == 0
+        await iterator.aclose()
+
+        with pytest.raises(KeyError):
+            [item async for item in items(1, KeyError)]
+
+        with pytest.raises(ValueError):
+            [item async for item in items(1, ValueError)]
+
+    asyncio.run(main())
+
+    stats = instrumentation.instrumentation.get(name)
+    assert (stats.calls, stats.errors) == (4, 1)
+
+    # The whole iteration is measured, not just creating the generator
+    assert stats.histogram.max >= 0.03
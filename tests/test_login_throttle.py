@@ -0,0 +1,163 @@
+import pytest
+
+from app_modules import import_app_module
+
+login_throttle = import_app_module("login_throttle")
+
+POLICY = login_throttle.ThrottlePolicy(
+    burst=3,
+    refill_per_second=1,
+    free_failures=2,
+    base_delay=10,
+    max_delay=40,
+)
+
+# Generous enough never to get in the way
+UNLIMITED = login_throttle.ThrottlePolicy(
+    burst=1000,
+    refill_per_second=1000,
+    free_failures=1000,
+)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(login_throttle.time, "monotonic", clock)
+    return clock
+
+
+def fail(throttle, username: str, ip: str) -> float:
+    retry_after = throttle.check(username, ip)
+
+    if retry_after == 0:
+        throttle.record_failure(username, ip)
+
+    return retry_after
+
+
+def test_burst_then_refill(clock: Clock) -> None:
+    throttle = login_throttle.LoginThrottle(POLICY, UNLIMITED)
+
+    assert [throttle.check("alice", "1.1.1.1") for _ in range(3)] == [0, 0, 0]
+    assert throttle.check("alice", "1.1.1.1") == pytest.approx(1)
+    assert throttle.rejected == 1
+
+    # Tokens come back over time
+    clock.now += 1
+    assert throttle.check("alice", "1.1.1.1") == 0
+
+
+def test_failures_back_off_exponentially(clock: Clock) -> None:
+    throttle = login_throttle.LoginThrottle(
+        login_throttle.ThrottlePolicy(
+            burst=100, refill_per_second=100, free_failures=2, base_delay=10, max_delay=40
+        ),
+        UNLIMITED,
+    )
+
+    # The first failures are free
+    assert fail(throttle, "alice", "1.1.1.1") == 0
+    assert fail(throttle, "alice", "1.1.1.1") == 0
+
+    # Then each one blocks for twice as long as the previous one, up to the
+    # maximum
+    delays = []
+
+    for _ in range(4):
+        assert fail(throttle, "alice", "1.1.1.1") == 0
+        delays.append(throttle.check("alice", "1.1.1.1"))
+        clock.now += delays[-1]
+
+    assert delays == [pytest.approx(10), pytest.approx(20), pytest.approx(40), pytest.approx(40)]
+
+    # Failures are forgotten after a while without any
+    clock.now += 41
+    assert fail(throttle, "alice", "1.1.1.1") == 0
+    assert throttle.check("alice", "1.1.1.1") == 0
+
+
+def test_success_resets_account_failures(clock: Clock) -> None:
+    throttle = login_throttle.LoginThrottle(
+        login_throttle.ThrottlePolicy(burst=100, refill_per_second=100, free_failures=2),
+        login_throttle.ThrottlePolicy(burst=100, refill_per_second=100, free_failures=4),
+    )
+
+    for _ in range(2):
+        fail(throttle, "alice", "1.1.1.1")
+
+    throttle.record_success("alice", "1.1.1.1")
+
+    # The account's failures start over
+    for _ in range(2):
+        assert fail(throttle, "alice", "1.1.1.1") == 0
+
+    assert throttle.check("alice", "1.1.1.1") == 0
+
+    # The address's don't, so an attacker can't reset them by logging into an
+    # account of their own
+    fail(throttle, "alice", "1.1.1.1")
+    assert throttle.check("alice", "1.1.1.1") > 0
+
+
+def test_failures_elsewhere_dont_lock_out_account(clock: Clock) -> None:
+    throttle = login_throttle.LoginThrottle(POLICY, UNLIMITED)
+
+    # Someone else keeps failing to log in as alice
+    for _ in range(5):
+        fail(throttle, "alice", "6.6.6.6")
+
+    assert throttle.check("alice", "6.6.6.6") > 0
+
+    # Alice herself is unaffected
+    assert throttle.check("alice", "1.1.1.1") == 0
+
+
+def test_ip_limit_covers_all_usernames(clock: Clock) -> None:
+    throttle = login_throttle.LoginThrottle(UNLIMITED, POLICY)
+
+    assert [throttle.check(f"user{i}", "6.6.6.6") for i in range(3)] == [0, 0, 0]
+    assert throttle.check("user3", "6.6.6.6") > 0
+    assert throttle.check("user3", "1.1.1.1") == 0
+
+
+def test_least_recently_used_keys_are_evicted(clock: Clock) -> None:
+    # Each attempt uses an account key and an address key
+    throttle = login_throttle.LoginThrottle(POLICY, UNLIMITED, max_keys=4)
+
+    for _ in range(3):
+        throttle.check("alice", "1.1.1.1")
+
+    assert throttle.check("alice", "1.1.1.1") > 0
+
+    # Two other clients push alice's keys out
+    throttle.check("bob", "2.2.2.2")
+    throttle.check("carol", "3.3.3.3")
+
+    assert len(throttle._states) == 4
+    assert throttle.check("alice", "1.1.1.1") == 0
+
+
+def test_policy_from_settings(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "rio.toml").write_text("[login_throttle]\nip_burst = 7\n")
+    monkeypatch.setenv("RIO_ADMIN_LOGIN_THROTTLE_IP_REFILL_PER_SECOND", "0.5")
+
+    throttle = login_throttle.LoginThrottle.from_settings()
+
+    assert throttle.ip_policy == login_throttle.ThrottlePolicy(
+        burst=7,
+        refill_per_second=0.5,
+        free_failures=login_throttle.DEFAULT_IP_POLICY.free_failures,
+        base_delay=login_throttle.DEFAULT_IP_POLICY.base_delay,
+        max_delay=login_throttle.DEFAULT_IP_POLICY.max_delay,
+    )
+    assert throttle.account_policy == login_throttle.DEFAULT_ACCOUNT_POLICY
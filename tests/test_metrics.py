@@ -0,0 +1,70 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+from app_modules import import_app_module
+
+metrics = import_app_module("metrics")
+persistence = import_app_module("persistence")
+
+
+def test_failed_flush_keeps_counts(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = persistence.Persistence(tmp_path / "user.db")
+        add_event_counts = pers.backend.add_event_counts
+        store = metrics.MetricsStore(pers)
+
+        async def fail(counts: list) -> None:
+            raise sqlite3.OperationalError("database is locked")
+
+        try:
+            store.record("login", 3)
+            pers.backend.add_event_counts = fail
+
+            with pytest.raises(sqlite3.OperationalError):
+                await store.flush()
+
+            # Recorded while the database was unavailable
+            store.record("login", 2)
+
+            pers.backend.add_event_counts = add_event_counts
+            await store.flush()
+
+            since = datetime.now(timezone.utc) - timedelta(hours=1)
+            stored = await pers.get_event_counts(since)
+            assert sum(count for event, _, count in stored if event == "login") == 5
+        finally:
+            await pers.close()
+
+    asyncio.run(main())
+
+
+def test_flush_deletes_old_counts(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = persistence.Persistence(tmp_path / "user.db")
+        store = metrics.MetricsStore(pers)
+
+        try:
+            now = datetime.now(timezone.utc)
+            expired = now - timedelta(seconds=metrics.HISTORY_SECONDS + 60)
+            kept = now - timedelta(seconds=metrics.HISTORY_SECONDS - 60)
+
+            await pers.add_event_counts(
+                [
+                    ("login", expired.timestamp() // 60 * 60, 1),
+                    ("login", kept.timestamp() // 60 * 60, 1),
+                ]
+            )
+            await store.flush()
+
+            stored = await pers.get_event_counts(expired - timedelta(days=1))
+            assert [minute.timestamp() for _, minute, _ in stored] == [
+                kept.timestamp() // 60 * 60
+            ]
+        finally:
+            await pers.close()
+
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+import sqlite3
+import uuid
+from pathlib import Path
+
+import pytest
+
+from app_modules import import_app_module
+
+persistence = import_app_module("persistence")
+
+
+def create_legacy_database(path: Path, usernames: list[str]) -> None:
+    """
+    Create a database the way the app did before schema migrations existed,
+    when usernames didn't have to be unique.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        CREATE TABLE users (
+            id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            password_hash BLOB NOT NULL,
+            password_salt BLOB NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE user_sessions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            valid_until REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """
+    )
+    conn.executemany(
+        "INSERT INTO users VALUES (?, ?, ?, ?, ?)",
+        [
+            (str(uuid.uuid4()), username, 1700000000 + index, b"hash", b"salt")
+            for index, username in enumerate(usernames)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def schema_version(path: Path) -> int:
+    conn = sqlite3.connect(path)
+
+    try:
+        return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_legacy_database_is_migrated(tmp_path: Path) -> None:
+    path = tmp_path / "user.db"
+    create_legacy_database(path, ["alice", "bob"])
+
+    backend = persistence.SqliteBackend(path)
+    backend.pool.close()
+
+    assert schema_version(path) == len(persistence.MIGRATIONS)
+
+
+def test_duplicate_usernames_stop_migration(tmp_path: Path) -> None:
+    path = tmp_path / "user.db"
+    create_legacy_database(path, ["alice", "bob", "alice", "carol"])
+
+    with pytest.raises(persistence.MigrationError, match="'alice' \\(2 users\\)"):
+        persistence.SqliteBackend(path)
+
+    # The database is left at the last version which could be reached
+    assert schema_version(path) == 1
+
+    # Once the duplicates are resolved, the migration goes through
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        DELETE FROM users
+        WHERE username = 'alice'
+        AND created_at > (SELECT MIN(created_at) FROM users WHERE username = 'alice')
+        """
+    )
+    conn.commit()
+    conn.close()
+
+    backend = persistence.SqliteBackend(path)
+    backend.pool.close()
+
+    assert schema_version(path) == len(persistence.MIGRATIONS)
@@ -0,0 +1,50 @@
+from pathlib import Path
+
+import mmdb_fixture
+import pytest
+
+from app_modules import import_app_module
+
+geoip2_with_flag = import_app_module("utils.geoip2_with_flag")
+online_users = import_app_module("online_users")
+
+
+class FakeSession:
+    def __init__(self, client_ip: str) -> None:
+        self.client_ip = client_ip
+
+
+def test_sessions_are_located_by_their_client_address(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    path = tmp_path / "GeoLite2-City.mmdb"
+    network = mmdb_fixture.synthetic_networks(1)[0]
+    mmdb_fixture.write_database(
+        str(path),
+        [
+            (
+                network,
+                {
+                    "city": {"names": {"en": "Springfield"}},
+                    "country": {"iso_code": "US", "names": {"en": "United States"}},
+                },
+            )
+        ],
+    )
+
+    service = geoip2_with_flag.GeoIPService(str(path))
+    monkeypatch.setattr(online_users, "geoip_service", service)
+    users = online_users.OnlineUsers()
+
+    try:
+        users.add(FakeSession(str(network.network_address + 1)))
+        users.add(FakeSession(str(network.network_address + 2)))
+        users.add(FakeSession("127.0.0.1"))
+    finally:
+        service.close()
+
+    assert users.snapshot() == {
+        "🇺🇸:United States, Springfield": 2,
+        online_users.UNKNOWN_LOCATION: 1,
+    }
@@ -0,0 +1,70 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app_modules import import_app_module
+
+data_models = import_app_module("data_models")
+password_hashing = import_app_module("password_hashing")
+
+SALT = b"\x00" * 16
+
+
+def test_scrypt_with_large_parameters() -> None:
+    # The memory limit used to be computed as `2 * 128 * n * r * p`, which
+    # comes to more than OpenSSL accepts here. Only about 128 MiB are needed.
+    scheme = password_hashing.ScryptScheme(2**17, 8, 8)
+
+    assert len(scheme.hash("password", SALT)) == 64
+
+
+def test_scrypt_rejects_parameters_beyond_the_memory_limit() -> None:
+    with pytest.raises(ValueError):
+        password_hashing.parse_scheme("scrypt:n=2097152,r=8,p=1")
+
+    password_hashing.parse_scheme("scrypt:n=1048576,r=8,p=1")
+
+
+def test_scrypt_calibration_hashes(monkeypatch: pytest.MonkeyPatch) -> None:
+    scheme = password_hashing.ScryptScheme.calibrate(0.05)
+    parsed = password_hashing.parse_scheme(scheme.encode())
+
+    assert parsed == scheme
+    assert parsed.hash("password", SALT) == scheme.hash("password", SALT)
+
+    # On a machine fast enough to need an enormous `p`, it is capped at what
+    # fits into memory
+    monkeypatch.setattr(password_hashing, "_time_hash", lambda scheme: 1e-9)
+    scheme = password_hashing.ScryptScheme.calibrate(1)
+
+    assert scheme.memory <= password_hashing.MAX_SCRYPT_MEMORY
+    assert password_hashing.parse_scheme(scheme.encode()) == scheme
+
+
+def test_needs_rehash_compares_parsed_schemes(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        password_hashing,
+        "_current_scheme",
+        password_hashing.ScryptScheme(2**14, 8, 1),
+    )
+
+    def needs_rehash(scheme: str) -> bool:
+        user = data_models.AppUser(
+            id=uuid.uuid4(),
+            username="alice",
+            created_at=datetime.now(timezone.utc),
+            password_hash=b"hash",
+            password_salt=b"salt",
+            password_scheme=scheme,
+        )
+        return user.needs_rehash
+
+    # The same scheme, written differently
+    assert not needs_rehash("scrypt:n=16384,r=8,p=1")
+    assert not needs_rehash("scrypt:p=1,r=8,n=16384")
+    assert not needs_rehash("scrypt:n=16384, r=8, p=1")
+
+    assert needs_rehash("scrypt:n=16384,r=8,p=2")
+    assert needs_rehash("pbkdf2_sha256:iterations=600000")
+    assert needs_rehash("unknown")
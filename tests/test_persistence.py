@@ -0,0 +1,310 @@
+import asyncio
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+from app_modules import import_app_module
+
+data_models = import_app_module("data_models")
+persistence = import_app_module("persistence")
+
+
+def make_user(username: str) -> data_models.AppUser:
+    # The hash is never checked here, so skip the slow hashing
+    return data_models.AppUser(
+        id=uuid.uuid4(),
+        username=username,
+        created_at=datetime.now(timezone.utc),
+        password_hash=b"hash",
+        password_salt=b"salt",
+    )
+
+
+def test_create_user_reports_taken_username(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = persistence.Persistence(tmp_path / "user.db")
+
+        try:
+            # Both sign-ups checked the username before either was stored
+            results = await asyncio.gather(
+                pers.create_user(make_user("alice")),
+                pers.create_user(make_user("alice")),
+                return_exceptions=True,
+            )
+
+            assert results.count(None) == 1
+            assert any(
+                isinstance(result, persistence.UsernameTakenError) for result in results
+            )
+        finally:
+            await pers.close()
+
+    asyncio.run(main())
+
+
+def test_failed_flush_keeps_extensions(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = persistence.Persistence(
+            tmp_path / "user.db",
+            write_behind=True,
+            flush_interval=0.05,
+        )
+        write_durations = pers.backend.update_session_durations
+        failures = 0
+
+        async def fail_twice(updates: list) -> list[str]:
+            nonlocal failures
+
+            if failures < 2:
+                failures += 1
+                raise sqlite3.OperationalError("database is locked")
+
+            return await write_durations(updates)
+
+        pers.backend.update_session_durations = fail_twice
+
+        try:
+            user = make_user("alice")
+            await pers.create_user(user)
+            session = await pers.create_session(user.id)
+
+            valid_until = session.valid_until + timedelta(days=1)
+            await pers.update_session_duration(session, valid_until)
+
+            # The background task survives the failures and retries
+            for _ in range(100):
+                await asyncio.sleep(0.05)
+
+                stored = await pers.backend.get_session_by_auth_token(session.id)
+
+                if stored.valid_until == valid_until:
+                    break
+
+            assert failures == 2
+            assert stored.valid_until == valid_until
+        finally:
+            await pers.close()
+
+    asyncio.run(main())
+
+
+def test_failed_flush_doesnt_undo_logout(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = persistence.Persistence(tmp_path / "user.db", write_behind=True)
+
+        try:
+            user = make_user("alice")
+            await pers.create_user(user)
+            session = await pers.create_session(user.id)
+
+            await pers.update_session_duration(
+                session, session.valid_until + timedelta(days=1)
+            )
+
+            # The user logs out while the extension is being written, and then
+            # writing the extension fails
+            async def log_out_and_fail(updates: list) -> None:
+                await pers.update_session_duration(
+                    session, datetime.now(timezone.utc) - timedelta(seconds=1)
+                )
+                raise sqlite3.OperationalError("database is locked")
+
+            pers.backend.update_session_durations = log_out_and_fail
+
+            with pytest.raises(sqlite3.OperationalError):
+                await pers.flush_session_writes()
+
+            assert session.id not in pers._pending_extensions
+        finally:
+            await pers.close()
+
+    asyncio.run(main())
+
+
+def test_flush_after_logout_doesnt_revive_session(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = persistence.Persistence(tmp_path / "user.db", write_behind=True)
+        write_durations = pers.backend.update_session_durations
+        logged_out = asyncio.Event()
+
+        # Hold the extension back until the logout has been written
+        async def write_late(updates: list) -> list[str]:
+            await logged_out.wait()
+            return await write_durations(updates)
+
+        pers.backend.update_session_durations = write_late
+
+        try:
+            user = make_user("alice")
+            await pers.create_user(user)
+            session = await pers.create_session(user.id)
+
+            await pers.update_session_duration(
+                session, session.valid_until + timedelta(days=1)
+            )
+            flush = asyncio.create_task(pers.flush_session_writes())
+            await asyncio.sleep(0)
+
+            logged_out_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+            await pers.update_session_duration(session, logged_out_at)
+            logged_out.set()
+            await flush
+
+            stored = await pers.backend.get_session_by_auth_token(session.id)
+            assert stored.valid_until == logged_out_at
+        finally:
+            await pers.close()
+
+    asyncio.run(main())
+
+
+def test_logout_in_other_process_ends_cached_session(tmp_path: Path) -> None:
+    async def main() -> None:
+        # Two app processes sharing the same database
+        pers = persistence.Persistence(tmp_path / "user.db")
+        other = persistence.Persistence(tmp_path / "user.db", write_behind=True)
+
+        try:
+            user = make_user("alice")
+            await pers.create_user(user)
+            session = await pers.create_session(user.id)
+
+            # The other process extends the session, but hasn't written the
+            # extension yet when the user logs out
+            cached = await other.get_session_by_auth_token(session.id)
+            await other.update_session_duration(
+                cached, cached.valid_until + timedelta(days=1)
+            )
+
+            logged_out_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+            await pers.update_session_duration(session, logged_out_at)
+            await other.flush_session_writes()
+
+            # The extension must neither revive the session, nor keep it
+            # alive in the other process's cache
+            stored = await pers.backend.get_session_by_auth_token(session.id)
+            assert stored.valid_until == logged_out_at
+
+            stored = await other.get_session_by_auth_token(session.id)
+            assert stored.valid_until == logged_out_at
+        finally:
+            await other.close()
+            await pers.close()
+
+    asyncio.run(main())
+
+
+def test_open_passes_backend_options(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = await persistence.Persistence.open(
+            f"sqlite:///{tmp_path / 'user.db'}",
+            backend_options={"pool_size": 2},
+            cache_size=10,
+        )
+
+        try:
+            assert pers.backend.pool.pool_size == 2
+        finally:
+            await pers.close()
+
+    asyncio.run(main())
+
+
+def test_create_users_skips_taken_ids(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = persistence.Persistence(tmp_path / "user.db")
+
+        try:
+            alice = make_user("alice")
+            await pers.create_user(alice)
+
+            # Conflicts with existing users, and within the batch, are skipped
+            # without failing the others
+            bob = make_user("bob")
+            same_id = make_user("carol")
+            same_id.id = alice.id
+            same_id_in_batch = make_user("dave")
+            same_id_in_batch.id = bob.id
+
+            skipped = await pers.create_users(
+                [make_user("alice"), bob, same_id, same_id_in_batch, make_user("erin")]
+            )
+
+            assert skipped == {"alice": "username", "carol": "id", "dave": "id"}
+            assert [user.username async for user in pers.iter_all_users()] == [
+                "alice",
+                "bob",
+                "erin",
+            ]
+        finally:
+            await pers.close()
+
+    asyncio.run(main())
+
+
+def test_iter_users_pagination(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = persistence.Persistence(tmp_path / "user.db")
+
+        try:
+            start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+            users = [make_user(f"user{index:02d}") for index in range(25)]
+            users += [
+                make_user("user\U0010ffff"),
+                make_user("user\U0010ffffx"),
+                make_user("user\ud7ffx"),
+                make_user("userz"),
+                make_user("\U0010ffff"),
+            ]
+
+            for index, user in enumerate(users):
+                user.created_at = start + timedelta(minutes=index)
+
+            await pers.create_users(users)
+
+            pages = []
+            after = None
+
+            while True:
+                page = [
+                    user
+                    async for user in pers.iter_users(
+                        after=after,
+                        limit=7,
+                        username_prefix="user",
+                    )
+                ]
+
+                if not page:
+                    break
+
+                pages.append([user.username for user in page])
+                after = page[-1].id
+
+            assert [len(page) for page in pages] == [7, 7, 7, 7, 1]
+            assert sum(pages, []) == [user.username for user in users[:-1]]
+
+            # The prefix may end in the largest possible characters
+            async def usernames(prefix: str) -> list[str]:
+                return [
+                    user.username
+                    async for user in pers.iter_users(
+                        after=None,
+                        limit=100,
+                        username_prefix=prefix,
+                    )
+                ]
+
+            assert await usernames("user\U0010ffff") == [
+                "user\U0010ffff",
+                "user\U0010ffffx",
+            ]
+            assert await usernames("user\ud7ff") == ["user\ud7ffx"]
+            assert await usernames("\U0010ffff") == ["\U0010ffff"]
+        finally:
+            await pers.close()
+
+    asyncio.run(main())
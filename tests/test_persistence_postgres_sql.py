@@ -0,0 +1,100 @@
+"""
+Tests for `PostgresBackend` which don't need a PostgreSQL server. The queries
+go to a fake connection, which records them. See
+`test_persistence_postgres.py` for tests against a real server.
+"""
+
+import asyncio
+import contextlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app_modules import import_app_module
+
+pytest.importorskip("asyncpg")
+
+persistence_postgres = import_app_module("persistence_postgres")
+
+
+class FakeConnection:
+    """
+    Records the queries it is sent. `fetch` returns `results`, one list of
+    records per call.
+    """
+
+    def __init__(self, results: list[list[dict]]) -> None:
+        self.results = results
+        self.queries: list[tuple[str, tuple]] = []
+
+    async def fetch(self, query: str, *args) -> list[dict]:
+        self.queries.append((query, args))
+        return self.results.pop(0)
+
+    async def executemany(self, query: str, args: list) -> None:
+        self.queries.append((query, (args,)))
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class FakePool:
+    def __init__(self, conn: FakeConnection) -> None:
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+def make_backend(conn: FakeConnection) -> "persistence_postgres.PostgresBackend":
+    backend = persistence_postgres.PostgresBackend("postgresql://localhost/test")
+    backend._pool = FakePool(conn)
+    return backend
+
+
+def test_session_updates_only_touch_valid_sessions() -> None:
+    async def main() -> None:
+        # The database only updates session "a"
+        conn = FakeConnection([[{"id": "a"}]])
+        backend = make_backend(conn)
+
+        later = datetime.now(timezone.utc) + timedelta(days=1)
+        rejected = await backend.update_session_durations([("a", later), ("b", later)])
+
+        assert rejected == ["b"]
+
+        [(query, args)] = conn.queries
+        assert "WHERE s.id = u.id AND s.valid_until > $3" in " ".join(query.split())
+        assert args[0] == ["a", "b"]
+        assert args[1] == [later, later]
+
+        # The guard compares against the current time
+        assert abs(args[2] - datetime.now(timezone.utc)) < timedelta(seconds=5)
+
+    asyncio.run(main())
+
+
+def test_session_updates_after_logout_are_dropped() -> None:
+    async def main() -> None:
+        conn = FakeConnection([[{"id": "a"}]])
+        backend = make_backend(conn)
+
+        now = datetime.now(timezone.utc)
+        logged_out = now - timedelta(seconds=1)
+        extended = now + timedelta(days=1)
+
+        # Applied in order, the extension would hit an expired session, so it
+        # must not be written
+        rejected = await backend.write_sessions(
+            [],
+            [("a", extended), ("a", logged_out), ("a", extended)],
+        )
+
+        assert rejected == ["a"]
+
+        [(query, args)] = conn.queries
+        assert args[:2] == (["a"], [logged_out])
+
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app_modules import import_app_module
+
+data_models = import_app_module("data_models")
+persistence = import_app_module("persistence")
+session_reaper = import_app_module("session_reaper")
+
+
+async def pragma(pers: persistence.Persistence, name: str) -> int:
+    # Copy the write-ahead log into the file first, so sizes are accurate.
+    # Ask the writer, which is the connection doing the vacuuming. Readers may
+    # report the file's previous settings for a while.
+    await pers.checkpoint()
+
+    return await pers.backend.pool.write(
+        lambda conn: conn.execute(f"PRAGMA {name}").fetchone()[0]
+    )
+
+
+async def add_expired_sessions(pers: persistence.Persistence, count: int) -> None:
+    # The hash is never checked here, so skip the slow hashing
+    user = data_models.AppUser(
+        id=uuid.uuid4(),
+        username=f"user-{uuid.uuid4()}",
+        created_at=datetime.now(timezone.utc),
+        password_hash=b"hash",
+        password_salt=b"salt",
+    )
+    await pers.create_user(user)
+
+    for _ in range(count):
+        session = await pers.create_session(user.id)
+        await pers.update_session_duration(
+            session, datetime(2000, 1, 1, tzinfo=timezone.utc)
+        )
+
+
+def test_reaper_deletes_expired_sessions_on_start(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = persistence.Persistence(tmp_path / "user.db")
+        reaper = session_reaper.SessionReaper(pers, interval=60 * 60, batch_size=10)
+
+        try:
+            await add_expired_sessions(pers, 25)
+
+            # The first run doesn't wait for the interval
+            reaper.start()
+
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+
+                if reaper.total_removed:
+                    break
+
+            assert reaper.total_removed == 25
+        finally:
+            await reaper.stop()
+            await pers.close()
+
+    asyncio.run(main())
+
+
+def test_reaper_vacuums_only_if_enabled(tmp_path: Path) -> None:
+    async def main() -> None:
+        pers = persistence.Persistence(tmp_path / "user.db")
+
+        try:
+            # Opening the database doesn't rebuild it, and neither does a
+            # reaper which doesn't vacuum
+            await add_expired_sessions(pers, 100)
+            await session_reaper.SessionReaper(pers).run_once()
+            assert await pragma(pers, "auto_vacuum") == 0
+
+            # Enabling vacuuming rebuilds the database once
+            reaper = session_reaper.SessionReaper(pers, vacuum=True)
+            await reaper.run_once()
+            assert await pragma(pers, "auto_vacuum") == 2
+
+            # From then on, deleted sessions give their pages back. Fill a few
+            # hundred pages with sessions which have already expired.
+            await add_expired_sessions(pers, 2000)
+            pages_filled = await pragma(pers, "page_count")
+
+            assert await reaper.run_once() == 2000
+            assert await pragma(pers, "page_count") < pages_filled
+        finally:
+            await pers.close()
+
+    asyncio.run(main())
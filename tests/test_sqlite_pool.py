@@ -0,0 +1,81 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from app_modules import import_app_module
+
+sqlite_pool = import_app_module("utils.sqlite_pool")
+
+
+class ConnectionUsage:
+    """
+    Records whether any connection is ever used by two threads at once.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._users: dict[int, int] = {}
+        self.overlaps = 0
+
+    def use(self, conn: sqlite3.Connection, seconds: float) -> None:
+        with self._lock:
+            self._users[id(conn)] = self._users.get(id(conn), 0) + 1
+
+            if self._users[id(conn)] > 1:
+                self.overlaps += 1
+
+        time.sleep(seconds)
+
+        with self._lock:
+            self._users[id(conn)] -= 1
+
+
+def test_cancelled_read_keeps_connection_until_done(tmp_path: Path) -> None:
+    usage = ConnectionUsage()
+
+    async def main() -> None:
+        pool = sqlite_pool.SqlitePool(tmp_path / "test.db", pool_size=2)
+
+        try:
+            slow = asyncio.create_task(pool.read(lambda conn: usage.use(conn, 0.3)))
+            await asyncio.sleep(0.05)
+            slow.cancel()
+
+            await pool.read(lambda conn: usage.use(conn, 0))
+            await pool.read(lambda conn: usage.use(conn, 0.3))
+        finally:
+            pool.close()
+
+    asyncio.run(main())
+
+    assert usage.overlaps == 0
+
+
+def test_abandoned_iteration_returns_connection(tmp_path: Path) -> None:
+    async def main() -> None:
+        pool = sqlite_pool.SqlitePool(tmp_path / "test.db", pool_size=1)
+
+        try:
+            for _ in range(3):
+                batches = pool.iterate(
+                    "SELECT 1 UNION ALL SELECT 2",
+                    batch_size=1,
+                )
+
+                async for _ in batches:
+                    break
+
+                await batches.aclose()
+
+            # Only succeeds if the single connection has been returned
+            result = await asyncio.wait_for(
+                pool.read(lambda conn: conn.execute("SELECT 42").fetchone()),
+                timeout=5,
+            )
+            assert result == (42,)
+        finally:
+            pool.close()
+
+    asyncio.run(main())
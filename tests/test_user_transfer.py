@@ -0,0 +1,129 @@
+import asyncio
+import json
+import uuid
+from pathlib import Path
+
+from app_modules import import_app_module
+
+persistence = import_app_module("persistence")
+user_transfer = import_app_module("user_transfer")
+
+
+def make_record(username: str, **fields) -> dict:
+    # The hash is never checked here, so any hex will do
+    return {
+        "username": username,
+        "password_hash": "00ff",
+        "password_salt": "ff00",
+        **fields,
+    }
+
+
+def import_records(
+    tmp_path: Path,
+    records: list[dict | str],
+) -> tuple[user_transfer.ImportProgress, list[user_transfer.Rejection], list[str]]:
+    """
+    Import the records into the database in `tmp_path`. Returns the progress, the
+    rejections, and the usernames in the database afterwards. Strings are
+    written to the file as they are.
+    """
+    path = tmp_path / "users.jsonl"
+    path.write_text(
+        "".join(
+            (record if isinstance(record, str) else json.dumps(record)) + "\n"
+            for record in records
+        )
+    )
+
+    async def main():
+        pers = persistence.Persistence(tmp_path / "user.db")
+        rejections = []
+
+        try:
+            progress = await user_transfer.import_users(
+                pers,
+                path,
+                on_reject=rejections.append,
+            )
+            usernames = [user.username async for user in pers.iter_all_users()]
+        finally:
+            await pers.close()
+
+        return progress, rejections, usernames
+
+    return asyncio.run(main())
+
+
+def test_import_rejects_fields_of_the_wrong_type(tmp_path: Path) -> None:
+    progress, rejections, usernames = import_records(
+        tmp_path,
+        [
+            make_record("alice", id=123),
+            make_record("bob", password_scheme=5),
+            make_record("carol", created_at=1700000000),
+            make_record("dave", password_hash=["00"]),
+            make_record("erin"),
+        ],
+    )
+
+    assert usernames == ["erin"]
+    assert (progress.read, progress.imported, progress.rejected) == (5, 1, 4)
+    assert [(rejection.record_number, rejection.username) for rejection in rejections] == [
+        (1, "alice"),
+        (2, "bob"),
+        (3, "carol"),
+        (4, "dave"),
+    ]
+    assert rejections[0].reason == "The field 'id' is not a string"
+
+
+def test_import_rejects_taken_ids(tmp_path: Path) -> None:
+    id = str(uuid.uuid4())
+
+    progress, rejections, usernames = import_records(
+        tmp_path,
+        [
+            make_record("alice", id=id),
+            make_record("bob", id=id),
+            make_record("carol"),
+        ],
+    )
+
+    assert usernames == ["alice", "carol"]
+    assert (progress.imported, progress.rejected) == (2, 1)
+    assert [(rejection.username, rejection.reason) for rejection in rejections] == [
+        ("bob", "Duplicate ID in the file"),
+    ]
+
+    # An ID from an earlier import is found in the database
+    progress, rejections, usernames = import_records(
+        tmp_path,
+        [make_record("dave", id=id)],
+    )
+
+    assert usernames == ["alice", "carol"]
+    assert [(rejection.username, rejection.reason) for rejection in rejections] == [
+        ("dave", "The ID is already taken"),
+    ]
+
+
+def test_import_rejects_malformed_lines(tmp_path: Path) -> None:
+    progress, rejections, usernames = import_records(
+        tmp_path,
+        [
+            make_record("alice"),
+            '{"username": "bob", ',
+            "",
+            "not json",
+            make_record("carol"),
+        ],
+    )
+
+    assert usernames == ["alice", "carol"]
+    assert (progress.read, progress.imported, progress.rejected) == (4, 2, 2)
+    assert [(rejection.record_number, rejection.username) for rejection in rejections] == [
+        (2, ""),
+        (4, ""),
+    ]
+    assert rejections[0].reason.startswith("The line is not valid JSON")